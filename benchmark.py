@@ -0,0 +1,693 @@
+"""Benchmark offline dos spiders contra um servidor local que reproduz fixtures.
+
+Gera (ou carrega) as respostas da API FIPE, das páginas de estoque e da tabela
+FIPE da Webmotors e da página da Alura, sobe um servidor HTTP local e roda cada
+spider em um processo separado, redirecionando todas as requisições para ele.
+
+Uso:
+    python benchmark.py                          # todos os spiders, escala padrão
+    python benchmark.py --anuncios 10000 fipe webmotors
+    python benchmark.py --configuracoes 20000 webmotors_fipe
+    python benchmark.py --completo --marcas 40 --modelos 100 --anos 10 fipe  # memória na árvore inteira
+    python benchmark.py --fixtures gravacoes.jsonl --json resultado.json
+    python benchmark.py --baseline resultado.json --tolerancia 0.2
+    python benchmark.py --cards 10000            # extração de cards: original x atual
+    python benchmark.py --itens 100000           # bytes/item e itens/s: dicts x items.py
+    python benchmark.py --matcher 100000         # casamento de anúncios com o catálogo FIPE
+    python benchmark.py --perfil perfil webmotors  # CPU e alocações por callback (ver profiling.py)
+    python benchmark.py --cache-paginas paginas.sqlite webmotors_fipe  # 2ª execução: páginas inalteradas
+"""
+import os
+import sys
+import json
+import time
+import random
+import inspect
+import functools
+import argparse
+import resource
+import tempfile
+import threading
+import multiprocessing
+from urllib.parse import urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from runner import DIRETORIO, SPIDERS, carregar_modulo, classe_spider
+
+# Callbacks medidos de cada spider (os spiders vêm do registro do runner.py)
+CALLBACKS = {
+    'fipe': ['parse_marcas', 'parse_modelos', 'parse_anos', 'parse_detalhes'],
+    'webmotors_fipe': ['parse_fipe_page'],
+    'webmotors': ['parse', 'extract_car_info'],
+    'alura': ['parse'],
+}
+
+# Configurações específicas de cada spider no benchmark
+SETTINGS_SPIDER = {
+    # Sem limite de taxa no cliente da API: o servidor local não precisa ser poupado
+    'fipe': {'FIPE_API_TAXA': 100000, 'FIPE_API_RAJADA': 100000, 'FIPE_API_CONCORRENCIA': 16},
+    # Uma partição só: as páginas sintéticas não dependem dos filtros
+    'webmotors': {'WEBMOTORS_ESTADOS': [], 'WEBMOTORS_MARCAS': [], 'WEBMOTORS_FAIXAS_PRECO': []},
+}
+
+# Configurações aplicadas em todos os spiders durante o benchmark
+SETTINGS_BENCHMARK = {
+    'DOWNLOAD_DELAY': 0,
+    'RANDOMIZE_DOWNLOAD_DELAY': False,
+    'CONCURRENT_REQUESTS': 16,
+    'CONCURRENT_REQUESTS_PER_DOMAIN': 16,
+    'AUTOTHROTTLE_ENABLED': False,
+    'ADAPTIVE_THROTTLE_ENABLED': False,
+    'ROBOTSTXT_OBEY': False,
+    'TELNETCONSOLE_ENABLED': False,
+    'LOG_LEVEL': 'WARNING',
+    'FEEDS': {},
+    'FEED_URI': None,
+}
+
+MARCAS_CARROS = ['Chevrolet', 'Volkswagen', 'Fiat', 'Toyota', 'Hyundai', 'Honda', 'Ford', 'Renault',
+                 'Jeep', 'Nissan', 'Peugeot', 'Citroën', 'Land Rover', 'Mercedes-Benz', 'BMW', 'Audi']
+ESTADOS = ['SP', 'RJ', 'MG', 'PR', 'SC', 'RS', 'BA', 'GO', 'DF', 'PE']
+
+
+# ---------------------------------------------------------------------------
+# Fixtures
+# ---------------------------------------------------------------------------
+
+def fixtures_fipe(marcas, modelos, anos):
+    """Árvore sintética da API FIPE do parallelum"""
+    fixtures = {}
+    base = '/parallelum.com.br/fipe/api/v1/carros/marcas'
+    fixtures[base] = json.dumps([
+        {'codigo': str(m), 'nome': MARCAS_CARROS[m % len(MARCAS_CARROS)]} for m in range(1, marcas + 1)
+    ])
+    for m in range(1, marcas + 1):
+        marca = MARCAS_CARROS[m % len(MARCAS_CARROS)]
+        fixtures[f'{base}/{m}/modelos'] = json.dumps({
+            'modelos': [{'codigo': mo, 'nome': f'Modelo {mo} 1.0 Flex'} for mo in range(1, modelos + 1)],
+            'anos': [{'codigo': f'{2024 - a}-1', 'nome': f'{2024 - a} Gasolina'} for a in range(anos)],
+        })
+        for mo in range(1, modelos + 1):
+            fixtures[f'{base}/{m}/modelos/{mo}/anos'] = json.dumps([
+                {'codigo': f'{2024 - a}-1', 'nome': f'{2024 - a} Flex'} for a in range(anos)
+            ])
+            for a in range(anos):
+                fixtures[f'{base}/{m}/modelos/{mo}/anos/{2024 - a}-1'] = json.dumps({
+                    'TipoVeiculo': 1,
+                    'Valor': f'R$ {random.randint(20, 300)}.{random.randint(0, 999):03d},00',
+                    'Marca': marca,
+                    'Modelo': f'Modelo {mo} 1.0 Flex',
+                    'AnoModelo': 2024 - a,
+                    'Combustivel': 'Flex',
+                    'CodigoFipe': f'{m:03d}{mo:03d}-{a}',
+                    'MesReferencia': 'outubro de 2026',
+                    'SiglaCombustivel': 'F',
+                })
+    return fixtures
+
+
+def card_webmotors(i):
+    marca = MARCAS_CARROS[i % len(MARCAS_CARROS)].upper()
+    if i % 5 == 4:
+        # Layout alternativo, exercita os seletores de fallback
+        return f"""
+<div class="CardAd">
+  <a href="https://www.webmotors.com.br/comprar/{marca.lower()}/{i}"><img data-src="/fotos/{i}.jpg"></a>
+  <h2 class="card-title">{marca} MODELO{i % 50}</h2>
+  <p class="vehicle-description">  {i % 3}.0 TURBO AUTOMATICO  </p>
+  <span class="price-tag">R$ {random.randint(20, 300)}.{random.randint(0, 999):03d}</span>
+  <span class="year-label">{2010 + i % 15}</span>
+  <span class="km-label">{random.randint(0, 200000)} km</span>
+  <p class="location-label">Curitiba - PR</p>
+</div>"""
+    return f"""
+<div class="_Card_18bss_1">
+  <a href="/comprar/{marca.lower()}/modelo-{i}/{i}">
+    <img src="//image.webmotors.com.br/{i}.webp" title="{marca} MODELO{i % 50}" alt="1.0 FLEX VERSAO {i % 7} MANUAL">
+    <img src="/static/placeholder.gif">
+  </a>
+  <h2 class="_web-title-medium_qtpsh_51">{marca} MODELO{i % 50}</h2>
+  <h3 class="_Description_70j0p_97">1.0 FLEX VERSAO {i % 7} MANUAL</h3>
+  <p class="_body-bold-large_qtpsh_78">R$ {random.randint(20, 300)}.{random.randint(0, 999):03d}</p>
+  <div class="_Cells_70j0p_58">
+    <div class="_CellItem_70j0p_62"><p>{2010 + i % 15}/{2011 + i % 15}</p></div>
+    <div class="_CellItem_70j0p_62"><p>{random.randint(0, 200000)} km</p></div>
+  </div>
+  <div class="_BodyItem_70j0p_47"><p>São Paulo - {ESTADOS[i % len(ESTADOS)]}</p></div>
+</div>"""
+
+
+def fixtures_webmotors(anuncios, por_pagina=None):
+    """Home e páginas de estoque com ``anuncios`` cards, ``por_pagina`` em cada página"""
+    por_pagina = por_pagina or max(anuncios, 1)
+    fixtures = {
+        '/www.webmotors.com.br/': '<html><head><title>Webmotors</title></head><body>' + 'x' * 6000 + '</body></html>',
+    }
+    for pagina, inicio in enumerate(range(0, anuncios, por_pagina), start=1):
+        cards = ''.join(card_webmotors(i) for i in range(inicio, min(inicio + por_pagina, anuncios)))
+        chave = '/www.webmotors.com.br/carros/estoque' + (f'?page={pagina}' if pagina > 1 else '')
+        # O rodapé deixa a página com um tamanho realista mesmo com poucos cards
+        fixtures[chave] = f'<html><head><title>Estoque</title></head><body>{cards}<footer>{"x" * 8000}</footer></body></html>'
+    return fixtures
+
+
+def pagina_tabela_fipe(config):
+    versao = config['type'].replace('-', ' ').upper()
+    return f"""<html><head><title>Tabela FIPE {config['brand']} {config['model']}</title></head><body>
+<ul><li class="BreadCrumb__item"><span>{config['brand'].upper()}</span></li>
+<li class="BreadCrumb__item"><span>{config['model'].upper()}</span></li></ul>
+<h1>{config['brand'].upper()} {config['model'].upper()}</h1>
+<p class="Result__info">{versao} - {config['year']} - {config['state'].upper()}</p>
+<p class="Result__value">R$ {random.randint(20, 300)}.{random.randint(0, 999):03d},00</p>
+<p class="Result__value">R$ {random.randint(20, 300)}.{random.randint(0, 999):03d},00</p>
+{'<div>conteúdo</div>' * 200}
+</body></html>"""
+
+
+def fixtures_tabela_fipe(configuracoes):
+    """Páginas da tabela FIPE da Webmotors para cada configuração buscada"""
+    fixtures = {}
+    for config in configuracoes:
+        path = f"{config['brand']}/{config['model']}/{config['year']}/{config['type']}/{config['state'].lower()}"
+        fixtures[f'/www.webmotors.com.br/tabela-fipe/carros/{path}'] = pagina_tabela_fipe(config)
+    return fixtures
+
+
+def fixtures_alura(cursos):
+    itens = ''.join(
+        f'<li class="subcategoria__item"><a class="card-curso" href="/curso-online-{i}">'
+        f'<span class="card-curso__nome">Curso {i}</span></a></li>'
+        for i in range(cursos)
+    )
+    return {'/www.alura.com.br/cursos-online-programacao': f'<html><body><ul>{itens}</ul></body></html>'}
+
+
+def carregar_gravacoes(path):
+    """Carrega respostas gravadas: um JSON por linha com 'url' e 'body'"""
+    fixtures = {}
+    with open(path, encoding='utf-8') as f:
+        for linha in f:
+            if linha.strip():
+                gravacao = json.loads(linha)
+                url = urlsplit(gravacao['url'])
+                fixtures[chave_fixture(url.netloc, url.path, url.query)] = gravacao['body']
+    return fixtures
+
+
+def configuracoes_sinteticas(quantidade):
+    """Combinações marca/modelo/ano/versão/estado para o WebMotorsCrawler em escala"""
+    for i in range(quantidade):
+        yield {
+            'brand': MARCAS_CARROS[i % len(MARCAS_CARROS)].lower().replace(' ', '-'),
+            'model': f'modelo-{i // len(MARCAS_CARROS) % 500}',
+            'year': 2024 - i % 15,
+            'type': f'{10 + i % 10}-flex-versao-{i}-automatico',
+            'state': ESTADOS[i % len(ESTADOS)].lower(),
+        }
+
+
+def gravar_configuracoes(path, configuracoes):
+    import gzip
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for config in configuracoes:
+            f.write(json.dumps(config) + '\n')
+
+
+def gerar_fixtures(args, configuracoes):
+    random.seed(args.semente)
+
+    fixtures = {}
+    fixtures.update(fixtures_fipe(args.marcas, args.modelos, args.anos))
+    fixtures.update(fixtures_webmotors(args.anuncios, args.por_pagina))
+    fixtures.update(fixtures_tabela_fipe(carregar_modulo('config_source.py').configuracoes(configuracoes)))
+    fixtures.update(fixtures_alura(args.cursos))
+    if args.fixtures:
+        fixtures.update(carregar_gravacoes(args.fixtures))
+    return {chave: corpo.encode('utf-8') for chave, corpo in fixtures.items()}
+
+
+# ---------------------------------------------------------------------------
+# Servidor de replay
+# ---------------------------------------------------------------------------
+
+def chave_fixture(host, path, query=''):
+    chave = f'/{host}{path or "/"}'
+    return f'{chave}?{query}' if query else chave
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Cabeçalho e corpo saem em writes separados; sem isso o Nagle adiciona ~40ms por resposta
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        fixtures = self.server.fixtures
+        corpo = fixtures.get(self.path) or fixtures.get(self.path.split('?', 1)[0])
+        status = 200
+        if corpo is None:
+            status = 404
+            corpo = 'Página não encontrada'.encode('utf-8')
+
+        tipo = 'application/json' if corpo[:1] in (b'[', b'{') else 'text/html; charset=utf-8'
+        self.send_response(status)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def iniciar_servidor(fixtures):
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), ReplayHandler)
+    servidor.daemon_threads = True
+    servidor.fixtures = fixtures
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+class ReplayMiddleware:
+    """Redireciona todas as requisições para o servidor de replay local"""
+
+    def __init__(self, porta):
+        self.porta = porta
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings.getint('REPLAY_PORT'))
+
+    def process_request(self, request, spider):
+        if request.meta.get('replay') or not request.url.startswith(('http://', 'https://')):
+            return None
+        url = urlsplit(request.url)
+        destino = f'http://127.0.0.1:{self.porta}' + chave_fixture(url.netloc, url.path, url.query)
+        meta = dict(request.meta, replay=True)
+        return request.replace(url=destino, meta=meta, dont_filter=True)
+
+
+# ---------------------------------------------------------------------------
+# Extração de cards: implementação original com seletores CSS x esquema compilado
+# ---------------------------------------------------------------------------
+
+def extract_car_info_css(spider, car):
+    """Implementação original de WebmotorsSpider.extract_car_info (sem logs), usada como referência"""
+    import re
+    images = car.css('img')
+    marca_modelo = None
+    tipo_veiculo = None
+    for img in images:
+        title_attr = img.css('::attr(title)').get()
+        alt_attr = img.css('::attr(alt)').get()
+        if title_attr and len(title_attr.strip()) > 3:
+            marca_modelo = title_attr.strip()
+        if alt_attr and len(alt_attr.strip()) > 3:
+            tipo_veiculo = alt_attr.strip()
+        if marca_modelo and tipo_veiculo:
+            break
+    marca, modelo = None, None
+    if marca_modelo:
+        marca, modelo = spider.extract_marca_modelo(marca_modelo)
+    title = (
+        marca_modelo or
+        car.css("h2._web-title-medium_qtpsh_51::text, h2[class*='title']::text").get() or
+        ""
+    ).strip()
+    descricao = (
+        tipo_veiculo or
+        car.css("h3._Description_70j0p_97::text, h3._body-regular-small_qtpsh_152::text, h3[class*='Description']::text").get() or
+        car.css("p[class*='description']::text").get() or
+        car.css("div[class*='description']::text").get() or
+        ""
+    ).strip()
+    preco_raw = car.css("p._body-bold-large_qtpsh_78::text, p[class*='price']::text, span[class*='price']::text").get() or ""
+    preco = re.sub(r'[^\d]', '', preco_raw)
+    ano_text = car.css("div._CellItem_70j0p_62 p::text, p[class*='year']::text, span[class*='year']::text").get() or ""
+    ano_match = re.search(r'(\d{4})', ano_text)
+    ano = ano_match.group(1) if ano_match else None
+    km_text = car.css("div._CellItem_70j0p_62:nth-child(2) p::text, p[class*='km']::text, span[class*='km']::text").get() or ""
+    km = re.sub(r'[^\d]', '', km_text) if km_text else None
+    localizacao = (car.css("div._BodyItem_70j0p_47 p::text, p[class*='location']::text").get() or "").strip()
+    link = car.css("a::attr(href)").get() or ""
+    if link and not link.startswith("http"):
+        link = f"https://www.webmotors.com.br{link}"
+    if not marca and not modelo and title:
+        marca, modelo = spider.extract_marca_modelo(title)
+    imagens = []
+    for img in images:
+        img_url = img.css('::attr(src)').get() or img.css('::attr(data-src)').get()
+        if img_url and not img_url.endswith('.gif') and not 'placeholder' in img_url.lower():
+            if img_url.startswith('//'):
+                img_url = f"https:{img_url}"
+            elif not img_url.startswith(('http://', 'https://')):
+                img_url = f"https://www.webmotors.com.br{img_url}"
+            imagens.append({'url': img_url, 'title': img.css('::attr(title)').get(), 'alt': img.css('::attr(alt)').get(),
+                            'arquivo': None, 'miniatura': None})
+    return {
+        "marca": marca, "modelo": modelo, "descricao": descricao, "preco": preco, "ano": ano, "km": km,
+        "localizacao": localizacao, "link": link, "imagens": imagens,
+        "image_title": marca_modelo, "image_alt": tipo_veiculo,
+    }
+
+
+def benchmark_cards(quantidade):
+    """Compara cards/s da extração original com a do spider atual e confere se os resultados batem"""
+    from parsel import Selector
+
+    random.seed(0)
+    html = fixtures_webmotors(quantidade)['/www.webmotors.com.br/carros/estoque']
+    cards = Selector(text=html).css("div._Card_18bss_1, div[class*='Card_'], div.CardAd")
+    spider = getattr(carregar_modulo('get-cars.py'), 'WebmotorsSpider')()
+
+    inicio = time.perf_counter()
+    referencia = [extract_car_info_css(spider, card) for card in cards]
+    tempo_css = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    atual = [spider.extract_car_info(campos) for campos in spider.esquema_card.extrair_lote([card.root for card in cards])]
+    tempo_atual = time.perf_counter() - inicio
+
+    from itemadapter import ItemAdapter
+    # A referência é um dict; o spider retorna AnuncioWebmotors (delta só é preenchido no parse
+    # e os campos FIPE só pelo FipeMatchPipeline)
+    posteriores = {'delta': None, 'codigo_fipe': None, 'valor_fipe': None, 'diferenca_fipe': None}
+    divergentes = sum(1 for a, b in zip(referencia, atual) if {**a, **posteriores} != ItemAdapter(b).asdict())
+    print(f"{len(cards)} cards")
+    print(f"  seletores CSS (original):   {len(cards) / tempo_css:>10.0f} cards/s")
+    print(f"  esquema + extract_car_info: {len(cards) / tempo_atual:>10.0f} cards/s ({tempo_css / tempo_atual:.1f}x)")
+    print(f"  resultados divergentes:     {divergentes}")
+    return divergentes
+
+
+def bytes_por_objeto(construir, quantidade):
+    """Memória alocada por objeto (medida com tracemalloc) ao construir ``quantidade`` objetos"""
+    import tracemalloc
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    objetos = [construir(i) for i in range(quantidade)]
+    depois = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objetos
+    return (depois - antes) / quantidade
+
+
+def itens_por_segundo(funcao, entradas):
+    inicio = time.perf_counter()
+    for entrada in entradas:
+        funcao(entrada)
+    return len(entradas) / (time.perf_counter() - inicio)
+
+
+def benchmark_itens(quantidade):
+    """Compara bytes/item e itens/s de dicts + json da stdlib com os itens de items.py + json_codec"""
+    json_codec = carregar_modulo('json_codec.py')
+    items = carregar_modulo('items.py')
+    VeiculoFipe, AnuncioWebmotors, Imagem = items.VeiculoFipe, items.AnuncioWebmotors, items.Imagem
+
+    random.seed(0)
+    respostas = [body.encode('utf-8') for chave, body in fixtures_fipe(quantidade // 60 + 1, 20, 3).items()
+                 if chave.endswith('-1')][:quantidade]
+    detalhes = [json.loads(body) for body in respostas]
+
+    def veiculo_dict(i):
+        d = detalhes[i % len(detalhes)]
+        return {'modelo': d['Modelo'], 'marca': d['Marca'], 'ano': d['AnoModelo'], 'combustivel': d['Combustivel'],
+                'codigo_fipe': d['CodigoFipe'], 'mes_referencia': d['MesReferencia'], 'valor': d['Valor'],
+                'tipo_veiculo': d['TipoVeiculo']}
+
+    def anuncio_dict(i):
+        return {'marca': 'FIAT', 'modelo': 'ARGO', 'descricao': '1.3 DRIVE', 'preco': str(50000 + i), 'ano': '2022',
+                'km': str(i), 'localizacao': 'São Paulo - SP', 'link': f'https://www.webmotors.com.br/{i}',
+                'imagens': [{'url': f'https://img/{i}.jpg', 'title': 'FIAT ARGO', 'alt': '1.3 DRIVE'}],
+                'image_title': 'FIAT ARGO', 'image_alt': '1.3 DRIVE'}
+
+    def anuncio_item(i):
+        return AnuncioWebmotors('FIAT', 'ARGO', '1.3 DRIVE', str(50000 + i), '2022', str(i), 'São Paulo - SP',
+                                f'https://www.webmotors.com.br/{i}', [Imagem(f'https://img/{i}.jpg', 'FIAT ARGO', '1.3 DRIVE')],
+                                'FIAT ARGO', '1.3 DRIVE')
+
+    veiculos_dict = [veiculo_dict(i) for i in range(len(respostas))]
+    veiculos = [VeiculoFipe.da_api(d) for d in detalhes]
+    anuncios_dict = [anuncio_dict(i) for i in range(len(respostas))]
+    anuncios = [anuncio_item(i) for i in range(len(respostas))]
+    stdlib_dumps = lambda item: json.dumps(item, ensure_ascii=False).encode('utf-8')
+
+    print(f"{len(respostas)} itens (codec: {json_codec.codec_atual()})")
+    print(f"  {'':<28}{'dict + json':>14}{'item + codec':>14}")
+    linhas = [
+        ('bytes/item VeiculoFipe', bytes_por_objeto(veiculo_dict, len(respostas)),
+         bytes_por_objeto(lambda i: VeiculoFipe.da_api(detalhes[i]), len(respostas))),
+        ('bytes/item AnuncioWebmotors', bytes_por_objeto(anuncio_dict, len(respostas)),
+         bytes_por_objeto(anuncio_item, len(respostas))),
+        ('decodificação API (itens/s)', itens_por_segundo(json.loads, respostas),
+         itens_por_segundo(json_codec.loads, respostas)),
+        ('exportação FIPE (itens/s)', itens_por_segundo(stdlib_dumps, veiculos_dict),
+         itens_por_segundo(json_codec.dumps, veiculos)),
+        ('exportação anúncio (itens/s)', itens_por_segundo(stdlib_dumps, anuncios_dict),
+         itens_por_segundo(json_codec.dumps, anuncios)),
+    ]
+    for nome, antes, depois in linhas:
+        print(f"  {nome:<28}{antes:>14.0f}{depois:>14.0f}")
+
+
+def benchmark_matcher(quantidade, modelos=50, versoes=7, anos=16):
+    """Casamento de anúncios com um catálogo FIPE sintético do tamanho do real (marcas x modelos x versões x anos)"""
+    fipe_matcher = carregar_modulo('fipe_matcher.py')
+
+    random.seed(0)
+    catalogo = [
+        {'marca': marca, 'modelo': f'MODELO{mo} 1.0 FLEX VERSAO {v} MANUAL', 'ano': 2010 + a,
+         'codigo_fipe': f'{m:03d}{mo:03d}-{v}', 'valor': f'R$ {random.randint(20, 300)}.{random.randint(0, 999):03d},00'}
+        for m, marca in enumerate(MARCAS_CARROS) for mo in range(modelos) for v in range(versoes) for a in range(anos)
+    ]
+    # Os mesmos campos que o extract_car_info produz para os cards de card_webmotors
+    anuncios = [
+        (MARCAS_CARROS[i % len(MARCAS_CARROS)].upper(), f'MODELO{i % 50}', f'1.0 FLEX VERSAO {i % 7} MANUAL',
+         str(2010 + i % 15), f'{i % len(MARCAS_CARROS):03d}{i % 50:03d}-{i % 7}')
+        for i in range(quantidade)
+    ]
+
+    inicio = time.perf_counter()
+    indice = fipe_matcher.CatalogoFipe(catalogo)
+    tempo_indice = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    casamentos = [indice.casar(marca, modelo, descricao, ano) for marca, modelo, descricao, ano, _ in anuncios]
+    tempo = time.perf_counter() - inicio
+    # Sem o cache: cada anúncio passa pelo índice
+    indice.casar_tokens.cache_clear()
+    inicio = time.perf_counter()
+    for marca, modelo, descricao, ano, _ in anuncios:
+        indice.casar_tokens.cache_clear()
+        indice.casar(marca, modelo, descricao, ano)
+    tempo_sem_cache = time.perf_counter() - inicio
+
+    corretos = sum(1 for c, a in zip(casamentos, anuncios) if c is not None and c[0].codigo_fipe == a[4])
+    print(f"{len(indice)} versões no catálogo, indexadas em {tempo_indice:.2f}s")
+    print(f"  {len(anuncios)} anúncios: {len(anuncios) / tempo:>10.0f} anúncios/s "
+          f"({len(anuncios) / tempo_sem_cache:.0f}/s sem cache)")
+    print(f"  casados corretamente: {corretos}/{len(anuncios)}")
+    return len(anuncios) - corretos
+
+
+# ---------------------------------------------------------------------------
+# Execução e medição
+# ---------------------------------------------------------------------------
+
+def medir(func, nome, tempos):
+    """Envolve um callback somando o tempo de CPU gasto nele (inclusive ao consumir o gerador)"""
+    @functools.wraps(func)
+    def medido(*args, **kwargs):
+        inicio = time.process_time()
+        resultado = func(*args, **kwargs)
+        tempos[nome] += time.process_time() - inicio
+        if not inspect.isgenerator(resultado):
+            return resultado
+
+        def gerador():
+            while True:
+                inicio = time.process_time()
+                try:
+                    valor = next(resultado)
+                except StopIteration:
+                    return
+                finally:
+                    tempos[nome] += time.process_time() - inicio
+                yield valor
+        return gerador()
+    return medido
+
+
+def executar_spider(nome, porta, saida, argumentos, settings=None):
+    """Roda um spider no processo atual e grava as métricas em ``saida``"""
+    spider_cls = classe_spider(nome)
+    callbacks = CALLBACKS[nome]
+
+    from scrapy.crawler import CrawlerProcess
+
+    tempos = {callback: 0.0 for callback in callbacks}
+    custom_settings = dict(spider_cls.custom_settings or {})
+    custom_settings.update(SETTINGS_BENCHMARK)
+    custom_settings.update(SETTINGS_SPIDER.get(nome, {}))
+    custom_settings.update(settings or {})
+    if custom_settings.get('PROFILE_DIR'):
+        # Também para os spiders que não declaram o middleware (AluraBot)
+        custom_settings['SPIDER_MIDDLEWARES'] = dict(custom_settings.get('SPIDER_MIDDLEWARES', {}),
+                                                     **{'profiling.ProfilingSpiderMiddleware': 995})
+    middlewares = dict(custom_settings.get('DOWNLOADER_MIDDLEWARES', {}))
+    middlewares['benchmark.ReplayMiddleware'] = 1
+    # O cache da FIPE esconderia o custo das requisições
+    middlewares['fipe_cache.FipeCacheMiddleware'] = None
+    custom_settings['DOWNLOADER_MIDDLEWARES'] = middlewares
+    custom_settings['REPLAY_PORT'] = porta
+
+    atributos = {'custom_settings': custom_settings}
+    for callback in callbacks:
+        atributos[callback] = medir(getattr(spider_cls, callback), callback, tempos)
+    spider_medido = type(spider_cls.__name__, (spider_cls,), atributos)
+
+    processo = CrawlerProcess(install_root_handler=False)
+    crawler = processo.create_crawler(spider_medido)
+    processo.crawl(crawler, **argumentos)
+    processo.start()
+
+    stats = crawler.stats.get_stats()
+    duracao = (stats['finish_time'] - stats['start_time']).total_seconds()
+    requisicoes = stats.get('downloader/request_count', 0)
+    itens = stats.get('item_scraped_count', 0)
+    resultado = {
+        'spider': nome,
+        'duracao': duracao,
+        'requisicoes': requisicoes,
+        'itens': itens,
+        'requisicoes_por_segundo': requisicoes / duracao if duracao else 0.0,
+        'itens_por_segundo': itens / duracao if duracao else 0.0,
+        'cpu_por_callback': tempos,
+        # ru_maxrss é em KB no Linux
+        'pico_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f)
+
+
+def processo_filho(nome, porta, saida, diretorio, argumentos, settings=None):
+    # Os spiders gravam arquivos no diretório atual; isola em um diretório temporário
+    os.chdir(diretorio)
+    sys.stdout = open(os.devnull, 'w')
+    executar_spider(nome, porta, saida, argumentos, settings)
+
+
+def rodar_benchmark(nomes, fixtures, argumentos=None, settings=None):
+    """Roda cada spider contra as fixtures; ``argumentos`` tem os argumentos (-a) de cada spider
+    e ``settings`` configurações extras aplicadas a todos"""
+    argumentos = argumentos or {}
+    servidor = iniciar_servidor(fixtures)
+    porta = servidor.server_address[1]
+    contexto = multiprocessing.get_context('spawn')
+    resultados = []
+    try:
+        for nome in nomes:
+            with tempfile.TemporaryDirectory() as diretorio:
+                saida = os.path.join(diretorio, 'resultado.json')
+                processo = contexto.Process(target=processo_filho, args=(nome, porta, saida, diretorio, argumentos.get(nome, {}), settings))
+                processo.start()
+                processo.join()
+                if processo.exitcode != 0 or not os.path.exists(saida):
+                    print(f"Falha ao executar o spider {nome} (código {processo.exitcode})")
+                    continue
+                with open(saida, encoding='utf-8') as f:
+                    resultados.append(json.load(f))
+    finally:
+        servidor.shutdown()
+    return resultados
+
+
+def imprimir_relatorio(resultados):
+    print(f"{'spider':<16}{'req/s':>10}{'itens/s':>10}{'itens':>8}{'duração':>10}{'RSS MB':>9}")
+    for r in resultados:
+        print(f"{r['spider']:<16}{r['requisicoes_por_segundo']:>10.1f}{r['itens_por_segundo']:>10.1f}"
+              f"{r['itens']:>8}{r['duracao']:>9.2f}s{r['pico_rss_mb']:>9.1f}")
+        for callback, cpu in r['cpu_por_callback'].items():
+            print(f"    {callback:<28}{cpu * 1000:>10.1f} ms CPU")
+
+
+def comparar(resultados, baseline, tolerancia):
+    """Retorna as regressões de itens/s e RSS em relação a um resultado anterior"""
+    anteriores = {r['spider']: r for r in baseline}
+    regressoes = []
+    for r in resultados:
+        anterior = anteriores.get(r['spider'])
+        if not anterior:
+            continue
+        if r['itens_por_segundo'] < anterior['itens_por_segundo'] * (1 - tolerancia):
+            regressoes.append(f"{r['spider']}: itens/s {anterior['itens_por_segundo']:.1f} -> {r['itens_por_segundo']:.1f}")
+        if r['pico_rss_mb'] > anterior['pico_rss_mb'] * (1 + tolerancia):
+            regressoes.append(f"{r['spider']}: RSS {anterior['pico_rss_mb']:.1f} -> {r['pico_rss_mb']:.1f} MB")
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('spiders', nargs='*', help=f"spiders a medir: {', '.join(SPIDERS)} (padrão: todos)")
+    parser.add_argument('--anuncios', type=int, default=1000, help="cards no estoque da Webmotors")
+    parser.add_argument('--por-pagina', type=int, default=24, help="cards por página de estoque")
+    parser.add_argument('--marcas', type=int, default=10, help="marcas na árvore FIPE sintética")
+    parser.add_argument('--modelos', type=int, default=20, help="modelos por marca")
+    parser.add_argument('--anos', type=int, default=3, help="anos por modelo")
+    parser.add_argument('--configuracoes', type=int, help="configurações sintéticas para o webmotors_fipe "
+                        "(padrão: carros_para_buscar.jsonl)")
+    parser.add_argument('--cursos', type=int, default=500, help="cursos na página da Alura")
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--fixtures', help="arquivo JSONL com respostas gravadas (url, body)")
+    parser.add_argument('--json', help="salva o resultado neste arquivo")
+    parser.add_argument('--baseline', help="resultado anterior para detectar regressões")
+    parser.add_argument('--tolerancia', type=float, default=0.2)
+    parser.add_argument('--cards', type=int, help="só compara a extração de N cards (original x atual)")
+    parser.add_argument('--itens', type=int, help="só compara memória e serialização de N itens")
+    parser.add_argument('--matcher', type=int, help="só mede o casamento de N anúncios com o catálogo FIPE")
+    parser.add_argument('--perfil', help="liga o modo de profiling e grava os relatórios neste diretório")
+    parser.add_argument('--completo', action='store_true', help="roda o fipe no modo completo (toda a árvore)")
+    parser.add_argument('--cache-paginas', help="cache de páginas (page_cache.py) mantido entre execuções do benchmark")
+    args = parser.parse_args()
+    if args.cards:
+        sys.exit(1 if benchmark_cards(args.cards) else 0)
+    if args.itens:
+        benchmark_itens(args.itens)
+        return
+    if args.matcher:
+        sys.exit(1 if benchmark_matcher(args.matcher) else 0)
+    for nome in args.spiders:
+        if nome not in SPIDERS:
+            parser.error(f"spider desconhecido: {nome}")
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        argumentos = {}
+        configuracoes = os.path.join(DIRETORIO, 'carros_para_buscar.jsonl')
+        if args.configuracoes:
+            configuracoes = os.path.join(diretorio, 'configuracoes.jsonl.gz')
+            gravar_configuracoes(configuracoes, configuracoes_sinteticas(args.configuracoes))
+            argumentos['webmotors_fipe'] = {'configuracoes': configuracoes}
+        if args.completo:
+            argumentos['fipe'] = {'completo': '1'}
+        fixtures = gerar_fixtures(args, configuracoes)
+        settings = {'PROFILE_DIR': os.path.abspath(args.perfil)} if args.perfil else {}
+        if args.cache_paginas:
+            settings['PAGE_CACHE_PATH'] = os.path.abspath(args.cache_paginas)
+        resultados = rodar_benchmark(args.spiders or list(SPIDERS), fixtures, argumentos, settings)
+    imprimir_relatorio(resultados)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressoes = comparar(resultados, json.load(f), args.tolerancia)
+        for regressao in regressoes:
+            print(f"REGRESSÃO: {regressao}")
+        if regressoes:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
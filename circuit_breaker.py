@@ -0,0 +1,244 @@
+"""Circuit breaker por host e orçamento global de novas tentativas.
+
+CircuitBreakerMiddleware acompanha os sinais de bloqueio de cada host (slot do
+downloader): os status de CIRCUIT_BREAKER_BLOCK_CODES e, se o spider definir
+``eh_bloqueio(response)``, as páginas que ele reconhece como bloqueio. Depois
+de CIRCUIT_BREAKER_LIMITE bloqueios seguidos o circuito abre: as requisições
+para o host ficam retidas (sem ocupar banda nem proxy) por um intervalo que
+dobra a cada nova abertura. Passado o intervalo, uma única requisição segue
+como sonda; se ela não for bloqueada o circuito fecha e as retidas seguem. A
+sonda é marcada em ``meta['circuito_sonda']``, que passa para as cópias do
+redirecionamento e das novas tentativas: é a resposta final que decide.
+
+RetryBudgetMiddleware substitui o RetryMiddleware do Scrapy: cada requisição
+nova deposita RETRY_BUDGET_RATIO no orçamento e cada nova tentativa gasta 1,
+então as novas tentativas nunca passam dessa fração do tráfego (além de uma
+reserva de RETRY_BUDGET_MIN para começo de execução).
+"""
+import logging
+from itertools import count
+
+from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.downloadermiddlewares.retry import RetryMiddleware
+from twisted.internet import defer, reactor
+
+from throttle import chave_slot
+
+logger = logging.getLogger(__name__)
+
+# Estados do circuito de um host
+FECHADO = 'fechado'
+ABERTO = 'aberto'
+MEIO_ABERTO = 'meio_aberto'
+
+
+class Circuito:
+    """Estado do circuit breaker de um host"""
+
+    def __init__(self, backoff):
+        self.estado = FECHADO
+        self.bloqueios_seguidos = 0
+        self.backoff = backoff
+        # Número da sonda em voo (o mesmo de meta['circuito_sonda'] da requisição e das cópias)
+        self.sonda = None
+        self.timer = None
+        # (request, deferred) das requisições retidas enquanto o circuito não fecha
+        self.retidas = []
+
+
+class CircuitBreakerMiddleware:
+    """Downloader middleware que pausa um host depois de uma sequência de bloqueios"""
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.limite = settings.getint('CIRCUIT_BREAKER_LIMITE', 3)
+        self.backoff_inicial = settings.getfloat('CIRCUIT_BREAKER_BACKOFF', 30)
+        self.backoff_max = settings.getfloat('CIRCUIT_BREAKER_BACKOFF_MAX', 600)
+        self.codigos_bloqueio = set(int(c) for c in settings.getlist('CIRCUIT_BREAKER_BLOCK_CODES', [403, 429]))
+        self.circuitos = {}
+        self.numeros_sonda = count(1)
+        crawler.signals.connect(self.request_dropped, signal=signals.request_dropped)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('CIRCUIT_BREAKER_ENABLED', True):
+            raise NotConfigured
+        return cls(crawler)
+
+    def circuito(self, request, spider):
+        chave = chave_slot(self.crawler.engine.downloader, request, spider)
+        circuito = self.circuitos.get(chave)
+        if circuito is None:
+            circuito = self.circuitos[chave] = Circuito(self.backoff_inicial)
+        return chave, circuito
+
+    def sonda_de(self, request):
+        """(chave, circuito) de que a requisição é a sonda em voo (ela ou uma cópia), ou None"""
+        marca = request.meta.get('circuito_sonda')
+        if marca is None:
+            return None
+        chave, numero = marca
+        circuito = self.circuitos.get(chave)
+        if circuito is None or circuito.sonda != numero:
+            return None
+        return chave, circuito
+
+    def process_request(self, request, spider):
+        if self.sonda_de(request) is not None:
+            # Redirecionamento ou nova tentativa da sonda: segue, a resposta dela decide o circuito
+            return None
+        chave, circuito = self.circuito(request, spider)
+        if circuito.estado == FECHADO:
+            return None
+        if circuito.estado == MEIO_ABERTO and circuito.sonda is None:
+            return self.enviar_sonda(chave, circuito, request)
+
+        # Aberto, ou meio aberto com a sonda em voo: a requisição espera o circuito fechar
+        self.stats.inc_value('circuit_breaker/retidas')
+        d = defer.Deferred()
+        circuito.retidas.append((request, d))
+        return d
+
+    def process_response(self, request, response, spider):
+        if 'download_latency' not in request.meta:
+            # Resposta que não passou pelo downloader (cache, por exemplo)
+            return response
+        bloqueado = response.status in self.codigos_bloqueio
+        if not bloqueado and hasattr(spider, 'eh_bloqueio'):
+            bloqueado = spider.eh_bloqueio(response)
+        sonda = self.sonda_de(request)
+        chave, circuito = sonda or self.circuito(request, spider)
+        if bloqueado:
+            self.bloqueio(chave, circuito, sonda is not None)
+        else:
+            self.sucesso(chave, circuito, sonda is not None)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        sonda = self.sonda_de(request)
+        if sonda is not None:
+            # Sonda sem resposta: o host continua indisponível
+            self.bloqueio(*sonda, True)
+
+    def request_dropped(self, request, spider):
+        # Sonda (ou cópia) descartada pelo scheduler: nada foi aprendido, a próxima retida sonda
+        sonda = self.sonda_de(request)
+        if sonda is not None:
+            self.stats.inc_value('circuit_breaker/sondas_descartadas')
+            sonda[1].sonda = None
+            self.meio_abrir(*sonda)
+
+    def bloqueio(self, chave, circuito, sonda):
+        self.stats.inc_value('circuit_breaker/bloqueios')
+        if sonda:
+            circuito.sonda = None
+            circuito.backoff = min(self.backoff_max, circuito.backoff * 2)
+            self.abrir(chave, circuito)
+            return
+        circuito.bloqueios_seguidos += 1
+        if circuito.estado == FECHADO and circuito.bloqueios_seguidos >= self.limite:
+            self.abrir(chave, circuito)
+
+    def sucesso(self, chave, circuito, sonda):
+        circuito.bloqueios_seguidos = 0
+        if sonda:
+            logger.info(f"Circuito de {chave} fechado: sonda bem-sucedida, liberando {len(circuito.retidas)} requisições")
+            circuito.sonda = None
+            circuito.estado = FECHADO
+            circuito.backoff = self.backoff_inicial
+            retidas, circuito.retidas = circuito.retidas, []
+            for _, d in retidas:
+                d.callback(None)
+
+    def abrir(self, chave, circuito):
+        circuito.estado = ABERTO
+        self.stats.inc_value('circuit_breaker/aberturas')
+        logger.warning(f"Circuito de {chave} aberto por {circuito.backoff:.0f}s "
+                       f"({circuito.bloqueios_seguidos} bloqueios seguidos)")
+        circuito.timer = reactor.callLater(circuito.backoff, self.meio_abrir, chave, circuito)
+
+    def meio_abrir(self, chave, circuito):
+        circuito.timer = None
+        circuito.estado = MEIO_ABERTO
+        if circuito.retidas:
+            request, d = circuito.retidas.pop(0)
+            d.callback(self.enviar_sonda(chave, circuito, request))
+
+    def enviar_sonda(self, chave, circuito, request):
+        circuito.sonda = next(self.numeros_sonda)
+        request.meta['circuito_sonda'] = (chave, circuito.sonda)
+        self.stats.inc_value('circuit_breaker/sondas')
+        logger.info(f"Circuito de {chave} meio aberto: sondando com {request.url}")
+        return None
+
+    def spider_closed(self, spider):
+        for circuito in self.circuitos.values():
+            if circuito.timer is not None and circuito.timer.active():
+                circuito.timer.cancel()
+            retidas, circuito.retidas = circuito.retidas, []
+            for _, d in retidas:
+                d.errback(IgnoreRequest("Circuito aberto no fechamento do spider"))
+
+
+class OrcamentoRetentativas:
+    """Orçamento de novas tentativas compartilhado por um crawler (estilo token bucket).
+
+    O saldo acumula no máximo o equivalente às últimas ``janela`` requisições,
+    para que um período longo sem erros não vire uma rajada de novas tentativas.
+    """
+
+    def __init__(self, fracao=0.1, minimo=10, janela=1000):
+        self.fracao = fracao
+        self.minimo = minimo
+        self.teto = minimo + fracao * janela
+        self.saldo = float(minimo)
+
+    @classmethod
+    def do_crawler(cls, crawler):
+        if getattr(crawler, 'orcamento_retentativas', None) is None:
+            crawler.orcamento_retentativas = cls(
+                crawler.settings.getfloat('RETRY_BUDGET_RATIO', 0.1),
+                crawler.settings.getint('RETRY_BUDGET_MIN', 10),
+            )
+        return crawler.orcamento_retentativas
+
+    def depositar(self):
+        self.saldo = min(self.saldo + self.fracao, self.teto)
+
+    def gastar(self):
+        if self.saldo < 1:
+            return False
+        self.saldo -= 1
+        return True
+
+
+class RetryBudgetMiddleware(RetryMiddleware):
+    """RetryMiddleware que só refaz a requisição se houver saldo no orçamento global"""
+
+    def __init__(self, crawler):
+        super().__init__(crawler.settings)
+        self.stats = crawler.stats
+        self.orcamento = OrcamentoRetentativas.do_crawler(crawler)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_request(self, request, spider):
+        # Novas tentativas feitas pelo spider (meta['retentativa']) também não depositam
+        if not request.meta.get('retry_times') and not request.meta.get('retentativa'):
+            self.orcamento.depositar()
+
+    def _retry(self, request, reason, spider):
+        # Consulta o orçamento antes do RetryMiddleware, que já conta e registra a nova tentativa;
+        # quem esgotou as tentativas segue para ele sem gastar saldo
+        tentativas = request.meta.get('retry_times', 0) + 1
+        if tentativas <= request.meta.get('max_retry_times', self.max_retry_times) and not self.orcamento.gastar():
+            self.stats.inc_value('retry/orcamento_esgotado')
+            logger.debug(f"Orçamento de novas tentativas esgotado, desistindo de {request.url} ({reason})")
+            return None
+        return super()._retry(request, reason, spider)
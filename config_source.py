@@ -0,0 +1,97 @@
+"""Leitura preguiçosa das configurações de carro consultadas pelo WebMotorsCrawler.
+
+As configurações vêm de um arquivo JSONL ou CSV (colunas brand, model, year,
+type e state), opcionalmente comprimido (.gz, .bz2, .xz ou .zst), e são lidas
+uma linha por vez: o arquivo pode ter milhões de linhas sem ocupar memória.
+Também aceita qualquer iterável de dicts. Nos dois casos, um registro inválido
+(JSON mal formado, campo faltando, ano que não é número) é descartado com um
+aviso no log, sem interromper a leitura dos seguintes.
+"""
+import io
+import os
+import bz2
+import csv
+import gzip
+import lzma
+import logging
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+CAMPOS = ('brand', 'model', 'year', 'type', 'state')
+
+ABRIR_COMPRIMIDO = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+}
+
+
+def _abrir(path):
+    """Abre o arquivo em modo texto, descomprimindo pela extensão"""
+    base, extensao = os.path.splitext(path)
+    if extensao in ABRIR_COMPRIMIDO:
+        return ABRIR_COMPRIMIDO[extensao](path, 'rt', encoding='utf-8', newline=''), base
+    if extensao == '.zst':
+        if zstandard is None:
+            raise ValueError("Arquivos .zst requerem o pacote 'zstandard'")
+        leitor = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return io.TextIOWrapper(leitor, encoding='utf-8', newline=''), base
+    return open(path, encoding='utf-8', newline=''), path
+
+
+def _linhas_jsonl(arquivo):
+    for linha in arquivo:
+        linha = linha.strip()
+        if linha:
+            try:
+                yield json_codec.loads(linha)
+            except ValueError:
+                # A linha crua segue adiante e é descartada (e logada) como inválida
+                yield linha
+
+
+def normalizar(config):
+    """Valida uma configuração; retorna None se não for um dict ou faltar algum campo"""
+    if not isinstance(config, dict) or any(not config.get(campo) for campo in CAMPOS):
+        return None
+    normalizada = {campo: config[campo] for campo in CAMPOS}
+    normalizada['year'] = int(normalizada['year'])
+    return normalizada
+
+
+def validas(registros, origem):
+    """Gera as configurações normalizadas, descartando (e logando) as inválidas"""
+    for numero, config in enumerate(registros, 1):
+        try:
+            normalizada = normalizar(config)
+        except (TypeError, ValueError):
+            normalizada = None
+        if normalizada is None:
+            logger.warning(f"Configuração inválida (registro {numero} de {origem}): {config!r}")
+            continue
+        yield normalizada
+
+
+def ler_configuracoes(path):
+    """Gera as configurações do arquivo uma a uma, descartando (e logando) as inválidas"""
+    arquivo, nome = _abrir(path)
+    with arquivo:
+        if nome.endswith('.csv'):
+            linhas = csv.DictReader(arquivo)
+        else:
+            linhas = _linhas_jsonl(arquivo)
+        yield from validas(linhas, path)
+
+
+def configuracoes(origem):
+    """Aceita o caminho de um arquivo ou qualquer iterável/gerador de dicts"""
+    if isinstance(origem, (str, os.PathLike)):
+        return ler_configuracoes(os.fspath(origem))
+    return validas(origem, type(origem).__name__)
@@ -0,0 +1,125 @@
+import os
+import gzip
+import json
+import time
+import queue
+import random
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotStore:
+    """Guarda cópias das páginas para debug sem escrever em disco no thread do reactor.
+
+    Uma fração ``taxa`` das respostas é amostrada; respostas em que a extração
+    falhou são sempre capturadas (``forcar=True``). Os arquivos são gravados
+    comprimidos e nomeados pelo hash do conteúdo (páginas repetidas ocupam um
+    arquivo só) por um thread em segundo plano. Quando o diretório passa da
+    ``cota`` em bytes, os snapshots mais antigos são removidos.
+    """
+
+    def __init__(self, diretorio='debug_snapshots', taxa=0.01, cota=100 * 1024 * 1024, fila_max=100):
+        self.diretorio = diretorio
+        self.taxa = taxa
+        self.cota = cota
+        self.capturados = 0
+        self.descartados = 0
+        os.makedirs(diretorio, exist_ok=True)
+
+        # Arquivos existentes (de execuções anteriores) entram na conta da cota
+        self._arquivos = {}
+        for nome in os.listdir(diretorio):
+            if nome.endswith('.html.gz'):
+                caminho = os.path.join(diretorio, nome)
+                self._arquivos[nome] = (os.path.getmtime(caminho), os.path.getsize(caminho))
+        self._total = sum(tamanho for _, tamanho in self._arquivos.values())
+
+        self._fila = queue.Queue(maxsize=fila_max)
+        self._thread = threading.Thread(target=self._gravar, name='debug-snapshots', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            diretorio=settings.get('DEBUG_SNAPSHOT_DIR', 'debug_snapshots'),
+            taxa=settings.getfloat('DEBUG_SNAPSHOT_SAMPLE_RATE', 0.01),
+            cota=settings.getint('DEBUG_SNAPSHOT_QUOTA', 100 * 1024 * 1024),
+        )
+
+    def capturar(self, response, motivo=None, forcar=False):
+        """Agenda a gravação da resposta; retorna o nome do arquivo ou None se não foi amostrada"""
+        if not forcar and random.random() >= self.taxa:
+            return None
+
+        nome = hashlib.sha1(response.body).hexdigest() + '.html.gz'
+        registro = {
+            'arquivo': nome,
+            'url': response.url,
+            'status': response.status,
+            'motivo': motivo,
+            'data': time.time(),
+        }
+        try:
+            # Não bloqueia o reactor: se o disco estiver atrasado, descarta o snapshot
+            self._fila.put_nowait((nome, response.body, registro))
+        except queue.Full:
+            self.descartados += 1
+            return None
+        self.capturados += 1
+        return nome
+
+    def close(self):
+        """Espera os snapshots pendentes serem gravados"""
+        self._fila.put(None)
+        self._thread.join()
+        logger.info(f"Snapshots de debug: {self.capturados} capturados, {self.descartados} descartados")
+
+    def _gravar(self):
+        indice = open(os.path.join(self.diretorio, 'indice.jsonl'), 'a', encoding='utf-8')
+        try:
+            while True:
+                tarefa = self._fila.get()
+                if tarefa is None:
+                    break
+                nome, body, registro = tarefa
+                try:
+                    self._gravar_snapshot(nome, body)
+                    indice.write(json.dumps(registro, ensure_ascii=False) + '\n')
+                    indice.flush()
+                except OSError as e:
+                    logger.error(f"Erro ao gravar snapshot {nome}: {e}")
+        finally:
+            indice.close()
+
+    def _gravar_snapshot(self, nome, body):
+        caminho = os.path.join(self.diretorio, nome)
+        if nome in self._arquivos:
+            # Mesmo conteúdo já salvo: só atualiza a data para não ser removido primeiro
+            os.utime(caminho)
+            self._arquivos[nome] = (time.time(), self._arquivos[nome][1])
+            return
+
+        temporario = caminho + '.tmp'
+        with gzip.open(temporario, 'wb') as f:
+            f.write(body)
+        os.replace(temporario, caminho)
+        tamanho = os.path.getsize(caminho)
+        self._arquivos[nome] = (time.time(), tamanho)
+        self._total += tamanho
+
+        if self._total > self.cota:
+            self._remover_antigos()
+
+    def _remover_antigos(self):
+        for nome, (_, tamanho) in sorted(self._arquivos.items(), key=lambda item: item[1][0]):
+            if self._total <= self.cota:
+                break
+            try:
+                os.remove(os.path.join(self.diretorio, nome))
+            except FileNotFoundError:
+                pass
+            del self._arquivos[nome]
+            self._total -= tamanho
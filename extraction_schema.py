@@ -0,0 +1,222 @@
+"""Esquemas declarativos de extração, compartilhados pelos spiders de HTML.
+
+Os seletores de cada spider ficam em esquemas_extracao.json (versionado), não
+no código: quando o site troca as classes, basta editar o arquivo. Cada
+esquema tem os seletores dos itens (cards) e os campos; cada campo é só dado:
+
+    "preco": {
+        "seletores": ["css:p._body-bold-large_qtpsh_78::text, p[class*='price']::text"],
+        "regex": "...",            # opcional: grupo 1 (ou o match inteiro)
+        "normalizar": ["digitos"], # opcional: strip, upper, lower, digitos, int, url_absoluta
+        "multiplo": false,         # lista com todos os valores em vez do primeiro
+        "atributos": ["src"],      # para elementos: dict com esses atributos
+        "padrao": ""               # valor quando nada for encontrado
+    }
+
+Os seletores são tentados em ordem, até um deles retornar um valor não vazio
+(o ``or`` encadeado dos spiders). Dentro de um seletor, a vírgula une
+alternativas e vale a primeira em ordem de documento, como no ``.get()`` do
+parsel. Seletores começam com ``css:`` (com ``::text`` e ``::attr()``) ou
+``xpath:``.
+
+Os esquemas são compilados uma vez por processo (``esquema(nome)``): o CSS é
+traduzido para XPath e cada expressão vira um ``etree.XPath``, então aplicar o
+esquema a um card é só avaliar expressões prontas na árvore lxml. Os seletores
+alternativos de um campo só são avaliados quando os anteriores não acham nada.
+"""
+import os
+import re
+import hashlib
+import logging
+from functools import lru_cache
+from urllib.parse import urljoin, urlsplit
+
+from lxml import etree
+from parsel.csstranslator import HTMLTranslator
+
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+# Arquivo de esquemas padrão, ao lado dos spiders; EXTRACTION_SCHEMAS_PATH troca
+ESQUEMAS_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'esquemas_extracao.json')
+VERSAO_SUPORTADA = 1
+
+NAO_DIGITOS = re.compile(r'[^\d]')
+
+_tradutor = HTMLTranslator()
+
+
+@lru_cache(maxsize=None)
+def _origem(base):
+    """'https://host/caminho' -> 'https://host'"""
+    partes = urlsplit(base)
+    return f'{partes.scheme}://{partes.netloc}'
+
+
+def _url_absoluta(valor, base):
+    if not valor or valor.startswith(('http://', 'https://')) or not base:
+        return valor
+    if valor[0] == '/' and not valor.startswith('//') and '/.' not in valor:
+        # Caminho absoluto sem segmentos '.': o urljoin só trocaria o caminho da base
+        return _origem(base) + valor
+    return urljoin(base, valor)
+
+
+# Normalizadores aplicados em ordem ao valor de cada campo (str -> valor)
+NORMALIZADORES = {
+    'strip': lambda valor, base: valor.strip(),
+    'upper': lambda valor, base: valor.upper(),
+    'lower': lambda valor, base: valor.lower(),
+    'digitos': lambda valor, base: NAO_DIGITOS.sub('', valor),
+    'int': lambda valor, base: int(valor) if valor.strip().lstrip('-').isdigit() else None,
+    'url_absoluta': _url_absoluta,
+}
+
+
+def compilar_seletor(seletor):
+    """``css:...`` ou ``xpath:...`` -> etree.XPath"""
+    tipo, _, expressao = seletor.partition(':')
+    if tipo == 'css':
+        expressao = _tradutor.css_to_xpath(expressao.strip())
+    elif tipo != 'xpath':
+        raise ValueError(f"Seletor sem prefixo css: ou xpath: {seletor!r}")
+    # smart_strings=False: os textos voltam como str simples, sem referência à árvore
+    return etree.XPath(expressao, smart_strings=False)
+
+
+class Campo:
+    """Um campo do esquema, com os seletores já compilados"""
+
+    __slots__ = ('nome', 'seletores', 'regex', 'normalizadores', 'multiplo', 'atributos', 'padrao')
+
+    def __init__(self, nome, seletores, regex=None, normalizar=(), multiplo=False, atributos=None, padrao=None):
+        if not seletores:
+            raise ValueError(f"Campo {nome!r} sem seletores")
+        desconhecidos = [n for n in normalizar if n not in NORMALIZADORES]
+        if desconhecidos:
+            raise ValueError(f"Campo {nome!r}: normalizadores desconhecidos {desconhecidos}")
+        self.nome = nome
+        self.seletores = tuple(compilar_seletor(s) for s in seletores)
+        self.regex = re.compile(regex) if regex else None
+        self.normalizadores = tuple(NORMALIZADORES[n] for n in normalizar)
+        self.multiplo = multiplo
+        self.atributos = tuple(atributos) if atributos else None
+        self.padrao = padrao
+
+    def valor(self, resultado, base):
+        """Converte um resultado do XPath (texto, atributo ou elemento) no valor final"""
+        if not isinstance(resultado, str):
+            if self.atributos is not None:
+                return {atributo: resultado.get(atributo) for atributo in self.atributos}
+            resultado = resultado.xpath('string()')
+        if self.regex is not None:
+            encontrado = self.regex.search(resultado)
+            if encontrado is None:
+                return None
+            resultado = encontrado.group(1) if self.regex.groups else encontrado.group()
+        for normalizador in self.normalizadores:
+            if resultado is None:
+                break
+            resultado = normalizador(resultado, base)
+        return resultado
+
+    def extrair(self, raiz, base=None):
+        for seletor in self.seletores:
+            resultados = seletor(raiz)
+            if not resultados:
+                continue
+            if self.multiplo:
+                valores = [self.valor(r, base) for r in resultados]
+                valores = [v for v in valores if v not in (None, '')]
+                if valores:
+                    return valores
+            elif resultados[0] != '':
+                if self.regex is None and not self.normalizadores and resultados[0].__class__ is str:
+                    # Texto sem regex nem normalização: o próprio resultado
+                    return resultados[0]
+                valor = self.valor(resultados[0], base)
+                return self.padrao if valor is None else valor
+        return [] if self.multiplo and self.padrao is None else self.padrao
+
+
+class Esquema:
+    """Conjunto de campos aplicado a uma página ou a cada item (card) dela"""
+
+    def __init__(self, nome, campos, itens=(), base=None):
+        self.nome = nome
+        self.base = base
+        self.itens = tuple(compilar_seletor(s) for s in itens)
+        self.campos = tuple(Campo(nome_campo, **definicao) for nome_campo, definicao in campos.items())
+
+    def selecionar(self, raiz):
+        """Elementos dos itens pelo primeiro seletor que encontrar algum, e o índice desse seletor"""
+        for indice, seletor in enumerate(self.itens):
+            elementos = seletor(raiz)
+            if elementos:
+                return elementos, indice
+        return [], None
+
+    def extrair(self, raiz, base=None):
+        """Campos de um elemento lxml (página inteira ou um item)"""
+        base = base or self.base
+        return {campo.nome: campo.extrair(raiz, base) for campo in self.campos}
+
+    def extrair_lote(self, raizes, base=None):
+        """Campos de vários elementos de uma vez (os cards de uma página)"""
+        base = base or self.base
+        campos = self.campos
+        return [{campo.nome: campo.extrair(raiz, base) for campo in campos} for raiz in raizes]
+
+
+def _raiz(alvo):
+    """Aceita Response, Selector do parsel ou elemento lxml"""
+    if hasattr(alvo, 'selector'):
+        alvo = alvo.selector
+    return getattr(alvo, 'root', alvo)
+
+
+class Esquemas:
+    """Esquemas de um arquivo versionado, compilados na carga"""
+
+    def __init__(self, definicao, origem=None, assinatura=''):
+        versao = definicao.get('versao')
+        if versao != VERSAO_SUPORTADA:
+            raise ValueError(f"Versão de esquemas {versao!r} não suportada em {origem} (esperada {VERSAO_SUPORTADA})")
+        self.versao = versao
+        self.origem = origem
+        # Hash do arquivo: muda a cada edição dos seletores (ver page_cache.py)
+        self.assinatura = assinatura
+        self.esquemas = {
+            nome: Esquema(nome, **esquema) for nome, esquema in definicao['esquemas'].items()
+        }
+
+    @classmethod
+    def carregar(cls, path):
+        with open(path, 'rb') as f:
+            conteudo = f.read()
+        return cls(json_codec.loads(conteudo), origem=path,
+                   assinatura=hashlib.blake2b(conteudo, digest_size=8).hexdigest())
+
+    def __getitem__(self, nome):
+        return self.esquemas[nome]
+
+
+@lru_cache(maxsize=None)
+def esquemas(path=None):
+    """Esquemas do arquivo, carregados e compilados uma única vez por processo"""
+    carregados = Esquemas.carregar(path or ESQUEMAS_PADRAO)
+    logger.info(f"Esquemas de extração v{carregados.versao} carregados de {carregados.origem}: "
+                f"{', '.join(carregados.esquemas)}")
+    return carregados
+
+
+def esquema(nome, settings=None):
+    """Esquema compilado pelo nome; EXTRACTION_SCHEMAS_PATH nas settings troca o arquivo"""
+    path = settings.get('EXTRACTION_SCHEMAS_PATH') if settings is not None else None
+    return esquemas(path)[nome]
+
+
+def extrair(nome, alvo, settings=None):
+    """Atalho: aplica o esquema ``nome`` à página (Response/Selector) inteira"""
+    return esquema(nome, settings).extrair(_raiz(alvo))
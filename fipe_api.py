@@ -0,0 +1,174 @@
+"""Cliente enxuto para as chamadas JSON da API FIPE do parallelum.
+
+As respostas da API são pequenas: o que custa é a latência de cada chamada e
+o DOWNLOAD_DELAY fixo do slot do Scrapy. O FipeApiMiddleware faz as
+requisições marcadas com ``meta['fipe_api']`` por um pool próprio de conexões
+keep-alive, com concorrência limitada, taxa controlada por token bucket e
+novas tentativas com backoff exponencial e jitter. A resposta volta como um
+TextResponse comum, então os callbacks ``parse_*`` não mudam e os outros
+middlewares (cache, compressão, stats) continuam valendo.
+
+O cliente fala HTTP/1.1: o Agent do Twisted não tem HTTP/2 e o handler HTTP/2
+do Scrapy é experimental. Com conexões persistentes e várias requisições em
+paralelo, o ganho do multiplexing seria pequeno para esta API.
+"""
+import time
+import random
+import logging
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Headers, TextResponse
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet import defer, task
+from twisted.web.client import Agent, HTTPConnectionPool, readBody
+from twisted.web.http_headers import Headers as TwistedHeaders
+
+logger = logging.getLogger(__name__)
+
+# Status que valem uma nova tentativa (limite de taxa e falhas temporárias do servidor)
+STATUS_RETENTATIVA = {429, 500, 502, 503, 504, 522, 524}
+
+
+class TokenBucket:
+    """Limita a taxa média a ``taxa`` requisições/s, permitindo rajadas de ``capacidade``"""
+
+    def __init__(self, taxa, capacidade, relogio=time.monotonic):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.relogio = relogio
+        self.tokens = float(capacidade)
+        self.atualizado = relogio()
+
+    def reservar(self):
+        """Reserva um token e retorna quantos segundos esperar até poder usá-lo"""
+        agora = self.relogio()
+        self.tokens = min(self.capacidade, self.tokens + (agora - self.atualizado) * self.taxa)
+        self.atualizado = agora
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.taxa
+
+
+class ClienteApi:
+    """Pool de conexões persistentes com concorrência, taxa e novas tentativas controladas"""
+
+    def __init__(self, reactor, concorrencia=8, taxa=10.0, rajada=10, tentativas=4,
+                 backoff=0.5, backoff_max=30.0, timeout=30, nome='API FIPE'):
+        self.reactor = reactor
+        self.nome = nome
+        self.pool = HTTPConnectionPool(reactor, persistent=True)
+        self.pool.maxPersistentPerHost = concorrencia
+        self.pool.cachedConnectionTimeout = 120
+        self.agent = Agent(reactor, connectTimeout=timeout, pool=self.pool)
+        self.semaforo = defer.DeferredSemaphore(concorrencia)
+        self.bucket = TokenBucket(taxa, rajada)
+        self.tentativas = tentativas
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.retentativas = 0
+
+    async def esperar(self, segundos):
+        if segundos > 0:
+            await maybe_deferred_to_future(task.deferLater(self.reactor, segundos, lambda: None))
+
+    async def _requisitar(self, url, headers, timeout):
+        await maybe_deferred_to_future(self.semaforo.acquire())
+        try:
+            d = self.agent.request(b'GET', url.encode('ascii'), TwistedHeaders(headers))
+            d.addTimeout(timeout, self.reactor)
+            resposta = await maybe_deferred_to_future(d)
+            corpo = await maybe_deferred_to_future(readBody(resposta))
+        finally:
+            self.semaforo.release()
+        return resposta.code, dict(resposta.headers.getAllRawHeaders()), corpo
+
+    def _pausa(self, tentativa, headers=None):
+        """Backoff exponencial com jitter completo; respeita o Retry-After quando vier"""
+        pausa = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** tentativa))
+        retry_after = (headers or {}).get(b'Retry-After')
+        if retry_after and retry_after[0].isdigit():
+            pausa = max(pausa, min(float(retry_after[0]), self.backoff_max))
+        return pausa
+
+    async def buscar(self, url, headers, timeout=None):
+        """GET com novas tentativas; retorna (status, headers, corpo) ou levanta a última exceção"""
+        for tentativa in range(self.tentativas):
+            await self.esperar(self.bucket.reservar())
+            ultima = tentativa == self.tentativas - 1
+            try:
+                status, headers_resposta, corpo = await self._requisitar(url, headers, timeout or self.timeout)
+            except Exception as e:
+                if ultima:
+                    raise
+                logger.debug(f"{self.nome}: {e!r} em {url}, nova tentativa")
+                pausa = self._pausa(tentativa)
+            else:
+                if status not in STATUS_RETENTATIVA or ultima:
+                    return status, headers_resposta, corpo
+                logger.debug(f"{self.nome}: status {status} em {url}, nova tentativa")
+                pausa = self._pausa(tentativa, headers_resposta)
+            self.retentativas += 1
+            await self.esperar(pausa)
+
+    def close(self):
+        return self.pool.closeCachedConnections()
+
+
+class FipeApiMiddleware:
+    """Downloader middleware que faz as requisições com ``meta['fipe_api']`` pelo ClienteApi.
+
+    Deve ficar depois do cache da FIPE e do DownloaderStats (ordem alta), no
+    lugar do download handler. Configuração: FIPE_API_ENABLED,
+    FIPE_API_CONCORRENCIA, FIPE_API_TAXA (requisições/s), FIPE_API_RAJADA,
+    FIPE_API_TENTATIVAS e FIPE_API_TIMEOUT.
+    """
+
+    def __init__(self, crawler):
+        from twisted.internet import reactor
+        settings = crawler.settings
+        self.crawler = crawler
+        self.cliente = ClienteApi(
+            reactor,
+            concorrencia=settings.getint('FIPE_API_CONCORRENCIA', 8),
+            taxa=settings.getfloat('FIPE_API_TAXA', 10.0),
+            rajada=settings.getint('FIPE_API_RAJADA', 10),
+            tentativas=settings.getint('FIPE_API_TENTATIVAS', 4),
+            timeout=settings.getfloat('FIPE_API_TIMEOUT', 30),
+        )
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('FIPE_API_ENABLED', True):
+            raise NotConfigured
+        return cls(crawler)
+
+    def spider_closed(self, spider):
+        self.crawler.stats.set_value('fipe_api/retentativas', self.cliente.retentativas)
+        return self.cliente.close()
+
+    async def process_request(self, request, spider):
+        if not request.meta.get('fipe_api'):
+            return None
+
+        headers = {nome: valores for nome, valores in request.headers.items()}
+        headers.setdefault(b'Accept', [b'application/json'])
+        # As novas tentativas (com jitter) já foram feitas aqui
+        request.meta['dont_retry'] = True
+        # O DownloadTimeoutMiddleware sempre preenche download_timeout (DOWNLOAD_TIMEOUT, 180s por
+        # padrão): vale só se for menor que o FIPE_API_TIMEOUT, que é o limite da conexão do pool
+        timeout = min(request.meta.get('download_timeout') or self.cliente.timeout, self.cliente.timeout)
+        inicio = time.monotonic()
+        status, headers_resposta, corpo = await self.cliente.buscar(request.url, headers, timeout)
+        request.meta['download_latency'] = time.monotonic() - inicio
+        self.crawler.stats.inc_value('fipe_api/requisicoes')
+        return TextResponse(
+            url=request.url,
+            status=status,
+            headers=Headers(headers_resposta),
+            body=corpo,
+            encoding='utf-8',
+            request=request,
+            flags=['fipe_api'],
+        )
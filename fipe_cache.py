@@ -0,0 +1,184 @@
+import sqlite3
+import time
+import logging
+
+from scrapy import signals
+from scrapy.http import TextResponse
+
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+# Tipos de entrada no cache
+ARVORE = 'arvore'  # /marcas, /modelos e /anos: mudam raramente, expiram por TTL
+FOLHA = 'folha'    # /anos/{codigo}: preço do mês, vale enquanto o MesReferencia não mudar
+
+
+class FipeCache:
+    """Cache em disco (sqlite) das respostas da API FIPE do parallelum.
+
+    As entradas da árvore expiram pelo TTL; as folhas ficam associadas ao
+    MesReferencia em que foram baixadas. Quando o arquivo passa de
+    ``max_bytes`` as entradas acessadas há mais tempo são removidas.
+    """
+
+    def __init__(self, path='fipe_cache.sqlite', ttl=30 * 24 * 3600, max_bytes=512 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.inseridos = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS respostas (
+                url TEXT PRIMARY KEY,
+                tipo TEXT NOT NULL,
+                mes_referencia TEXT,
+                body BLOB NOT NULL,
+                tamanho INTEGER NOT NULL,
+                criado_em REAL NOT NULL,
+                acessado_em REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_respostas_acessado ON respostas (acessado_em);
+            CREATE TABLE IF NOT EXISTS meta (
+                chave TEXT PRIMARY KEY,
+                valor TEXT
+            );
+        """)
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            path=settings.get('FIPE_CACHE_PATH', 'fipe_cache.sqlite'),
+            ttl=settings.getint('FIPE_CACHE_TTL', 30 * 24 * 3600),
+            max_bytes=settings.getint('FIPE_CACHE_MAX_BYTES', 512 * 1024 * 1024),
+        )
+
+    def get(self, url, tipo, mes_referencia=None):
+        """Retorna o body em cache ou None se não houver entrada válida"""
+        row = self.conn.execute(
+            "SELECT body, criado_em, mes_referencia FROM respostas WHERE url = ? AND tipo = ?",
+            (url, tipo)
+        ).fetchone()
+        if row is None:
+            return None
+        body, criado_em, mes = row
+        if tipo == ARVORE and time.time() - criado_em > self.ttl:
+            return None
+        if tipo == FOLHA and (mes_referencia is None or mes != mes_referencia):
+            return None
+        self.conn.execute("UPDATE respostas SET acessado_em = ? WHERE url = ?", (time.time(), url))
+        return body
+
+    def set(self, url, tipo, body, mes_referencia=None):
+        agora = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO respostas VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (url, tipo, mes_referencia, body, len(body), agora, agora)
+        )
+        self.inseridos += 1
+        # Commita e verifica o tamanho em lotes para não pagar um fsync por resposta
+        if self.inseridos % 500 == 0:
+            self.conn.commit()
+            self.evict()
+
+    def get_meta(self, chave):
+        row = self.conn.execute("SELECT valor FROM meta WHERE chave = ?", (chave,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, chave, valor):
+        self.conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (chave, valor))
+
+    def evict(self):
+        """Remove entradas vencidas e, se necessário, as menos acessadas até caber em max_bytes"""
+        self.conn.execute(
+            "DELETE FROM respostas WHERE tipo = ? AND criado_em < ?",
+            (ARVORE, time.time() - self.ttl)
+        )
+        total = self.conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM respostas").fetchone()[0]
+        if total > self.max_bytes:
+            excesso = total - self.max_bytes
+            removidos = 0
+            for url, tamanho in self.conn.execute(
+                "SELECT url, tamanho FROM respostas ORDER BY acessado_em"
+            ).fetchall():
+                if removidos >= excesso:
+                    break
+                self.conn.execute("DELETE FROM respostas WHERE url = ?", (url,))
+                removidos += tamanho
+            logger.info(f"Cache FIPE: {removidos} bytes removidos por limite de tamanho")
+        self.conn.commit()
+
+    def close(self):
+        self.evict()
+        self.conn.close()
+
+
+class FipeCacheMiddleware:
+    """Downloader middleware que serve as respostas da API FIPE a partir do FipeCache.
+
+    Só atua em requisições com ``meta['fipe_cache']`` (ARVORE ou FOLHA). Respostas
+    servidas do cache não passam pelo downloader, então não pagam o DOWNLOAD_DELAY.
+    Folhas só são servidas do cache no modo incremental, quando o spider confirmou
+    que o MesReferencia atual é o mesmo das folhas salvas.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.cache = FipeCache.from_settings(crawler.settings)
+        self.hits = 0
+        self.misses = 0
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def spider_opened(self, spider):
+        # Expõe o cache para o spider consultar o MesReferencia salvo
+        spider.fipe_cache = self.cache
+
+    def spider_closed(self, spider):
+        self.cache.close()
+        logger.info(f"Cache FIPE: {self.hits} hits, {self.misses} misses")
+
+    def process_request(self, request, spider):
+        tipo = request.meta.get('fipe_cache')
+        if not tipo:
+            return None
+
+        mes = getattr(spider, 'mes_referencia_atual', None) if tipo == FOLHA else None
+        body = self.cache.get(request.url, tipo, mes)
+        if body is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.crawler.stats.inc_value('fipe_cache/hit')
+        return TextResponse(
+            url=request.url,
+            status=200,
+            body=body,
+            encoding='utf-8',
+            request=request,
+            flags=['fipe_cache'],
+        )
+
+    def process_response(self, request, response, spider):
+        tipo = request.meta.get('fipe_cache')
+        if not tipo or response.status != 200 or 'fipe_cache' in response.flags:
+            return response
+
+        mes = None
+        if tipo == FOLHA:
+            try:
+                mes = json_codec.loads(response.body).get('MesReferencia')
+            except ValueError:
+                return response
+            # Guarda a última folha baixada para servir de sonda na próxima execução
+            self.cache.set_meta('url_sonda', request.url)
+            self.cache.set_meta('mes_referencia', mes)
+
+        self.cache.set(request.url, tipo, response.body, mes)
+        self.crawler.stats.inc_value('fipe_cache/store')
+        return response
@@ -0,0 +1,172 @@
+import time
+import sqlite3
+
+import json_codec
+
+# Níveis da árvore da API FIPE, da raiz para as folhas
+NIVEIS = ('marcas', 'modelos', 'anos', 'detalhes')
+
+# Estados de um nó (coluna ``concluido``)
+PENDENTE = 0
+CONCLUIDO = 1
+FALHOU = 2
+
+
+class FipeCheckpoint:
+    """Estado de uma varredura completa da árvore FIPE, salvo em sqlite.
+
+    Cada nó (URL) é registrado como pendente quando é descoberto e marcado
+    como concluído depois que o callback terminou de registrar os filhos.
+    Um nó cujo download ou callback falhou fica como falho: não conta como
+    pendente e, numa retomada, volta a pendente até acumular o limite de
+    falhas. Numa retomada, só os nós pendentes são refeitos. As folhas guardam o item
+    extraído, então o snapshot final inclui os preços de todas as execuções.
+    """
+
+    def __init__(self, path='fipe_checkpoint.sqlite', lote_commit=200):
+        self.path = path
+        self.lote_commit = lote_commit
+        self._pendentes = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS nos (
+                url TEXT PRIMARY KEY,
+                nivel TEXT NOT NULL,
+                callback TEXT NOT NULL,
+                meta BLOB NOT NULL,
+                concluido INTEGER NOT NULL DEFAULT 0,
+                item BLOB,
+                falhas INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_nos_pendentes ON nos (concluido, nivel);
+            CREATE TABLE IF NOT EXISTS estado (
+                chave TEXT PRIMARY KEY,
+                valor TEXT
+            );
+        """)
+        colunas = {linha[1] for linha in self.conn.execute("PRAGMA table_info(nos)")}
+        if 'falhas' not in colunas:
+            # Checkpoint de uma versão anterior
+            self.conn.execute("ALTER TABLE nos ADD COLUMN falhas INTEGER NOT NULL DEFAULT 0")
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings.get('FIPE_CHECKPOINT_PATH', 'fipe_checkpoint.sqlite'))
+
+    def _talvez_commit(self):
+        self._pendentes += 1
+        if self._pendentes >= self.lote_commit:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self._pendentes = 0
+
+    def em_andamento(self):
+        """Indica se existe uma varredura iniciada e não terminada"""
+        iniciada = self.conn.execute("SELECT 1 FROM nos LIMIT 1").fetchone() is not None
+        return iniciada and self.get_estado('concluida_em') is None
+
+    def reiniciar(self):
+        """Apaga a varredura anterior (terminada) para começar uma nova"""
+        self.conn.execute("DELETE FROM nos")
+        self.conn.execute("DELETE FROM estado")
+        self.conn.execute("INSERT INTO estado VALUES ('iniciada_em', ?)", (str(time.time()),))
+        self.commit()
+
+    def registrar(self, url, nivel, callback, meta):
+        """Registra um nó descoberto; retorna False se ele já era conhecido"""
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO nos (url, nivel, callback, meta) VALUES (?, ?, ?, ?)",
+            (url, nivel, callback, json_codec.dumps(meta))
+        )
+        self._talvez_commit()
+        return cursor.rowcount > 0
+
+    def concluir(self, url, item=None):
+        self.conn.execute(
+            "UPDATE nos SET concluido = ?, item = ? WHERE url = ?",
+            (CONCLUIDO, json_codec.dumps(item) if item is not None else None, url)
+        )
+        self._talvez_commit()
+
+    def falhar(self, url):
+        """Marca o nó como falho nesta execução (não conta mais como pendente)"""
+        self.conn.execute(
+            "UPDATE nos SET concluido = ?, falhas = falhas + 1 WHERE url = ? AND concluido = ?",
+            (FALHOU, url, PENDENTE)
+        )
+        self._talvez_commit()
+
+    def reabrir_falhos(self, max_falhas=3):
+        """Volta para pendentes os nós falhos com menos de ``max_falhas`` falhas; retorna quantos"""
+        cursor = self.conn.execute(
+            "UPDATE nos SET concluido = ? WHERE concluido = ? AND falhas < ?", (PENDENTE, FALHOU, max_falhas)
+        )
+        self.commit()
+        return cursor.rowcount
+
+    def falhos(self, max_falhas=3):
+        """Nós falhos que ainda podem ser tentados de novo numa retomada"""
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM nos WHERE concluido = ? AND falhas < ?", (FALHOU, max_falhas)
+        ).fetchone()[0]
+
+    def nos_pendentes(self, lote=1000):
+        """Gera (url, callback, meta) dos nós ainda não concluídos, da raiz para as folhas.
+
+        Lê em lotes (pelo nível e pelo rowid), para uma retomada com centenas de
+        milhares de nós pendentes não carregar todos em memória.
+        """
+        self.commit()
+        # Nós registrados durante a retomada já são agendados por quem os descobriu
+        maximo = self.conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM nos").fetchone()[0]
+        for nivel in NIVEIS:
+            ultimo = 0
+            while True:
+                linhas = self.conn.execute(
+                    "SELECT rowid, url, callback, meta FROM nos "
+                    "WHERE concluido = ? AND nivel = ? AND rowid > ? AND rowid <= ? ORDER BY rowid LIMIT ?",
+                    (PENDENTE, nivel, ultimo, maximo, lote)
+                ).fetchall()
+                for ultimo, url, callback, meta in linhas:
+                    yield url, callback, json_codec.loads(meta)
+                if len(linhas) < lote:
+                    break
+
+    def progresso(self):
+        """{nivel: (concluídos, descobertos)} para cada nível da árvore"""
+        contagem = {nivel: (0, 0) for nivel in NIVEIS}
+        for nivel, concluidos, total in self.conn.execute(
+            "SELECT nivel, SUM(concluido = ?), COUNT(*) FROM nos GROUP BY nivel", (CONCLUIDO,)
+        ):
+            contagem[nivel] = (concluidos, total)
+        return contagem
+
+    def pendentes(self):
+        return self.conn.execute("SELECT COUNT(*) FROM nos WHERE concluido = ?", (PENDENTE,)).fetchone()[0]
+
+    def exportar(self, path):
+        """Grava em JSONL o item de todas as folhas concluídas; retorna quantos itens"""
+        self.commit()
+        total = 0
+        with open(path, 'wb') as f:
+            for (item,) in self.conn.execute(
+                "SELECT item FROM nos WHERE item IS NOT NULL ORDER BY url"
+            ):
+                f.write(item + b'\n')
+                total += 1
+        return total
+
+    def finalizar(self):
+        """Marca a varredura como terminada: a próxima execução começa do zero"""
+        self.conn.execute("INSERT OR REPLACE INTO estado VALUES ('concluida_em', ?)", (str(time.time()),))
+        self.commit()
+
+    def get_estado(self, chave):
+        row = self.conn.execute("SELECT valor FROM estado WHERE chave = ?", (chave,)).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        self.commit()
+        self.conn.close()
@@ -1,97 +1,267 @@
+import sys
 import scrapy
-import json
 import random
+from scrapy import signals
+from twisted.internet import task
 
-class FipeCrawler(scrapy.Spider):
+import json_codec
+from items import VeiculoFipe
+from fipe_cache import ARVORE, FOLHA
+from fipe_checkpoint import FipeCheckpoint, NIVEIS
+from metrics import ContadoresMixin
+
+API_MARCAS = "https://parallelum.com.br/fipe/api/v1/carros/marcas"
+
+
+def url_no(caminho):
+    """URL da API para o nó com os códigos (marca, modelo, ano); caminho vazio é a lista de marcas"""
+    url = API_MARCAS
+    for codigo, trecho in zip(caminho, ('modelos', 'anos', None)):
+        url = f"{url}/{codigo}/{trecho}" if trecho else f"{url}/{codigo}"
+    return url
+
+
+def caminho_da_url(url):
+    """Inverso de url_no: ("59", 5940, "2014-1") a partir da URL do nó"""
+    partes = url[len(API_MARCAS):].strip('/').split('/')
+    return tuple(partes[0::2]) if partes != [''] else ()
+
+
+class FipeCrawler(ContadoresMixin, scrapy.Spider):
     name = "fipe_crawler"
+    # Contadores em fipe/<nível>/... (ver metrics.py)
+    PREFIXO_CONTADORES = 'fipe'
     
     # URLs para as APIs da tabela FIPE
-    marcas_url = "https://parallelum.com.br/fipe/api/v1/carros/marcas"
+    marcas_url = API_MARCAS
+    
+    def __init__(self, incremental=False, completo=False, *args, **kwargs):
+        super(FipeCrawler, self).__init__(*args, **kwargs)
+        # Modo incremental: só baixa os preços de novo quando o MesReferencia mudar
+        # Ex: scrapy runspider fipe_crawler.py -a incremental=1
+        self.incremental = str(incremental).lower() in ('1', 'true', 'sim')
+        # Modo completo: todos os modelos e anos, com checkpoint para retomar a varredura
+        # Ex: scrapy runspider fipe_crawler.py -a completo=1
+        self.completo = str(completo).lower() in ('1', 'true', 'sim')
+        self.mes_referencia_atual = None
+        self.checkpoint = None
+    
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(FipeCrawler, cls).from_crawler(crawler, *args, **kwargs)
+        # Nó cujo callback levantou exceção não chega ao concluir: registra a falha
+        crawler.signals.connect(spider.erro_callback, signal=signals.spider_error)
+        if spider.completo:
+            spider.checkpoint = FipeCheckpoint.from_settings(crawler.settings)
+            crawler.signals.connect(spider.iniciar_progresso, signal=signals.spider_opened)
+        return spider
     
     def start_requests(self):
-        yield scrapy.Request(url=self.marcas_url, callback=self.parse_marcas)
+        if self.checkpoint is not None:
+            if self.checkpoint.em_andamento():
+                # Retoma a varredura interrompida a partir dos nós pendentes
+                # Nós que falharam em execuções anteriores voltam, até FIPE_CHECKPOINT_TENTATIVAS falhas
+                reabertos = self.checkpoint.reabrir_falhos(self.settings.getint('FIPE_CHECKPOINT_TENTATIVAS', 3))
+                self.logger.info(f"Retomando varredura completa: {self.descrever_progresso()} "
+                                 f"({reabertos} nós que falharam serão tentados de novo)")
+                for url, callback, meta in self.checkpoint.nos_pendentes():
+                    # Checkpoints antigos guardam os nomes em marca_nome/modelo_nome
+                    nomes = meta.get('nomes') or tuple(
+                        meta[chave] for chave in ('marca_nome', 'modelo_nome') if chave in meta)
+                    yield self.request_no(getattr(self, callback), caminho_da_url(url), nomes, meta.get('fipe_cache'))
+                return
+            self.checkpoint.reiniciar()
+        
+        cache = getattr(self, 'fipe_cache', None)
+        url_sonda = cache.get_meta('url_sonda') if cache and self.incremental else None
+        
+        if url_sonda:
+            # Baixa uma folha conhecida para descobrir o MesReferencia atual
+            yield scrapy.Request(url=url_sonda, callback=self.parse_sonda, dont_filter=True, meta={'fipe_api': True})
+        else:
+            yield self.marcas_request()
+    
+    def agendar(self, callback, caminho=(), nomes=(), fipe_cache=ARVORE):
+        """Cria a requisição de um nó da árvore; no modo completo também registra o nó no checkpoint.
+        
+        ``caminho`` são os códigos (marca, modelo, ano) do nó e ``nomes`` os nomes
+        de marca e modelo. Retorna None para nós já registrados: ou foram
+        concluídos ou são reagendados pelo start_requests da retomada.
+        """
+        nivel = NIVEIS[len(caminho)]
+        if self.checkpoint is not None and not self.checkpoint.registrar(
+                url_no(caminho), nivel, callback.__name__, {'nomes': nomes, 'fipe_cache': fipe_cache}):
+            return None
+        self.contar(f'{nivel}/descobertos')
+        return self.request_no(callback, caminho, nomes, fipe_cache)
+    
+    def request_no(self, callback, caminho, nomes, fipe_cache):
+        """Requisição compacta do nó: o meta leva só os códigos (marca, modelo, ano) e os nomes.
+        
+        Os nomes são internados (``sys.intern``): os milhares de requisições de
+        uma marca apontam para a mesma string em vez de cada uma ter a sua
+        cópia. Tudo fica na própria requisição, então ela pode ser serializada
+        (fila em disco, fronteira do shard_runner) e atendida por outro processo.
+        
+        Os nós mais profundos têm prioridade (busca em profundidade), então as
+        folhas são baixadas logo e a fila de pendentes não cresce com a árvore.
+        Cada URL da árvore é única (e o checkpoint já deduplica no modo
+        completo), então o filtro de duplicadas do Scrapy não é usado.
+        """
+        return scrapy.Request(
+            url=url_no(caminho),
+            callback=callback,
+            errback=self.falha_no,
+            priority=len(caminho),
+            dont_filter=True,
+            meta={
+                'nivel': NIVEIS[len(caminho)],
+                'fipe_caminho': tuple(caminho),
+                'fipe_nomes': tuple(sys.intern(nome) for nome in nomes),
+                'fipe_api': True,
+                'fipe_cache': fipe_cache,
+            },
+        )
+    
+    def concluir(self, response, item=None):
+        """Marca o nó como concluído depois que todos os filhos foram agendados"""
+        self.contar(f"{response.meta['nivel']}/concluidos")
+        if self.checkpoint is not None:
+            self.checkpoint.concluir(url_no(response.meta['fipe_caminho']), item)
+    
+    def falhar(self, meta, motivo):
+        """Nó que não vai ser concluído nesta execução (download ou callback falhou)"""
+        self.contar(f"{meta['nivel']}/falhos")
+        url = url_no(meta['fipe_caminho'])
+        self.logger.warning(f"Nó {url} falhou: {motivo}")
+        if self.checkpoint is not None:
+            self.checkpoint.falhar(url)
+    
+    def falha_no(self, failure):
+        """Errback dos nós: 404/500 descartados pelo HttpErrorMiddleware, tentativas esgotadas etc."""
+        self.falhar(failure.request.meta, failure.getErrorMessage())
+    
+    def erro_callback(self, failure, response, spider):
+        """Exceção no callback de um nó (sinal spider_error): o nó não chegou ao concluir"""
+        if 'fipe_caminho' in response.meta:
+            self.falhar(response.meta, failure.getErrorMessage())
+    
+    def marcas_request(self):
+        return self.agendar(self.parse_marcas)
+    
+    def parse_sonda(self, response):
+        mes_atual = json_codec.loads(response.body).get('MesReferencia')
+        mes_cache = self.fipe_cache.get_meta('mes_referencia')
+        
+        if mes_atual and mes_atual == mes_cache:
+            # Mês não mudou: os preços salvos continuam válidos
+            self.mes_referencia_atual = mes_atual
+            self.logger.info(f"Mês de referência inalterado ({mes_atual}), usando preços do cache")
+        else:
+            self.logger.info(f"Mês de referência mudou ({mes_cache} -> {mes_atual}), buscando preços novamente")
+        
+        request = self.marcas_request()
+        if request is not None:
+            yield request
     
     def parse_marcas(self, response):
-        marcas = json.loads(response.body)
+        marcas = json_codec.loads(response.body)
         
         # Agora buscamos todas as marcas
         for marca in marcas:
-            marca_id = marca["codigo"]
-            marca_nome = marca["nome"]
-            
             # Busca os modelos para cada marca
-            modelos_url = f"https://parallelum.com.br/fipe/api/v1/carros/marcas/{marca_id}/modelos"
-            yield scrapy.Request(
-                url=modelos_url, 
-                callback=self.parse_modelos,
-                meta={'marca_id': marca_id, 'marca_nome': marca_nome}
-            )
+            request = self.agendar(self.parse_modelos, (marca["codigo"],), (marca["nome"],))
+            if request is not None:
+                yield request
+        
+        self.concluir(response)
     
     def parse_modelos(self, response):
-        dados = json.loads(response.body)
+        dados = json_codec.loads(response.body)
         modelos = dados["modelos"]
-        marca_id = response.meta['marca_id']
-        marca_nome = response.meta['marca_nome']
+        marca_id, = response.meta['fipe_caminho']
+        marca_nome, = response.meta['fipe_nomes']
         
-        # Seleciona até 20 modelos aleatórios (ou todos se houver menos de 20)
-        modelos_limite = min(20, len(modelos))
-        modelos_selecionados = random.sample(modelos, modelos_limite)
+        if self.completo:
+            # Todos os modelos, na ordem da API
+            modelos_selecionados = modelos
+        else:
+            # Seleciona até 20 modelos aleatórios (ou todos se houver menos de 20)
+            modelos_limite = min(20, len(modelos))
+            modelos_selecionados = random.sample(modelos, modelos_limite)
         
         for modelo in modelos_selecionados:
-            modelo_id = modelo["codigo"]
-            modelo_nome = modelo["nome"]
-            
             # Para cada modelo, busca os anos disponíveis
-            anos_url = f"https://parallelum.com.br/fipe/api/v1/carros/marcas/{marca_id}/modelos/{modelo_id}/anos"
-            yield scrapy.Request(
-                url=anos_url, 
-                callback=self.parse_anos,
-                meta={
-                    'marca_id': marca_id, 
-                    'marca_nome': marca_nome,
-                    'modelo_id': modelo_id,
-                    'modelo_nome': modelo_nome
-                }
-            )
+            request = self.agendar(self.parse_anos, (marca_id, modelo["codigo"]), (marca_nome, modelo["nome"]))
+            if request is not None:
+                yield request
+        
+        self.concluir(response)
     
     def parse_anos(self, response):
-        anos = json.loads(response.body)
-        marca_id = response.meta['marca_id']
-        marca_nome = response.meta['marca_nome']
-        modelo_id = response.meta['modelo_id']
-        modelo_nome = response.meta['modelo_nome']
+        anos = json_codec.loads(response.body)
+        marca_id, modelo_id = response.meta['fipe_caminho']
+        nomes = response.meta['fipe_nomes']
         
         # Para cada ano/versão disponível, busca os detalhes do veículo
-        # Podemos limitar a um ano por modelo se quisermos reduzir o volume de requisições
-        for ano in anos[:1]:  # Pegamos apenas o primeiro ano por modelo
-            ano_codigo = ano["codigo"]
-            detalhes_url = f"https://parallelum.com.br/fipe/api/v1/carros/marcas/{marca_id}/modelos/{modelo_id}/anos/{ano_codigo}"
-            yield scrapy.Request(
-                url=detalhes_url, 
-                callback=self.parse_detalhes,
-                meta={
-                    'marca_nome': marca_nome,
-                    'modelo_nome': modelo_nome
-                }
-            )
+        # Fora do modo completo, pegamos apenas o primeiro ano por modelo para reduzir o volume
+        for ano in (anos if self.completo else anos[:1]):
+            request = self.agendar(self.parse_detalhes, (marca_id, modelo_id, ano["codigo"]), nomes, FOLHA)
+            if request is not None:
+                yield request
+        
+        self.concluir(response)
     
     def parse_detalhes(self, response):
-        detalhes = json.loads(response.body)
+        detalhes = json_codec.loads(response.body)
         
         # Extrai os detalhes do veículo, incluindo o valor FIPE
-        veiculo = {
-            'modelo': detalhes.get('Modelo'),
-            'marca': detalhes.get('Marca'),
-            'ano': detalhes.get('AnoModelo'),
-            'combustivel': detalhes.get('Combustivel'),
-            'codigo_fipe': detalhes.get('CodigoFipe'),
-            'mes_referencia': detalhes.get('MesReferencia'),
-            'valor': detalhes.get('Valor'),
-            'tipo_veiculo': detalhes.get('TipoVeiculo')
-        }
-        
-        self.logger.info(f"Veículo encontrado: {veiculo['marca']} {veiculo['modelo']} - {veiculo['valor']}")
+        veiculo = VeiculoFipe.da_api(detalhes)
+        # Sem marca/modelo na resposta, usa os nomes vindos dos níveis de cima da árvore
+        marca_nome, modelo_nome = response.meta['fipe_nomes']
+        veiculo.marca = veiculo.marca or marca_nome
+        veiculo.modelo = veiculo.modelo or modelo_nome
+        
+        self.logger.info(f"Veículo encontrado: {veiculo.marca} {veiculo.modelo} - {veiculo.valor}")
         yield veiculo
+        self.concluir(response, veiculo)
+    
+    def iniciar_progresso(self, spider):
+        intervalo = self.settings.getfloat('FIPE_PROGRESSO_INTERVALO', 60)
+        self.tarefa_progresso = task.LoopingCall(self.logar_progresso)
+        self.tarefa_progresso.start(intervalo, now=False)
+    
+    def descrever_progresso(self):
+        progresso = self.checkpoint.progresso()
+        return ', '.join(f"{nivel} {concluidos}/{total}" for nivel, (concluidos, total) in progresso.items())
+    
+    def logar_progresso(self):
+        self.logger.info(f"Progresso da varredura completa: {self.descrever_progresso()}")
+    
+    def closed(self, reason):
+        if self.checkpoint is None:
+            return
+        if getattr(self, 'tarefa_progresso', None) is not None and self.tarefa_progresso.running:
+            self.tarefa_progresso.stop()
+        self.logar_progresso()
+        
+        pendentes = self.checkpoint.pendentes()
+        if reason == 'finished' and pendentes == 0:
+            # Árvore percorrida: grava o snapshot com as folhas de todas as execuções
+            path = self.settings.get('FIPE_SNAPSHOT_PATH', 'fipe_completo.jsonl')
+            total = self.checkpoint.exportar(path)
+            falhos = self.checkpoint.falhos(self.settings.getint('FIPE_CHECKPOINT_TENTATIVAS', 3))
+            if falhos:
+                # Fica em andamento: a próxima execução refaz só os nós que falharam
+                self.logger.warning(f"Snapshot com {total} veículos em {path}, mas {falhos} nós falharam; "
+                                    f"rode de novo com -a completo=1 para tentar de novo")
+            else:
+                self.checkpoint.finalizar()
+                self.logger.info(f"Varredura completa concluída: {total} veículos em {path}")
+        else:
+            self.logger.warning(f"Varredura interrompida ({reason}) com {pendentes} nós pendentes; "
+                                f"rode de novo com -a completo=1 para retomar")
+        self.checkpoint.close()
     
     # Método para iniciar o crawler com configuração para salvar em JSON
     # Você pode executar com: scrapy crawl fipe_crawler -o veiculos.json
@@ -99,6 +269,57 @@ class FipeCrawler(scrapy.Spider):
         'FEED_FORMAT': 'json',
         'FEED_URI': 'veiculos.json',
         'FEED_EXPORT_ENCODING': 'utf-8',
-        # Adiciona delay para evitar sobrecarga na API
+        # Exportação com o codec JSON rápido (ver json_codec.py)
+        'FEED_EXPORTERS': json_codec.FEED_EXPORTERS,
+        # Adiciona delay para evitar sobrecarga na API (só sem o cliente da API, que tem taxa própria)
         'DOWNLOAD_DELAY': 0.5,
+        'CONCURRENT_REQUESTS': 32,
+        # Cache em disco das respostas da API (ver fipe_cache.py) e cliente com pool de conexões (ver fipe_api.py)
+        'DOWNLOADER_MIDDLEWARES': {
+            'fipe_cache.FipeCacheMiddleware': 50,
+            'fipe_api.FipeApiMiddleware': 900,
+            # Circuit breaker por host e novas tentativas limitadas por orçamento (ver circuit_breaker.py)
+            'circuit_breaker.CircuitBreakerMiddleware': 570,
+            'scrapy.downloadermiddlewares.retry.RetryMiddleware': None,
+            'circuit_breaker.RetryBudgetMiddleware': 550,
+        },
+        'CIRCUIT_BREAKER_LIMITE': 3,  # Bloqueios seguidos que abrem o circuito do host
+        'CIRCUIT_BREAKER_BACKOFF': 30,  # Pausa da primeira abertura, dobrada a cada sonda bloqueada
+        'CIRCUIT_BREAKER_BACKOFF_MAX': 600,
+        'RETRY_BUDGET_RATIO': 0.1,  # Novas tentativas limitadas a 10% das requisições
+        # Exportação colunar (Parquet/Arrow) com preços, km e anos tipados; None desliga (ver columnar_export.py)
+        'ITEM_PIPELINES': {'columnar_export.ColumnarExportPipeline': 800},
+        'COLUMNAR_EXPORT_DIR': None,
+        'COLUMNAR_EXPORT_FORMAT': 'parquet',
+        # Métricas ao vivo: endpoint Prometheus (None desliga) e arquivo periódico (ver metrics.py)
+        'EXTENSIONS': {'metrics.MetricsExtension': 500},
+        'SPIDER_MIDDLEWARES': {
+            'metrics.MetricsSpiderMiddleware': 990,
+            'profiling.ProfilingSpiderMiddleware': 995,
+        },
+        'METRICS_PORT': None,
+        'METRICS_FILE': 'metricas_fipe.json',
+        'METRICS_INTERVAL': 30,
+        # Modo de profiling (CPU e alocações por callback): -s PROFILE_DIR=perfil (ver profiling.py)
+        'PROFILE_DIR': None,
+        # Cliente da API: conexões simultâneas, requisições/s, rajada e tentativas por requisição
+        'FIPE_API_ENABLED': True,
+        'FIPE_API_CONCORRENCIA': 8,
+        'FIPE_API_TAXA': 10.0,
+        'FIPE_API_RAJADA': 10,
+        'FIPE_API_TENTATIVAS': 4,
+        'FIPE_API_TIMEOUT': 30,
+        'FIPE_CACHE_PATH': 'fipe_cache.sqlite',
+        'FIPE_CACHE_TTL': 30 * 24 * 3600,
+        'FIPE_CACHE_MAX_BYTES': 512 * 1024 * 1024,
+        # Modo completo: checkpoint da varredura, snapshot final e intervalo do log de progresso
+        'FIPE_CHECKPOINT_PATH': 'fipe_checkpoint.sqlite',
+        'FIPE_SNAPSHOT_PATH': 'fipe_completo.jsonl',
+        'FIPE_PROGRESSO_INTERVALO': 60,
+        'FIPE_CHECKPOINT_TENTATIVAS': 3,  # Execuções em que um nó pode falhar antes de ser deixado de lado
+        # Fila do scheduler: as requisições pendentes além de SPILL_QUEUE_MEMORIA
+        # por prioridade vão para o disco em SPILL_QUEUE_DIR (ver spill_queue.py)
+        'SCHEDULER_MEMORY_QUEUE': 'spill_queue.SpillQueue',
+        'SPILL_QUEUE_MEMORIA': 2000,
+        'SPILL_QUEUE_DIR': None,
     }
\ No newline at end of file
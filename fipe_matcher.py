@@ -0,0 +1,190 @@
+"""Casamento dos anúncios da Webmotors com os códigos da tabela FIPE.
+
+O catálogo FIPE (o snapshot do FipeCrawler em modo completo ou o feed
+veiculos.json) é carregado uma vez e indexado por marca, ano e token
+normalizado do nome do modelo. Para cada anúncio, os candidatos são só as
+versões daquela marca/ano que contêm o nome do modelo, então o custo do
+casamento não cresce com o tamanho do catálogo. Os candidatos são pontuados
+pelos tokens em comum, pesados pela raridade do token no catálogo (IDF).
+
+O FipeMatchPipeline preenche ``codigo_fipe``, ``valor_fipe`` e
+``diferenca_fipe`` (preço do anúncio menos o valor FIPE, em reais) de cada
+AnuncioWebmotors enquanto o crawl acontece.
+"""
+import re
+import math
+import time
+import logging
+import unicodedata
+from functools import lru_cache
+from collections import Counter, defaultdict, namedtuple
+
+from scrapy.exceptions import NotConfigured
+
+import json_codec
+from items import AnuncioWebmotors
+
+logger = logging.getLogger(__name__)
+
+TOKEN = re.compile(r'[A-Z0-9]+(?:\.[0-9]+)?')
+NUMERO = re.compile(r'\d[\d.]*')
+
+# Grafias diferentes do mesmo atributo entre a FIPE e os anúncios
+SINONIMOS = {
+    'TOTALFLEX': 'FLEX', 'FLEXFUEL': 'FLEX', 'FLEXONE': 'FLEX', 'FLEXSTART': 'FLEX',
+    'AUTOMATICO': 'AUT', 'AUTOMATIZADO': 'AUT', 'AT': 'AUT',
+    'MANUAL': 'MEC', 'MT': 'MEC',
+    'PORTAS': 'P',
+}
+
+Entrada = namedtuple('Entrada', 'codigo_fipe marca modelo ano valor tokens')
+
+
+def tokens(texto):
+    """Tokens normalizados: maiúsculas, sem acento, com sinônimos unificados"""
+    if not texto:
+        return ()
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode('ascii').upper()
+    return tuple(SINONIMOS.get(token, token) for token in TOKEN.findall(texto))
+
+
+def reais(texto):
+    """Primeiro número do texto em reais ("R$ 45.678,00" -> 45678, "45678" -> 45678)"""
+    if isinstance(texto, int):
+        return texto
+    encontrado = NUMERO.search(texto or '')
+    return int(encontrado.group().replace('.', '')) if encontrado else None
+
+
+def ano_inteiro(ano):
+    encontrado = re.search(r'\d{4}', str(ano or ''))
+    return int(encontrado.group()) if encontrado else None
+
+
+class CatalogoFipe:
+    """Índice do catálogo FIPE para casar anúncios com códigos FIPE"""
+
+    def __init__(self, veiculos, min_confianca=0.5, cache=100000):
+        self.min_confianca = min_confianca
+        self.entradas = []
+        # token de marca -> marca normalizada ("VW - VolksWagen" responde por VW e VOLKSWAGEN)
+        self.marcas = {}
+        # (marca, ano) -> token do modelo -> índices das entradas
+        self.indice = defaultdict(lambda: defaultdict(list))
+        frequencia = Counter()
+
+        for veiculo in veiculos:
+            ano = ano_inteiro(veiculo.get('ano'))
+            tokens_marca = tokens(veiculo.get('marca'))
+            tokens_modelo = frozenset(tokens(veiculo.get('modelo')))
+            if not ano or not tokens_marca or not tokens_modelo or not veiculo.get('codigo_fipe'):
+                continue
+            marca = ' '.join(tokens_marca)
+            for token in tokens_marca:
+                self.marcas.setdefault(token, marca)
+            posicao = len(self.entradas)
+            self.entradas.append(Entrada(veiculo['codigo_fipe'], veiculo.get('marca'), veiculo.get('modelo'),
+                                         ano, reais(veiculo.get('valor')), tokens_modelo))
+            postings = self.indice[marca, ano]
+            for token in tokens_modelo:
+                postings[token].append(posicao)
+            frequencia.update(tokens_modelo)
+
+        total = max(len(self.entradas), 1)
+        self.idf = {token: math.log(1 + total / n) for token, n in frequencia.items()}
+        self.casar_tokens = lru_cache(maxsize=cache)(self._casar_tokens)
+
+    @classmethod
+    def carregar(cls, path, **kwargs):
+        """Lê o snapshot JSONL do modo completo ou o feed JSON (lista) do FipeCrawler"""
+        with open(path, 'rb') as f:
+            conteudo = f.read()
+        if conteudo.lstrip()[:1] == b'[':
+            veiculos = json_codec.loads(conteudo)
+        else:
+            veiculos = (json_codec.loads(linha) for linha in conteudo.splitlines() if linha.strip())
+        return cls(veiculos, **kwargs)
+
+    def __len__(self):
+        return len(self.entradas)
+
+    def resolver_marca(self, marca):
+        for token in tokens(marca):
+            if token in self.marcas:
+                return self.marcas[token]
+        return None
+
+    def casar(self, marca, modelo, descricao, ano):
+        """Entrada FIPE mais parecida com o anúncio e a confiança (0 a 1), ou None"""
+        chave_marca = self.resolver_marca(marca)
+        ano = ano_inteiro(ano)
+        tokens_modelo = tokens(modelo)
+        if chave_marca is None or ano is None or not tokens_modelo:
+            return None
+        return self.casar_tokens(chave_marca, ano, tokens_modelo[0],
+                                 frozenset(tokens_modelo) | frozenset(tokens(descricao)))
+
+    def _casar_tokens(self, chave_marca, ano, nome_modelo, tokens_anuncio):
+        # O ano do anúncio costuma ser o de fabricação; o ano-modelo da FIPE pode ser o seguinte
+        for ano_modelo in (ano, ano + 1):
+            postings = self.indice.get((chave_marca, ano_modelo))
+            if not postings or nome_modelo not in postings:
+                continue
+            melhor, melhor_pontos = None, 0.0
+            for posicao in postings[nome_modelo]:
+                entrada = self.entradas[posicao]
+                comuns = sum(self.idf[token] for token in entrada.tokens & tokens_anuncio)
+                total = sum(self.idf[token] for token in entrada.tokens)
+                # Tokens da versão FIPE ausentes no anúncio contam contra, os extras do anúncio não
+                pontos = comuns / total
+                if pontos > melhor_pontos:
+                    melhor, melhor_pontos = entrada, pontos
+            if melhor is not None and melhor_pontos >= self.min_confianca:
+                return melhor, melhor_pontos
+        return None
+
+
+class FipeMatchPipeline:
+    """Item pipeline que anota cada anúncio com o código FIPE e a diferença de preço.
+
+    Habilitado quando FIPE_CATALOGO_PATH aponta para o catálogo FIPE (snapshot
+    JSONL ou feed JSON do FipeCrawler). FIPE_MATCH_MIN_CONFIANCA é a fração
+    mínima do nome da versão FIPE que precisa aparecer no anúncio.
+    """
+
+    def __init__(self, catalogo, stats):
+        self.catalogo = catalogo
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('FIPE_CATALOGO_PATH')
+        if not path:
+            raise NotConfigured
+        inicio = time.perf_counter()
+        catalogo = CatalogoFipe.carregar(path, min_confianca=crawler.settings.getfloat('FIPE_MATCH_MIN_CONFIANCA', 0.5))
+        logger.info(f"Catálogo FIPE: {len(catalogo)} versões indexadas em {time.perf_counter() - inicio:.1f}s ({path})")
+        return cls(catalogo, crawler.stats)
+
+    def process_item(self, item, spider):
+        if not isinstance(item, AnuncioWebmotors) or not item.marca:
+            return item
+        casamento = self.catalogo.casar(item.marca, item.modelo, item.descricao, item.ano)
+        if casamento is None:
+            self.stats.inc_value('fipe_match/sem_match')
+            return item
+
+        entrada, confianca = casamento
+        self.stats.inc_value('fipe_match/casados')
+        item.codigo_fipe = entrada.codigo_fipe
+        item.valor_fipe = entrada.valor
+        preco = reais(item.preco)
+        if preco and entrada.valor:
+            item.diferenca_fipe = preco - entrada.valor
+        return item
+
+    def close_spider(self, spider):
+        info = self.catalogo.casar_tokens.cache_info()
+        logger.info(f"Casamento FIPE: {self.stats.get_value('fipe_match/casados', 0)} anúncios casados, "
+                    f"{self.stats.get_value('fipe_match/sem_match', 0)} sem correspondência "
+                    f"({info.hits} resolvidos pelo cache)")
@@ -0,0 +1,338 @@
+"""Fronteira de requisições compartilhada entre vários processos (sharding).
+
+Os workers não usam o scheduler em memória do Scrapy: toda requisição nova vai
+para a fronteira e cada worker "aluga" lotes de requisições pendentes. O aluguel
+expira; se o worker morrer antes de confirmar, as requisições voltam para a fila
+e são pegas por outro worker.
+
+Dois backends:
+
+- ``SqliteFrontier``: um arquivo sqlite, para workers na mesma máquina (ou em
+  um disco compartilhado com lock confiável).
+- ``RedisFrontier``: qualquer servidor compatível com Redis, para várias
+  máquinas. Requer o pacote ``redis``.
+"""
+import time
+import uuid
+import pickle
+import sqlite3
+import logging
+from collections import deque
+
+from scrapy.utils.request import request_from_dict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteFrontier:
+    """Fila de requisições com aluguel e confirmação em um arquivo sqlite"""
+
+    def __init__(self, path, duracao_aluguel=300, max_tentativas=3):
+        self.duracao_aluguel = duracao_aluguel
+        self.max_tentativas = max_tentativas
+        # timeout alto: vários processos disputam o lock de escrita
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS fronteira (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chave TEXT UNIQUE NOT NULL,
+                prioridade INTEGER NOT NULL,
+                dados BLOB NOT NULL,
+                estado TEXT NOT NULL DEFAULT 'pendente',
+                dono TEXT,
+                expira_em REAL,
+                tentativas INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_fronteira_fila ON fronteira (estado, prioridade DESC, id);
+        """)
+
+    def push(self, chave, prioridade, dados):
+        """Adiciona uma requisição; retorna False se a chave já passou pela fronteira"""
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO fronteira (chave, prioridade, dados) VALUES (?, ?, ?)",
+            (chave, prioridade, dados)
+        )
+        return cursor.rowcount > 0
+
+    def lease(self, dono, quantidade):
+        """Aluga até ``quantidade`` requisições pendentes; retorna [(id, dados)]"""
+        agora = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Aluguéis vencidos: o worker provavelmente morreu, devolve para a fila
+            self.conn.execute(
+                "UPDATE fronteira SET estado = 'pendente', dono = NULL "
+                "WHERE estado = 'alugado' AND expira_em < ? AND tentativas < ?",
+                (agora, self.max_tentativas)
+            )
+            self.conn.execute(
+                "UPDATE fronteira SET estado = 'falhou' "
+                "WHERE estado = 'alugado' AND expira_em < ? AND tentativas >= ?",
+                (agora, self.max_tentativas)
+            )
+            linhas = self.conn.execute(
+                "SELECT id, dados FROM fronteira WHERE estado = 'pendente' "
+                "ORDER BY prioridade DESC, id LIMIT ?",
+                (quantidade,)
+            ).fetchall()
+            if linhas:
+                self.conn.executemany(
+                    "UPDATE fronteira SET estado = 'alugado', dono = ?, expira_em = ?, "
+                    "tentativas = tentativas + 1 WHERE id = ?",
+                    [(dono, agora + self.duracao_aluguel, id_) for id_, _ in linhas]
+                )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return linhas
+
+    def ack(self, id_):
+        self.conn.execute(
+            "UPDATE fronteira SET estado = 'concluido', dados = x'' WHERE id = ?", (id_,)
+        )
+
+    def pendentes(self):
+        """Requisições pendentes ou alugadas (ainda podem gerar trabalho)"""
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM fronteira WHERE estado IN ('pendente', 'alugado')"
+        ).fetchone()[0]
+
+    def vazia(self):
+        """Indica se a fronteira nunca recebeu nenhuma requisição (execução nova)"""
+        return self.conn.execute("SELECT 1 FROM fronteira LIMIT 1").fetchone() is None
+
+    def resumo(self):
+        return dict(self.conn.execute("SELECT estado, COUNT(*) FROM fronteira GROUP BY estado"))
+
+    def close(self):
+        self.conn.close()
+
+
+class RedisFrontier:
+    """A mesma fila do SqliteFrontier em um servidor compatível com Redis"""
+
+    # Devolve aluguéis vencidos para a fila e aluga os próximos itens de forma atômica
+    LEASE = """
+        local vencidos = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+        for _, id in ipairs(vencidos) do
+            redis.call('ZREM', KEYS[2], id)
+            if tonumber(redis.call('HGET', KEYS[4], id) or '0') < tonumber(ARGV[4]) then
+                redis.call('ZADD', KEYS[1], redis.call('HGET', KEYS[5], id), id)
+            end
+        end
+        local itens = redis.call('ZPOPMIN', KEYS[1], ARGV[3])
+        local resultado = {}
+        for i = 1, #itens, 2 do
+            local id = itens[i]
+            redis.call('ZADD', KEYS[2], ARGV[1] + ARGV[2], id)
+            redis.call('HINCRBY', KEYS[4], id, 1)
+            table.insert(resultado, id)
+            table.insert(resultado, redis.call('HGET', KEYS[3], id))
+        end
+        return resultado
+    """
+
+    def __init__(self, url, prefixo='fronteira', duracao_aluguel=300, max_tentativas=3):
+        if redis is None:
+            raise ValueError("RedisFrontier requer o pacote 'redis'")
+        self.duracao_aluguel = duracao_aluguel
+        self.max_tentativas = max_tentativas
+        self.cliente = redis.Redis.from_url(url)
+        self.chaves = [f'{prefixo}:{nome}' for nome in ('fila', 'alugados', 'dados', 'tentativas', 'prioridades')]
+        self.vistos = f'{prefixo}:vistos'
+        self._lease = self.cliente.register_script(self.LEASE)
+
+    def push(self, chave, prioridade, dados):
+        if not self.cliente.sadd(self.vistos, chave):
+            return False
+        fila, _, dados_chave, _, prioridades = self.chaves
+        id_ = uuid.uuid4().hex
+        pipe = self.cliente.pipeline()
+        pipe.hset(dados_chave, id_, dados)
+        # ZPOPMIN pega o menor score: prioridade maior vira score menor
+        pipe.hset(prioridades, id_, -prioridade)
+        pipe.zadd(fila, {id_: -prioridade})
+        pipe.execute()
+        return True
+
+    def lease(self, dono, quantidade):
+        resposta = self._lease(
+            keys=self.chaves,
+            args=[time.time(), self.duracao_aluguel, quantidade, self.max_tentativas]
+        )
+        return [(resposta[i].decode(), resposta[i + 1]) for i in range(0, len(resposta), 2)]
+
+    def ack(self, id_):
+        _, alugados, dados, tentativas, prioridades = self.chaves
+        pipe = self.cliente.pipeline()
+        pipe.zrem(alugados, id_)
+        pipe.hdel(dados, id_)
+        pipe.hdel(tentativas, id_)
+        pipe.hdel(prioridades, id_)
+        pipe.execute()
+
+    def pendentes(self):
+        fila, alugados = self.chaves[:2]
+        return self.cliente.zcard(fila) + self.cliente.zcard(alugados)
+
+    def vazia(self):
+        return not self.cliente.exists(self.vistos)
+
+    def resumo(self):
+        fila, alugados = self.chaves[:2]
+        return {'pendente': self.cliente.zcard(fila), 'alugado': self.cliente.zcard(alugados)}
+
+    def close(self):
+        self.cliente.close()
+
+
+def abrir_fronteira(settings):
+    """Cria a fronteira configurada em FRONTIER_URL (redis://...) ou FRONTIER_PATH (sqlite)"""
+    duracao = settings.getint('FRONTIER_LEASE_SECONDS', 300)
+    tentativas = settings.getint('FRONTIER_MAX_ATTEMPTS', 3)
+    url = settings.get('FRONTIER_URL')
+    if url:
+        return RedisFrontier(url, settings.get('FRONTIER_PREFIX', 'fronteira'), duracao, tentativas)
+    return SqliteFrontier(settings.get('FRONTIER_PATH', 'fronteira.sqlite'), duracao, tentativas)
+
+
+class FrontierScheduler:
+    """Scheduler do Scrapy que guarda as requisições na fronteira compartilhada.
+
+    As requisições são alugadas em lotes (FRONTIER_BATCH) e só são confirmadas
+    depois que o callback terminou de gerar as requisições filhas (ver
+    ``FrontierSpiderMiddleware``). O spider só fecha quando não há mais nada
+    pendente nem alugado em nenhum worker.
+    """
+
+    def __init__(self, crawler, fronteira):
+        self.crawler = crawler
+        self.fronteira = fronteira
+        self.shard = crawler.settings.getint('FRONTIER_SHARD', 0)
+        self.lote = crawler.settings.getint('FRONTIER_BATCH', 16)
+        self.espera_semente = crawler.settings.getfloat('FRONTIER_SEED_TIMEOUT', 120)
+        self.dono = f'shard-{self.shard}-{uuid.uuid4().hex[:8]}'
+        self.buffer = deque()
+        self.spider = None
+        self.inicio = time.monotonic()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler, abrir_fronteira(crawler.settings))
+
+    def open(self, spider):
+        self.spider = spider
+
+    def close(self, reason):
+        logger.info(f"Fronteira ao fechar ({self.dono}): {self.fronteira.resumo()}")
+        self.fronteira.close()
+
+    def confirmar(self, request):
+        """Marca a requisição alugada como concluída (não volta para a fila)"""
+        id_ = request.meta.pop('frontier_id', None)
+        if id_ is not None:
+            self.fronteira.ack(id_)
+            self.crawler.stats.inc_value('frontier/acked')
+
+    def _chave(self, request):
+        if request.dont_filter:
+            # Requisições sem filtro de duplicadas sempre entram
+            return uuid.uuid4().hex
+        return self.crawler.request_fingerprinter.fingerprint(request).hex()
+
+    def enqueue_request(self, request):
+        # Uma requisição derivada (redirect, retry) copia o meta e substitui a que foi alugada
+        self.confirmar(request)
+
+        dados = pickle.dumps(request.to_dict(spider=self.spider), protocol=pickle.HIGHEST_PROTOCOL)
+        adicionada = self.fronteira.push(self._chave(request), request.priority, dados)
+        self.crawler.stats.inc_value('frontier/enqueued' if adicionada else 'frontier/duplicated')
+        return adicionada
+
+    def next_request(self):
+        if not self.buffer:
+            for id_, dados in self.fronteira.lease(self.dono, self.lote):
+                request = request_from_dict(pickle.loads(dados), spider=self.spider)
+                request.meta['frontier_id'] = id_
+                self.buffer.append(request)
+        if not self.buffer:
+            return None
+        self.crawler.stats.inc_value('frontier/dequeued')
+        return self.buffer.popleft()
+
+    def has_pending_requests(self):
+        if self.buffer:
+            return True
+        # Os outros workers esperam o worker 0 semear a fronteira
+        if (self.shard != 0 and time.monotonic() - self.inicio < self.espera_semente
+                and self.fronteira.vazia()):
+            return True
+        # Aluguéis de outros workers ainda podem gerar trabalho: continua esperando
+        return self.fronteira.pendentes() > 0
+
+    def __len__(self):
+        return len(self.buffer)
+
+
+def _scheduler(crawler):
+    scheduler = crawler.engine.slot.scheduler
+    return scheduler if isinstance(scheduler, FrontierScheduler) else None
+
+
+class FrontierSpiderMiddleware:
+    """Semeia a fronteira e confirma as requisições depois do callback.
+
+    Só o worker 0 (FRONTIER_SHARD) gera as requisições iniciais, e só quando a
+    fronteira está vazia; numa retomada os workers continuam do que ficou
+    pendente. A confirmação acontece depois que a saída do callback foi
+    consumida, então um worker que morre no meio do parse não perde as
+    requisições filhas: o aluguel vence e outro worker refaz a página.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.shard = crawler.settings.getint('FRONTIER_SHARD', 0)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_start_requests(self, start_requests, spider):
+        scheduler = _scheduler(self.crawler)
+        if scheduler is not None and (self.shard != 0 or not scheduler.fronteira.vazia()):
+            return
+        yield from start_requests
+
+    def process_spider_output(self, response, result, spider):
+        yield from result
+        scheduler = _scheduler(self.crawler)
+        if scheduler is not None:
+            scheduler.confirmar(response.request)
+
+    def process_spider_exception(self, response, exception, spider):
+        scheduler = _scheduler(self.crawler)
+        if scheduler is not None:
+            scheduler.confirmar(response.request)
+
+
+class FrontierDownloaderMiddleware:
+    """Confirma requisições cujo download falhou de vez (depois do RetryMiddleware)"""
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_exception(self, request, exception, spider):
+        scheduler = _scheduler(self.crawler)
+        if scheduler is not None:
+            scheduler.confirmar(request)
@@ -1,10 +1,69 @@
+import json
 import scrapy
-import re
 import logging
-import time
-import random
+import itertools
+from urllib.parse import urlencode
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
 
-class WebmotorsSpider(scrapy.Spider):
+import json_codec
+from items import AnuncioWebmotors, Imagem
+from extraction_schema import esquema
+from image_pipeline import imagem_util
+from page_scan import contem
+from debug_snapshots import SnapshotStore
+from listing_index import ListingIndex, NOVO, INALTERADO, DUPLICADO, REMOVIDO
+from metrics import ContadoresMixin
+
+# Nomes dos parâmetros da busca de estoque da Webmotors
+PARAMETROS_BUSCA = {
+    'estado': 'estadocidade',
+    'marca': 'marca1',
+    'preco_de': 'precode',
+    'preco_ate': 'precoate',
+    'pagina': 'page',
+}
+
+# Unidades da federação: partição padrão por estado, para a busca cobrir o estoque todo
+UFS = ['ac', 'al', 'ap', 'am', 'ba', 'ce', 'df', 'es', 'go', 'ma', 'mt', 'ms', 'mg', 'pa',
+       'pb', 'pr', 'pe', 'pi', 'rj', 'rn', 'rs', 'ro', 'rr', 'sc', 'sp', 'se', 'to']
+
+
+def faixas_preco(valor):
+    """WEBMOTORS_FAIXAS_PRECO como lista de (mínimo, máximo), com None para o extremo aberto.
+
+    Aceita a lista do custom_settings, JSON (``[[0, 40000], [40000, null]]``) ou
+    pares ``mínimo-máximo`` separados por vírgula (``0-40000,40000-``), que é o
+    formato prático no ``-s``. Levanta ValueError se o valor for mal formado.
+    """
+    if isinstance(valor, str):
+        texto = valor.strip()
+        if texto.startswith('['):
+            try:
+                valor = json.loads(texto)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"WEBMOTORS_FAIXAS_PRECO não é JSON válido: {e}")
+        else:
+            valor = []
+            for par in filter(None, (par.strip() for par in texto.split(','))):
+                if '-' not in par:
+                    raise ValueError(f"WEBMOTORS_FAIXAS_PRECO espera mínimo-máximo, recebeu {par!r}")
+                valor.append(par.split('-', 1))
+
+    faixas = []
+    for faixa in valor or []:
+        if not isinstance(faixa, (list, tuple)) or len(faixa) != 2:
+            raise ValueError(f"Faixa de preço inválida em WEBMOTORS_FAIXAS_PRECO: {faixa!r}")
+        try:
+            minimo, maximo = (None if extremo in (None, '') else int(extremo) for extremo in faixa)
+        except (TypeError, ValueError):
+            raise ValueError(f"Faixa de preço inválida em WEBMOTORS_FAIXAS_PRECO: {faixa!r}")
+        if minimo is not None and maximo is not None and minimo >= maximo:
+            raise ValueError(f"Faixa de preço vazia em WEBMOTORS_FAIXAS_PRECO: {faixa!r}")
+        faixas.append((minimo, maximo))
+    return faixas
+
+class WebmotorsSpider(ContadoresMixin, scrapy.Spider):
     name = "webmotors"
     start_urls = ["https://www.webmotors.com.br/carros/estoque"]
     
@@ -12,10 +71,34 @@ class WebmotorsSpider(scrapy.Spider):
     custom_settings = {
         # Rotação de User Agents
         'USER_AGENT': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36',
-        'DOWNLOAD_DELAY': 2.5,  # Aumentado para reduzir detecção
+        'DOWNLOAD_DELAY': 2.5,  # Atraso inicial, ajustado pelo AdaptiveThrottle
         'RANDOMIZE_DOWNLOAD_DELAY': True,
-        'CONCURRENT_REQUESTS': 1,  # Reduzido para parecer mais humano
+        'CONCURRENT_REQUESTS': 8,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': 1,  # Começa com uma por host, o throttle aumenta se o site estiver saudável
+        'DOWNLOADER_MIDDLEWARES': {
+            'throttle.AdaptiveThrottle': 560,
+            # Circuit breaker por host e novas tentativas limitadas por orçamento (ver circuit_breaker.py)
+            'circuit_breaker.CircuitBreakerMiddleware': 570,
+            'scrapy.downloadermiddlewares.retry.RetryMiddleware': None,
+            'circuit_breaker.RetryBudgetMiddleware': 550,
+            # Sessões aquecidas em paralelo, escolhidas pela saúde (ver session_pool.py): antes do CookiesMiddleware
+            # e depois do RetryMiddleware, para as novas tentativas continuarem na mesma sessão
+            'session_pool.SessionPoolMiddleware': 540,
+        },
+        'SESSION_POOL_TAMANHO': 3,  # Sessões (cookiejars) simultâneas, uma página por vez em cada
+        'SESSION_POOL_URL_AQUECIMENTO': 'https://www.webmotors.com.br/',
+        'SESSION_POOL_LATENCIA_ALVO': 2.0,  # Respostas mais lentas que isso reduzem a saúde da sessão
+        'SESSION_POOL_SAUDE_MIN': 0.4,  # Abaixo disso a sessão é aposentada e outra é aquecida
+        'SESSION_POOL_BLOQUEIOS': 2,  # Bloqueios seguidos que aposentam a sessão
+        'SESSION_POOL_ESPERA': 10,  # Segundos até aquecer a sessão que substitui uma aposentada
+        'CIRCUIT_BREAKER_LIMITE': 3,  # Bloqueios seguidos que abrem o circuito do host
+        'CIRCUIT_BREAKER_BACKOFF': 30,  # Pausa da primeira abertura, dobrada a cada sonda bloqueada
+        'CIRCUIT_BREAKER_BACKOFF_MAX': 600,
+        'RETRY_BUDGET_RATIO': 0.1,  # Novas tentativas limitadas a 10% das requisições
+        'ADAPTIVE_THROTTLE_MAX_CONCURRENCY': 3,
+        'ADAPTIVE_THROTTLE_MIN_DELAY': 1.0,
         'LOG_LEVEL': 'INFO',
+        'FEED_EXPORTERS': json_codec.FEED_EXPORTERS,
         'COOKIES_ENABLED': True,
         'DEFAULT_REQUEST_HEADERS': {
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
@@ -30,101 +113,276 @@ class WebmotorsSpider(scrapy.Spider):
             'Upgrade-Insecure-Requests': '1',
             'Cache-Control': 'max-age=0',
         },
-        'RETRY_HTTP_CODES': [403, 500, 502, 503, 504, 408, 429],
-        'RETRY_TIMES': 5,
+        # 403 não é refeito pelo RetryMiddleware: chega ao parse, que trata o bloqueio
+        'RETRY_HTTP_CODES': [500, 502, 503, 504, 408, 429],
+        'HTTPERROR_ALLOWED_CODES': [403],
+        'RETRY_TIMES': 3,
+        # Snapshots de debug: fração das páginas amostradas e espaço máximo em disco
+        'DEBUG_SNAPSHOT_DIR': 'debug_snapshots',
+        'DEBUG_SNAPSHOT_SAMPLE_RATE': 0.05,
+        'DEBUG_SNAPSHOT_QUOTA': 100 * 1024 * 1024,
+        # Exportação colunar (Parquet/Arrow) com preços, km e anos tipados; None desliga (ver columnar_export.py)
+        'ITEM_PIPELINES': {
+            'fipe_matcher.FipeMatchPipeline': 700,
+            'image_pipeline.ImagemPipeline': 750,
+            'columnar_export.ColumnarExportPipeline': 800,
+        },
+        # Download das imagens dos anúncios e miniaturas (requer Pillow); None desliga (ver image_pipeline.py)
+        'IMAGENS_DIR': None,
+        'IMAGENS_CONCORRENCIA': 8,
+        'IMAGENS_TAXA': 20.0,  # Downloads por segundo
+        'IMAGENS_PROCESSOS': 2,  # Processos que decodificam e reduzem as imagens
+        'IMAGENS_MINIATURA': [320, 240],
+        'IMAGENS_FALHA_TTL': 7 * 24 * 3600,  # Segundos até tentar de novo uma imagem que falhou
+        'COLUMNAR_EXPORT_DIR': None,
+        'COLUMNAR_EXPORT_FORMAT': 'parquet',
+        # Métricas ao vivo: endpoint Prometheus (None desliga) e arquivo periódico (ver metrics.py)
+        'EXTENSIONS': {'metrics.MetricsExtension': 500},
+        'SPIDER_MIDDLEWARES': {
+            # Retém as páginas de estoque até uma sessão do pool ficar ociosa (ver session_pool.py)
+            'session_pool.SessionPoolSpiderMiddleware': 50,
+            'metrics.MetricsSpiderMiddleware': 990,
+            'profiling.ProfilingSpiderMiddleware': 995,
+        },
+        'METRICS_PORT': None,
+        'METRICS_FILE': 'metricas_estoque.json',
+        'METRICS_INTERVAL': 30,
+        # Modo de profiling (CPU e alocações por callback): -s PROFILE_DIR=perfil (ver profiling.py)
+        'PROFILE_DIR': None,
+        'LISTING_INDEX_PATH': 'anuncios_webmotors.sqlite',
+        # Catálogo FIPE (snapshot do fipe_crawler -a completo=1 ou veiculos.json) para o casamento
+        # dos anúncios com códigos FIPE e a diferença de preço; None desliga (ver fipe_matcher.py)
+        'FIPE_CATALOGO_PATH': None,
+        'FIPE_MATCH_MIN_CONFIANCA': 0.5,
+        # Partições da busca de estoque: cada combinação estado x marca x faixa de preço
+        # é paginada em paralelo pelas sessões do pool. Lista vazia = sem filtro.
+        'WEBMOTORS_ESTADOS': UFS,
+        'WEBMOTORS_MARCAS': [],
+        # Também pelo -s, como JSON ou "0-40000,40000-80000,80000-150000,150000-"
+        'WEBMOTORS_FAIXAS_PRECO': [(0, 40000), (40000, 80000), (80000, 150000), (150000, None)],
+        'WEBMOTORS_PARTICOES': 0,  # Máximo de partições usadas (0 = todas)
+        'WEBMOTORS_MAX_PAGINAS': 500,  # Limite de páginas por partição
+        'WEBMOTORS_TENTATIVAS_BLOQUEIO': 3,  # Novas tentativas da mesma página quando bloqueada
     }
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, modo='completo', *args, **kwargs):
         super(WebmotorsSpider, self).__init__(*args, **kwargs)
-        self.total_carros = 0
+        # Modo delta: emite só anúncios novos, alterados ou removidos desde a última execução
+        # Ex: scrapy runspider get-cars.py -a modo=delta
+        self.delta = modo == 'delta'
+        self.removidos_emitidos = False
+        # Motivos pelos quais a busca desta execução não cobriu todo o estoque
+        # (com algum, o modo delta não emite removidos: o anúncio pode só não ter sido visto)
+        self.incompleta = []
     
-    def start_requests(self):
-        """Inicializa as requisições com parâmetros adicionais"""
-        for url in self.start_urls:
-            # Primeiro acessa a página inicial normal
-            yield scrapy.Request(
-                url='https://www.webmotors.com.br/',
-                callback=self.visitar_pagina_inicial,
-                dont_filter=True
-            )
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(WebmotorsSpider, cls).from_crawler(crawler, *args, **kwargs)
+        # Validada aqui para um -s mal formado falhar antes de começar a busca
+        spider.faixas_preco = faixas_preco(crawler.settings.get('WEBMOTORS_FAIXAS_PRECO'))
+        # Cópias das páginas para debug, gravadas em segundo plano
+        spider.snapshots = SnapshotStore.from_settings(crawler.settings)
+        # Índice dos anúncios já vistos, para deduplicar e calcular o delta
+        spider.indice = ListingIndex(crawler.settings.get('LISTING_INDEX_PATH', 'anuncios_webmotors.sqlite'))
+        crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(spider.erro_callback, signal=signals.spider_error)
+        return spider
+    
+    @property
+    def esquema_card(self):
+        """Seletores e normalização dos campos do card (esquemas_extracao.json), já compilados"""
+        return esquema('webmotors_card', getattr(self, 'settings', None))
+    
+    def marcar_incompleta(self, motivo):
+        """Registra que a busca não cobriu todo o estoque (o delta não emite removidos)"""
+        self.contar('busca/incompleta')
+        self.incompleta.append(motivo)
     
-    def visitar_pagina_inicial(self, response):
-        """Visita a página inicial primeiro para obter cookies"""
-        self.logger.info("Visitando página inicial para estabelecer sessão")
+    def particoes(self):
+        """Combinações de estado, marca e faixa de preço que dividem a busca de estoque"""
+        settings = self.settings
+        estados = settings.getlist('WEBMOTORS_ESTADOS') or [None]
+        marcas = settings.getlist('WEBMOTORS_MARCAS') or [None]
+        faixas = self.faixas_preco or [(None, None)]
         
-        # Pausa para simular comportamento de navegação humana
-        time.sleep(random.uniform(1, 3))
+        particoes = [
+            {'estado': estado, 'marca': marca, 'preco_de': faixa[0], 'preco_ate': faixa[1]}
+            for estado, marca, faixa in itertools.product(estados, marcas, faixas)
+        ]
+        limite = settings.getint('WEBMOTORS_PARTICOES', 0)
+        if limite and limite < len(particoes):
+            self.marcar_incompleta(f"só {limite} de {len(particoes)} partições (WEBMOTORS_PARTICOES)")
+            return particoes[:limite]
+        return particoes
+    
+    def url_estoque(self, particao, pagina):
+        """Monta a URL da busca de estoque para a partição e página"""
+        filtros = dict(particao, pagina=pagina if pagina > 1 else None)
+        parametros = {PARAMETROS_BUSCA[campo]: valor for campo, valor in filtros.items() if valor is not None}
+        url = self.start_urls[0]
+        return f"{url}?{urlencode(parametros)}" if parametros else url
+    
+    def start_requests(self):
+        """Inicializa as requisições com parâmetros adicionais"""
+        particoes = self.particoes()
+        self.logger.info(f"Busca de estoque dividida em {len(particoes)} partições")
         
-        # Visita a página de estoque após obter cookies da página inicial
-        yield scrapy.Request(
-            url='https://www.webmotors.com.br/carros/estoque',
+        for particao in particoes:
+            # A página inicial (cookies) é visitada pelas sessões do pool, que atendem as partições
+            # A pausa para simular navegação humana é feita pelo AdaptiveThrottle sem bloquear o reactor
+            yield self.pagina_request(particao, 1, atraso_aleatorio=(1, 3))
+    
+    def pagina_request(self, particao, pagina, tentativa=0, **meta):
+        """Requisição de uma página de estoque; páginas menores têm prioridade para que
+        todas as partições entreguem resultados logo no começo. O cookiejar é o da
+        sessão do pool que atender a requisição (ver session_pool.py)"""
+        return scrapy.Request(
+            url=self.url_estoque(particao, pagina),
             callback=self.parse,
-            dont_filter=True,
-            meta={'cookiejar': 1}
+            errback=self.falha_pagina,
+            dont_filter=tentativa > 0,
+            priority=-pagina,
+            meta=dict(meta, sessao_pool=True, particao=particao, pagina=pagina, tentativa_bloqueio=tentativa,
+                      retentativa=tentativa > 0)
         )
+    
+    def eh_bloqueio(self, response):
+        """Reconhece as páginas de bloqueio (também usado pelo CircuitBreakerMiddleware)"""
+        if not response.url.startswith(('http://', 'https://')):
+            return False
+        return response.status == 403 or contem(response, "acesso negado") or len(response.body) < 5000
 
     def parse(self, response):
         """Extrai informações básicas dos carros na página"""
+        particao = response.meta['particao']
+        pagina = response.meta['pagina']
+        
         # Verificar se a resposta não é um bloqueio
-        if response.status == 403 or "acesso negado" in response.text.lower() or len(response.body) < 5000:
-            self.logger.error("ACESSO BLOQUEADO! Tentando abordagem alternativa...")
-            yield scrapy.Request(
-                url='https://www.webmotors.com.br/carros/estoque?o=1',  # Tenta com parâmetro diferente
-                callback=self.parse,
-                dont_filter=True,
-                meta={'cookiejar': 1}
-            )
+        if self.eh_bloqueio(response):
+            self.snapshots.capturar(response, motivo='bloqueio', forcar=True)
+            self.contar('bloqueios')
+            tentativa = response.meta.get('tentativa_bloqueio', 0) + 1
+            # As novas tentativas do bloqueio também gastam do orçamento global (ver circuit_breaker.py)
+            orcamento = getattr(self.crawler, 'orcamento_retentativas', None)
+            if (tentativa > self.settings.getint('WEBMOTORS_TENTATIVAS_BLOQUEIO', 3)
+                    or (orcamento is not None and not orcamento.gastar())):
+                self.logger.error(f"ACESSO BLOQUEADO! Desistindo da partição {particao} na página {pagina}")
+                self.contar('particoes/abandonadas')
+                self.marcar_incompleta(f"partição {particao} abandonada na página {pagina}")
+                return
+            self.logger.error(f"ACESSO BLOQUEADO! Nova tentativa {tentativa} de {response.url}")
+            # Vai para a sessão mais saudável do pool, não necessariamente a que foi bloqueada
+            yield self.pagina_request(particao, pagina, tentativa, atraso_aleatorio=(2 * tentativa, 5 * tentativa))
             return
         
         self.logger.info(f"Processando página: {response.url}")
         
-        # Salvar HTML para debug
-        with open('webmotors_page.html', 'w', encoding='utf-8') as f:
-            f.write(response.text)
-
+        # Salvar HTML para debug (amostrado, em segundo plano)
+        self.snapshots.capturar(response)
         
-        
-        # Selecionando todos os cards de veículos (tentando seletores alternativos)
-        cards = response.css("div._Card_18bss_1, div[class*='Card_'], div.CardAd")
-        
-        self.logger.info(f"Encontrados {len(cards)} cards nesta página")
-        
-        if not cards:
-            # Tenta selecionar qualquer coisa que pareça um card de carro
+        # Selecionando todos os cards de veículos (o esquema traz o seletor padrão e os alternativos)
+        cards, seletor = self.esquema_card.selecionar(response.selector.root)
+
+        if seletor != 0:
             self.logger.warning("Nenhum card encontrado com o seletor padrão, tentando alternativas...")
-            cards = response.css("div[class*='Card'], div.card, div[data-qa*='vehicle']")
-            self.logger.info(f"Encontrados {len(cards)} cards com seletor alternativo")
+            self.contar('extracao/fallback/seletor_cards')
+            self.snapshots.capturar(response, motivo='seletor alternativo' if cards else 'sem cards', forcar=True)
+
+        self.logger.info(f"Encontrados {len(cards)} cards nesta página")
         
-        for car in cards:
+        novos_na_pagina = 0
+        # Os campos brutos de todos os cards saem de uma vez pelo esquema compilado
+        for campos in self.esquema_card.extrair_lote(cards):
             # Obtém informações básicas
-            result = self.extract_car_info(car)
+            result = self.extract_car_info(campos)
             
             # Se encontrou pelo menos a marca, retorna os dados
-            if result.get('marca'):
-                self.total_carros += 1
+            if result is not None and result.marca:
+                situacao = self.indice.registrar(result.link, result) if result.link else NOVO
+                if situacao == DUPLICADO:
+                    continue
+                self.contar('anuncios/vistos')
+                novos_na_pagina += 1
+                
+                if self.delta:
+                    if situacao == INALTERADO:
+                        continue
+                    result.delta = situacao
+                
+                self.contar('anuncios/emitidos')
                 yield result
+        
+        # Próxima página da partição; para quando a página não traz anúncios inéditos
+        # (o site repete a última página quando a busca acaba)
+        max_paginas = self.settings.getint('WEBMOTORS_MAX_PAGINAS', 500)
+        if novos_na_pagina and pagina < max_paginas:
+            yield self.pagina_request(particao, pagina + 1)
+        elif novos_na_pagina:
+            self.logger.warning(f"Partição {particao} cortada no limite de {max_paginas} páginas")
+            self.marcar_incompleta(f"partição {particao} cortada na página {pagina} (WEBMOTORS_MAX_PAGINAS)")
+        else:
+            self.logger.info(f"Partição {particao} concluída na página {pagina}")
+    
+    def falha_pagina(self, failure):
+        """Errback das páginas de estoque: erro HTTP, novas tentativas ou orçamento esgotados"""
+        request = failure.request
+        self.logger.error(f"Página {request.meta['pagina']} da partição {request.meta['particao']} "
+                          f"perdida: {failure.getErrorMessage()}")
+        self.contar('paginas/falhas')
+        self.marcar_incompleta(f"página {request.meta['pagina']} da partição {request.meta['particao']} perdida")
+    
+    def erro_callback(self, failure, response, spider):
+        """Exceção no parse de uma página de estoque (sinal spider_error)"""
+        if 'particao' in response.meta:
+            self.marcar_incompleta(f"erro no parse de {response.url}")
     
-    def extract_car_info(self, car):
-        """Extrai informações básicas de um card de carro usando principalmente atributos das imagens"""
+    def spider_idle(self):
+        """No modo delta, antes de fechar agenda a emissão dos anúncios que sumiram"""
+        # Sem nenhum anúncio visto (bloqueio, por exemplo) não dá para dizer o que foi removido
+        if not self.delta or self.removidos_emitidos or not self.contagem('anuncios/vistos'):
+            return
+        # Páginas ainda retidas no pool de sessões: a busca não acabou
+        pool = getattr(self.crawler, 'pool_sessoes', None)
+        if pool is not None and pool.pendentes():
+            return
+        self.removidos_emitidos = True
+        if pool is not None and self.crawler.stats.get_value('session_pool/descartadas'):
+            self.marcar_incompleta("páginas descartadas pelo pool de sessões")
+        if self.incompleta:
+            # Os anúncios não vistos continuam no índice; a próxima busca completa decide
+            self.logger.warning(f"Busca incompleta, removidos não emitidos: {'; '.join(self.incompleta[:5])}"
+                                f"{f' (e mais {len(self.incompleta) - 5})' if len(self.incompleta) > 5 else ''}")
+            return
+        self.crawler.engine.crawl(
+            scrapy.Request('data:,', callback=self.emitir_removidos, dont_filter=True)
+        )
+        raise DontCloseSpider
+    
+    def emitir_removidos(self, response):
+        """Emite um item para cada anúncio do índice que não apareceu nesta execução"""
+        for link in self.indice.removidos():
+            self.contar('anuncios/emitidos')
+            yield AnuncioWebmotors(link=link, delta=REMOVIDO)
+    
+    def extract_car_info(self, campos):
+        """Monta o anúncio a partir dos campos do card (esquema webmotors_card), usando principalmente atributos das imagens"""
         try:
-            # Extração baseada em imagens - nova abordagem prioritária
-            images = car.css('img')
+            # Preço, ano, km, localização e link já vêm normalizados pelo esquema
+            images = campos['imagens']
             marca_modelo = None
             tipo_veiculo = None
             
             # Procura em todas as imagens por atributos úteis
             for img in images:
-                title_attr = img.css('::attr(title)').get()
-                alt_attr = img.css('::attr(alt)').get()
+                title_attr = img.get('title')
+                alt_attr = img.get('alt')
                 
                 # Se encontrou informações nos atributos da imagem
                 if title_attr and len(title_attr.strip()) > 3:
                     marca_modelo = title_attr.strip()
-                    self.logger.info(f"Informação extraída do title da imagem: {marca_modelo}")
                 
                 if alt_attr and len(alt_attr.strip()) > 3:
                     tipo_veiculo = alt_attr.strip()
-                    self.logger.info(f"Informação extraída do alt da imagem: {tipo_veiculo}")
                 
                 # Se encontrou ambas informações, podemos parar
                 if marca_modelo and tipo_veiculo:
@@ -136,42 +394,17 @@ class WebmotorsSpider(scrapy.Spider):
                 marca, modelo = self.extract_marca_modelo(marca_modelo)
             
             # Busca por título caso não tenha encontrado nas imagens
-            title = (
-                marca_modelo or 
-                car.css("h2._web-title-medium_qtpsh_51::text, h2[class*='title']::text").get() or
-                ""
-            ).strip()
+            title = (marca_modelo or campos['titulo'] or "").strip()
             
             # Descrição/versão - pode usar o tipo_veiculo do alt
-            descricao = (
-                tipo_veiculo or
-                car.css("h3._Description_70j0p_97::text, h3._body-regular-small_qtpsh_152::text, h3[class*='Description']::text").get() or
-                car.css("p[class*='description']::text").get() or
-                car.css("div[class*='description']::text").get() or
-                ""
-            ).strip()
+            descricao = (tipo_veiculo or campos['descricao'] or "").strip()
             
-            # Preço (com limpeza básica)
-            preco_raw = car.css("p._body-bold-large_qtpsh_78::text, p[class*='price']::text, span[class*='price']::text").get() or ""
-            preco = re.sub(r'[^\d]', '', preco_raw)
-            
-            # Ano (tenta extrair do texto)
-            ano_text = car.css("div._CellItem_70j0p_62 p::text, p[class*='year']::text, span[class*='year']::text").get() or ""
-            ano_match = re.search(r'(\d{4})', ano_text)
-            ano = ano_match.group(1) if ano_match else None
-            
-            # Quilometragem
-            km_text = car.css("div._CellItem_70j0p_62:nth-child(2) p::text, p[class*='km']::text, span[class*='km']::text").get() or ""
-            km = re.sub(r'[^\d]', '', km_text) if km_text else None
-            
-            # Localização
-            localizacao = car.css("div._BodyItem_70j0p_47 p::text, p[class*='location']::text").get() or ""
-            localizacao = localizacao.strip()
-
-            # Link do anúncio
-            link = car.css("a::attr(href)").get() or ""
-            if link and not link.startswith("http"):
-                link = f"https://www.webmotors.com.br{link}"
+            # Preço e km só com dígitos, ano com 4 dígitos e link absoluto (normalizados pelo esquema)
+            preco = campos['preco']
+            ano = campos['ano']
+            km = campos['km']
+            localizacao = campos['localizacao']
+            link = campos['link']
             
             # Se não tiver marca/modelo da imagem, tenta do título
             if not marca and not modelo and title:
@@ -181,9 +414,9 @@ class WebmotorsSpider(scrapy.Spider):
             imagens = []
             # Capturar URLs de imagens com seus atributos
             for img in images:
-                img_url = img.css('::attr(src)').get() or img.css('::attr(data-src)').get()
+                img_url = img.get('src') or img.get('data-src')
                 if img_url:
-                    if img_url and not img_url.endswith('.gif') and not 'placeholder' in img_url.lower():
+                    if imagem_util(img_url):
                         # Garantir que é URL completa
                         if img_url.startswith('//'):
                             img_url = f"https:{img_url}"
@@ -191,34 +424,28 @@ class WebmotorsSpider(scrapy.Spider):
                             img_url = f"https://www.webmotors.com.br{img_url}"
                         
                         # Guardar URL com metadados da imagem para referência
-                        img_info = {
-                            'url': img_url,
-                            'title': img.css('::attr(title)').get(),
-                            'alt': img.css('::attr(alt)').get()
-                        }
-                        
-                        imagens.append(img_info)
+                        imagens.append(Imagem(img_url, img.get('title'), img.get('alt')))
             
             # Montagem do resultado
-            return {
-                "marca": marca,
-                "modelo": modelo,
-                "descricao": descricao,
-                "preco": preco,
-                "ano": ano,
-                "km": km,
-                "localizacao": localizacao,
-                "link": link,
-                "imagens": imagens,
+            return AnuncioWebmotors(
+                marca=marca,
+                modelo=modelo,
+                descricao=descricao,
+                preco=preco,
+                ano=ano,
+                km=km,
+                localizacao=localizacao,
+                link=link,
+                imagens=imagens,
                 # Metadados originais da imagem para debug
-                "image_title": marca_modelo,
-                "image_alt": tipo_veiculo
-            }
+                image_title=marca_modelo,
+                image_alt=tipo_veiculo,
+            )
             
         except Exception as e:
             self.logger.error(f"Erro na extração: {e}")
-            # Em caso de erro, retorna objeto vazio
-            return {}
+            # Em caso de erro, o card é descartado
+            return None
     
     def extract_marca_modelo(self, title):
         """Extrai marca e modelo do título com tratamento para casos especiais"""
@@ -251,4 +478,6 @@ class WebmotorsSpider(scrapy.Spider):
     def closed(self, reason):
         """Método chamado quando o spider é fechado"""
         self.logger.info(f"Spider fechado: {reason}")
-        self.logger.info(f"Total de carros extraídos: {self.total_carros}")
\ No newline at end of file
+        self.logger.info(f"Total de carros extraídos: {self.contagem('anuncios/emitidos')}")
+        self.snapshots.close()
+        self.indice.close()
\ No newline at end of file
@@ -0,0 +1,315 @@
+"""Download das imagens dos anúncios e geração das miniaturas.
+
+O ImagemPipeline baixa as ``imagens`` de cada item pelo ClienteApi
+(fipe_api.py): pool de conexões próprio, concorrência limitada por
+IMAGENS_CONCORRENCIA e taxa por IMAGENS_TAXA, sem passar pelo DOWNLOAD_DELAY
+do spider. Decodificar e reduzir a imagem fica num pool de processos
+(IMAGENS_PROCESSOS), então o reactor nunca faz trabalho pesado de imagem.
+
+O armazenamento em IMAGENS_DIR é endereçado pelo conteúdo:
+
+    originais/<ab>/<sha1>.<formato>    imagem como veio do servidor
+    miniaturas/<ab>/<sha1>.jpg         miniatura de até IMAGENS_MINIATURA pixels
+    imagens.sqlite                     hash da URL -> hash do conteúdo -> arquivos
+
+URLs já baixadas (em qualquer execução) não são baixadas de novo, e a mesma
+foto publicada em URLs diferentes é gravada e reduzida uma vez só. URLs que
+responderam com erro ou trouxeram uma imagem inválida ficam registradas e só
+são tentadas de novo depois de IMAGENS_FALHA_TTL segundos; falhas de rede
+(timeout, conexão recusada) não são registradas. Cada
+Imagem do item recebe ``arquivo`` e ``miniatura``, relativos a IMAGENS_DIR.
+"""
+import os
+import io
+import time
+import sqlite3
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet import defer
+from w3lib.url import safe_url_string
+
+from fipe_api import ClienteApi
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+
+def imagem_util(url):
+    """Descarta GIFs e placeholders (ícones de carregamento, não fotos do carro)"""
+    return bool(url) and not url.endswith('.gif') and 'placeholder' not in url.lower()
+
+
+def sha1(dados):
+    return hashlib.sha1(dados).hexdigest()
+
+
+def processar_imagem(corpo, diretorio, conteudo_hash, tamanho, qualidade):
+    """Roda no pool de processos: valida a imagem, grava o original e a miniatura.
+
+    Retorna (original, miniatura, largura, altura), com caminhos relativos a ``diretorio``.
+    """
+    imagem = Image.open(io.BytesIO(corpo))
+    imagem.load()
+    largura, altura = imagem.size
+    formato = (imagem.format or 'bin').lower()
+    original = os.path.join('originais', conteudo_hash[:2], f'{conteudo_hash}.{formato}')
+    miniatura = os.path.join('miniaturas', conteudo_hash[:2], f'{conteudo_hash}.jpg')
+
+    os.makedirs(os.path.join(diretorio, os.path.dirname(original)), exist_ok=True)
+    with open(os.path.join(diretorio, original), 'wb') as f:
+        f.write(corpo)
+
+    if imagem.mode != 'RGB':
+        imagem = imagem.convert('RGB')
+    imagem.thumbnail(tamanho)
+    os.makedirs(os.path.join(diretorio, os.path.dirname(miniatura)), exist_ok=True)
+    # Grava com outro nome e renomeia: a miniatura só existe depois de completa
+    temporario = os.path.join(diretorio, miniatura + '.tmp')
+    imagem.save(temporario, 'JPEG', quality=qualidade)
+    os.replace(temporario, os.path.join(diretorio, miniatura))
+    return original, miniatura, largura, altura
+
+
+class ImagemStore:
+    """Índice (sqlite) das imagens já baixadas, por hash da URL e do conteúdo"""
+
+    def __init__(self, diretorio, lote_commit=200):
+        self.diretorio = diretorio
+        self.lote_commit = lote_commit
+        self._pendentes = 0
+        os.makedirs(diretorio, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(diretorio, 'imagens.sqlite'))
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS urls (
+                url_hash TEXT PRIMARY KEY,
+                conteudo_hash TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS conteudos (
+                conteudo_hash TEXT PRIMARY KEY,
+                original TEXT NOT NULL,
+                miniatura TEXT NOT NULL,
+                largura INTEGER,
+                altura INTEGER,
+                tamanho INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS falhas (
+                url_hash TEXT PRIMARY KEY,
+                motivo TEXT NOT NULL,
+                quando REAL NOT NULL
+            );
+        """)
+
+    def por_url(self, url_hash):
+        """(original, miniatura) da URL já baixada, ou None"""
+        return self.conn.execute(
+            "SELECT c.original, c.miniatura FROM urls u JOIN conteudos c USING (conteudo_hash) WHERE u.url_hash = ?",
+            (url_hash,)
+        ).fetchone()
+
+    def por_conteudo(self, conteudo_hash):
+        return self.conn.execute(
+            "SELECT original, miniatura FROM conteudos WHERE conteudo_hash = ?", (conteudo_hash,)
+        ).fetchone()
+
+    def falhou(self, url_hash, ttl):
+        """Motivo da falha da URL registrada há menos de ``ttl`` segundos, ou None"""
+        linha = self.conn.execute(
+            "SELECT motivo FROM falhas WHERE url_hash = ? AND quando > ?", (url_hash, time.time() - ttl)
+        ).fetchone()
+        return linha[0] if linha else None
+
+    def gravar_falha(self, url_hash, motivo):
+        self.conn.execute("INSERT OR REPLACE INTO falhas VALUES (?, ?, ?)", (url_hash, motivo, time.time()))
+        self._contar_escrita()
+
+    def gravar_conteudo(self, conteudo_hash, original, miniatura, largura, altura, tamanho):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO conteudos VALUES (?, ?, ?, ?, ?, ?)",
+            (conteudo_hash, original, miniatura, largura, altura, tamanho)
+        )
+
+    def gravar_url(self, url_hash, conteudo_hash):
+        self.conn.execute("INSERT OR REPLACE INTO urls VALUES (?, ?)", (url_hash, conteudo_hash))
+        # A URL que falhou antes e agora baixou deixa de ser falha
+        self.conn.execute("DELETE FROM falhas WHERE url_hash = ?", (url_hash,))
+        self._contar_escrita()
+
+    def _contar_escrita(self):
+        self._pendentes += 1
+        if self._pendentes >= self.lote_commit:
+            self.conn.commit()
+            self._pendentes = 0
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+def _deferred(futuro, reactor):
+    """Deferred disparado no reactor quando o Future do pool de processos terminar"""
+    d = defer.Deferred()
+
+    def concluido(f):
+        if f.exception() is not None:
+            reactor.callFromThread(d.errback, f.exception())
+        else:
+            reactor.callFromThread(d.callback, f.result())
+
+    futuro.add_done_callback(concluido)
+    return d
+
+
+class ImagemPipeline:
+    """Item pipeline que baixa as imagens dos itens e gera as miniaturas.
+
+    Habilitado quando IMAGENS_DIR aponta para o diretório das imagens.
+    Configuração: IMAGENS_CONCORRENCIA, IMAGENS_TAXA (downloads/s),
+    IMAGENS_PROCESSOS, IMAGENS_MINIATURA (largura, altura),
+    IMAGENS_QUALIDADE, IMAGENS_TIMEOUT e IMAGENS_FALHA_TTL (segundos até
+    tentar de novo uma URL que falhou).
+    """
+
+    def __init__(self, crawler, diretorio):
+        from twisted.internet import reactor
+        settings = crawler.settings
+        self.reactor = reactor
+        self.stats = crawler.stats
+        self.store = ImagemStore(diretorio)
+        self.tamanho = tuple(int(lado) for lado in settings.getlist('IMAGENS_MINIATURA', [320, 240]))
+        self.qualidade = settings.getint('IMAGENS_QUALIDADE', 85)
+        self.falha_ttl = settings.getfloat('IMAGENS_FALHA_TTL', 7 * 24 * 3600)
+        self.headers = {
+            b'User-Agent': [settings.get('USER_AGENT').encode('utf-8')],
+            b'Accept': [b'image/avif,image/webp,image/*,*/*;q=0.8'],
+        }
+        self.cliente = ClienteApi(
+            reactor,
+            concorrencia=settings.getint('IMAGENS_CONCORRENCIA', 8),
+            taxa=settings.getfloat('IMAGENS_TAXA', 20.0),
+            rajada=settings.getint('IMAGENS_CONCORRENCIA', 8),
+            tentativas=3,
+            timeout=settings.getfloat('IMAGENS_TIMEOUT', 30),
+            nome='Imagens',
+        )
+        # spawn: o processo filho não herda o reactor nem as threads do crawler
+        self.processos = ProcessPoolExecutor(
+            max_workers=settings.getint('IMAGENS_PROCESSOS', 2),
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+        # Downloads (por hash da URL) e miniaturas (por hash do conteúdo) em andamento,
+        # para a mesma foto em dois itens ao mesmo tempo ser processada uma vez só
+        self.em_andamento = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        diretorio = crawler.settings.get('IMAGENS_DIR')
+        if not diretorio:
+            raise NotConfigured
+        if Image is None:
+            raise ValueError("Miniaturas das imagens requerem o pacote 'Pillow'")
+        return cls(crawler, diretorio)
+
+    async def process_item(self, item, spider):
+        imagens = [imagem for imagem in getattr(item, 'imagens', None) or () if imagem_util(imagem.url)]
+        if imagens:
+            await maybe_deferred_to_future(defer.DeferredList(
+                [defer.ensureDeferred(self.preencher(imagem)) for imagem in imagens], consumeErrors=True
+            ))
+        return item
+
+    async def preencher(self, imagem):
+        """Preenche ``arquivo`` e ``miniatura`` da imagem, baixando só o que ainda não está no store"""
+        url = safe_url_string(imagem.url)
+        url_hash = sha1(url.encode('utf-8'))
+        guardada = self.store.por_url(url_hash)
+        if guardada is None and self.store.falhou(url_hash, self.falha_ttl) is not None:
+            self.stats.inc_value('imagens/falha_recente')
+            return
+        if guardada is None:
+            andamento, repetida = self.unico(('url', url_hash), lambda: self.baixar(url, url_hash))
+            if repetida:
+                self.stats.inc_value('imagens/url_repetida')
+            guardada = await maybe_deferred_to_future(andamento)
+        else:
+            self.stats.inc_value('imagens/url_repetida')
+        if guardada is not None:
+            imagem.arquivo, imagem.miniatura = guardada
+
+    def unico(self, chave, tarefa):
+        """Deferred com o resultado da tarefa em andamento com essa chave (ou de uma nova) e se ela já existia"""
+        espera = defer.Deferred()
+        aguardando = self.em_andamento.get(chave)
+        if aguardando is not None:
+            aguardando.append(espera)
+            return espera, True
+        self.em_andamento[chave] = [espera]
+        defer.ensureDeferred(tarefa()).addBoth(self._concluir, chave)
+        return espera, False
+
+    def _concluir(self, resultado, chave):
+        for espera in self.em_andamento.pop(chave):
+            espera.callback(resultado)
+
+    async def baixar(self, url, url_hash):
+        """Baixa a imagem e gera a miniatura; retorna (original, miniatura) ou None se falhar"""
+        try:
+            status, _, corpo = await self.cliente.buscar(url, self.headers)
+        except Exception as e:
+            logger.debug(f"Falha ao baixar a imagem {url}: {e!r}")
+            self.stats.inc_value('imagens/falhas')
+            return None
+        if status != 200 or not corpo:
+            logger.debug(f"Imagem {url} respondeu {status}")
+            self.stats.inc_value('imagens/falhas')
+            self.store.gravar_falha(url_hash, f'status {status}' if status != 200 else 'vazia')
+            return None
+
+        self.stats.inc_value('imagens/baixadas')
+        self.stats.inc_value('imagens/bytes', len(corpo))
+        conteudo_hash = sha1(corpo)
+        guardada = self.store.por_conteudo(conteudo_hash)
+        if guardada is None:
+            andamento, repetida = self.unico(('conteudo', conteudo_hash), lambda: self.reduzir(corpo, conteudo_hash, url))
+            guardada = await maybe_deferred_to_future(andamento)
+        else:
+            repetida = True
+        if repetida:
+            self.stats.inc_value('imagens/conteudo_repetido')
+        if guardada is not None:
+            self.store.gravar_url(url_hash, conteudo_hash)
+        else:
+            self.store.gravar_falha(url_hash, 'inválida')
+        return guardada
+
+    async def reduzir(self, corpo, conteudo_hash, url):
+        """Grava o original e a miniatura no pool de processos; retorna (original, miniatura) ou None"""
+        futuro = self.processos.submit(processar_imagem, corpo, self.store.diretorio, conteudo_hash,
+                                       self.tamanho, self.qualidade)
+        try:
+            original, miniatura, largura, altura = await maybe_deferred_to_future(_deferred(futuro, self.reactor))
+        except Exception as e:
+            logger.debug(f"Imagem inválida em {url}: {e!r}")
+            self.stats.inc_value('imagens/invalidas')
+            return None
+        self.store.gravar_conteudo(conteudo_hash, original, miniatura, largura, altura, len(corpo))
+        self.stats.inc_value('imagens/miniaturas')
+        return original, miniatura
+
+    def close_spider(self, spider):
+        # Os itens já terminaram: nenhuma imagem está mais no pool
+        self.processos.shutdown(wait=True)
+        self.store.close()
+        logger.info(f"Imagens: {self.stats.get_value('imagens/baixadas', 0)} baixadas, "
+                    f"{self.stats.get_value('imagens/miniaturas', 0)} miniaturas geradas, "
+                    f"{self.stats.get_value('imagens/url_repetida', 0)} URLs e "
+                    f"{self.stats.get_value('imagens/conteudo_repetido', 0)} conteúdos repetidos")
+        return self.cliente.close()
@@ -0,0 +1,102 @@
+"""Itens produzidos pelos spiders.
+
+Dataclasses com ``__slots__``: cada item ocupa uma fração da memória de um
+dict com as mesmas chaves, os campos ficam documentados em um lugar só e o
+Scrapy (itemadapter) e os exportadores de json_codec.py tratam os objetos como
+itens normais. ``SCHEMAS`` lista os campos de cada tipo na ordem de exportação.
+"""
+from dataclasses import dataclass, field, fields
+from typing import List, Optional
+
+
+@dataclass(slots=True)
+class VeiculoFipe:
+    """Preço de um modelo/ano na API da tabela FIPE (FipeCrawler)"""
+    modelo: Optional[str] = None
+    marca: Optional[str] = None
+    ano: Optional[int] = None
+    combustivel: Optional[str] = None
+    codigo_fipe: Optional[str] = None
+    mes_referencia: Optional[str] = None
+    valor: Optional[str] = None
+    tipo_veiculo: Optional[int] = None
+
+    @classmethod
+    def da_api(cls, detalhes):
+        return cls(
+            modelo=detalhes.get('Modelo'),
+            marca=detalhes.get('Marca'),
+            ano=detalhes.get('AnoModelo'),
+            combustivel=detalhes.get('Combustivel'),
+            codigo_fipe=detalhes.get('CodigoFipe'),
+            mes_referencia=detalhes.get('MesReferencia'),
+            valor=detalhes.get('Valor'),
+            tipo_veiculo=detalhes.get('TipoVeiculo'),
+        )
+
+
+@dataclass(slots=True)
+class PrecoWebmotors:
+    """Preços FIPE e Webmotors de uma configuração de carro (WebMotorsCrawler).
+
+    ``tipo`` é o slug da versão usado na URL; junto com marca, modelo, ano e
+    estado identifica a configuração consultada.
+    """
+    marca: str
+    modelo: str
+    versao: Optional[str]
+    ano: int
+    estado: str
+    tipo: str
+    preco_fipe: Optional[str] = None
+    preco_webmotors: Optional[str] = None
+    url: Optional[str] = None
+
+
+@dataclass(slots=True)
+class Imagem:
+    url: str
+    title: Optional[str] = None
+    alt: Optional[str] = None
+    # Preenchidos pelo ImagemPipeline (image_pipeline.py): caminhos relativos a IMAGENS_DIR
+    arquivo: Optional[str] = None
+    miniatura: Optional[str] = None
+
+
+@dataclass(slots=True)
+class AnuncioWebmotors:
+    """Anúncio do estoque da Webmotors (WebmotorsSpider).
+
+    No modo delta ``delta`` indica se o anúncio é novo, alterado ou removido;
+    anúncios removidos só têm ``link`` e ``delta``.
+    """
+    marca: Optional[str] = None
+    modelo: Optional[str] = None
+    descricao: str = ''
+    preco: str = ''
+    ano: Optional[str] = None
+    km: Optional[str] = None
+    localizacao: str = ''
+    link: str = ''
+    imagens: List[Imagem] = field(default_factory=list)
+    # Metadados originais da imagem para debug
+    image_title: Optional[str] = None
+    image_alt: Optional[str] = None
+    delta: Optional[str] = None
+    # Preenchidos pelo FipeMatchPipeline (fipe_matcher.py): valores em reais
+    codigo_fipe: Optional[str] = None
+    valor_fipe: Optional[int] = None
+    diferenca_fipe: Optional[int] = None
+
+
+@dataclass(slots=True)
+class CursoAlura:
+    """Curso da página de cursos de programação da Alura (AluraBot)"""
+    nome: Optional[str] = None
+    link: Optional[str] = None
+
+
+SCHEMAS = {
+    classe.__name__: tuple(f.name for f in fields(classe))
+    for classe in (VeiculoFipe, PrecoWebmotors, Imagem, AnuncioWebmotors, CursoAlura)
+}
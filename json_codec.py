@@ -0,0 +1,132 @@
+"""Codec JSON plugável para as respostas das APIs, os backups e os feeds.
+
+Usa o orjson quando ele está instalado (bem mais rápido e serializa as
+dataclasses de items.py direto) e o json da stdlib como fallback. A escolha
+pode ser forçada com a variável de ambiente JSON_CODEC (auto, orjson ou json)
+ou com ``usar()``.
+
+``dumps`` sempre retorna bytes UTF-8 sem escapar os acentos.
+"""
+import os
+import json
+from dataclasses import fields, is_dataclass
+from functools import lru_cache
+
+from scrapy.exporters import BaseItemExporter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+@lru_cache(maxsize=None)
+def _campos(classe):
+    return tuple(f.name for f in fields(classe))
+
+
+def _padrao(obj):
+    """Converte os itens (dataclasses) para o json da stdlib"""
+    if is_dataclass(obj):
+        return {nome: getattr(obj, nome) for nome in _campos(type(obj))}
+    raise TypeError(f"Objeto do tipo {type(obj).__name__} não é serializável em JSON")
+
+
+class StdlibCodec:
+    nome = 'json'
+
+    @staticmethod
+    def loads(dados):
+        return json.loads(dados)
+
+    @staticmethod
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_padrao).encode('utf-8')
+
+
+class OrjsonCodec:
+    nome = 'orjson'
+
+    @staticmethod
+    def loads(dados):
+        return orjson.loads(dados)
+
+    @staticmethod
+    def dumps(obj):
+        return orjson.dumps(obj, default=_padrao)
+
+
+_codec = StdlibCodec
+
+
+def usar(nome='auto'):
+    """Seleciona o codec: 'auto' (orjson se instalado), 'orjson' ou 'json'"""
+    global _codec
+    if nome == 'json' or (nome == 'auto' and orjson is None):
+        _codec = StdlibCodec
+    elif nome in ('auto', 'orjson'):
+        if orjson is None:
+            raise ValueError("Codec orjson requer o pacote 'orjson'")
+        _codec = OrjsonCodec
+    else:
+        raise ValueError(f"Codec JSON desconhecido: {nome}")
+    return _codec
+
+
+def codec_atual():
+    return _codec.nome
+
+
+def loads(dados):
+    return _codec.loads(dados)
+
+
+def dumps(obj):
+    return _codec.dumps(obj)
+
+
+usar(os.environ.get('JSON_CODEC', 'auto'))
+
+
+class JsonLinesExporter(BaseItemExporter):
+    """Exportador de feed 'jsonlines' que usa o codec rápido (sempre UTF-8)"""
+
+    def __init__(self, file, **kwargs):
+        super().__init__(dont_fail=True, **kwargs)
+        self.file = file
+
+    def _serializar(self, item):
+        if self.fields_to_export is None:
+            # Dict ou dataclass vai direto para o codec, sem cópia intermediária
+            return dumps(item)
+        return dumps(dict(self._get_serialized_fields(item)))
+
+    def export_item(self, item):
+        self.file.write(self._serializar(item) + b'\n')
+
+
+class JsonExporter(JsonLinesExporter):
+    """Exportador de feed 'json' (uma lista) que usa o codec rápido"""
+
+    def __init__(self, file, **kwargs):
+        super().__init__(file, **kwargs)
+        self.primeiro = True
+
+    def start_exporting(self):
+        self.file.write(b'[\n')
+
+    def finish_exporting(self):
+        self.file.write(b'\n]\n')
+
+    def export_item(self, item):
+        if not self.primeiro:
+            self.file.write(b',\n')
+        self.primeiro = False
+        self.file.write(self._serializar(item))
+
+
+# Para usar nos custom_settings dos spiders
+FEED_EXPORTERS = {
+    'json': 'json_codec.JsonExporter',
+    'jsonlines': 'json_codec.JsonLinesExporter',
+}
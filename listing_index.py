@@ -0,0 +1,88 @@
+import time
+import sqlite3
+import hashlib
+
+from itemadapter import ItemAdapter
+
+# Resultado de ListingIndex.registrar
+NOVO = 'novo'
+ALTERADO = 'alterado'
+INALTERADO = 'inalterado'
+DUPLICADO = 'duplicado'
+REMOVIDO = 'removido'
+
+
+def impressao_digital(item):
+    """Hash do conteúdo que importa para detectar mudanças no anúncio (preço e km)"""
+    campos = ItemAdapter(item)
+    conteudo = f"{campos.get('preco') or ''}|{campos.get('km') or ''}"
+    return hashlib.blake2b(conteudo.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class ListingIndex:
+    """Índice persistente (sqlite) dos anúncios já vistos, pela URL do anúncio.
+
+    Cada execução recebe um número; ``registrar`` compara a impressão digital
+    do anúncio com a última vista e marca em que execução ele apareceu, o que
+    permite descobrir duplicados na mesma execução e anúncios removidos (os que
+    não apareceram na execução atual).
+    """
+
+    def __init__(self, path='anuncios_webmotors.sqlite', lote_commit=500):
+        self.path = path
+        self.lote_commit = lote_commit
+        self._pendentes = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS anuncios (
+                link TEXT PRIMARY KEY,
+                impressao TEXT NOT NULL,
+                execucao INTEGER NOT NULL,
+                visto_em REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_anuncios_execucao ON anuncios (execucao);
+            CREATE TABLE IF NOT EXISTS execucoes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                inicio REAL NOT NULL
+            );
+        """)
+        cursor = self.conn.execute("INSERT INTO execucoes (inicio) VALUES (?)", (time.time(),))
+        self.execucao = cursor.lastrowid
+        self.conn.commit()
+
+    def registrar(self, link, item):
+        """Registra o anúncio nesta execução e retorna NOVO, ALTERADO, INALTERADO ou DUPLICADO"""
+        impressao = impressao_digital(item)
+        row = self.conn.execute(
+            "SELECT impressao, execucao FROM anuncios WHERE link = ?", (link,)
+        ).fetchone()
+
+        if row is not None and row[1] == self.execucao:
+            return DUPLICADO
+
+        self.conn.execute(
+            "INSERT OR REPLACE INTO anuncios VALUES (?, ?, ?, ?)",
+            (link, impressao, self.execucao, time.time())
+        )
+        self._pendentes += 1
+        if self._pendentes >= self.lote_commit:
+            self.conn.commit()
+            self._pendentes = 0
+
+        if row is None:
+            return NOVO
+        return INALTERADO if row[0] == impressao else ALTERADO
+
+    def removidos(self):
+        """Anúncios que existiam no índice mas não apareceram nesta execução (são apagados do índice)"""
+        self.conn.commit()
+        links = [link for (link,) in self.conn.execute(
+            "SELECT link FROM anuncios WHERE execucao < ?", (self.execucao,)
+        )]
+        self.conn.execute("DELETE FROM anuncios WHERE execucao < ?", (self.execucao,))
+        self.conn.commit()
+        return links
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -1,22 +1,26 @@
 import scrapy
 
+from items import CursoAlura
+from extraction_schema import esquema
+
 class AluraBot(scrapy.Spider):
     name = "Alura Bot"
     start_urls = ["https://www.alura.com.br/cursos-online-programacao"]
 
-    def parse(self, response):
-        SELETOR = ".subcategoria__item"
-        cursos = []
-        for categoria in response.css(SELETOR):
-            curso = {}
-
-            NOME_SELETOR = ".card-curso__nome ::text"
-            LINK_SELECTOR = ".card-curso ::attr(href)"
+    custom_settings = {
+        # Métricas ao vivo: endpoint Prometheus (None desliga) e arquivo periódico (ver metrics.py)
+        'EXTENSIONS': {'metrics.MetricsExtension': 500},
+        'SPIDER_MIDDLEWARES': {'metrics.MetricsSpiderMiddleware': 990},
+        'METRICS_PORT': None,
+        'METRICS_FILE': 'metricas_alura.json',
+        'METRICS_INTERVAL': 30,
+    }
 
-            curso['nome'] = categoria.css(NOME_SELETOR).extract_first()
-            curso['link'] = "https://www.alura.com.br" + categoria.css(LINK_SELECTOR).extract_first()
-            print(curso)
+    def parse(self, response):
+        # Seletores dos cursos e dos campos no esquema alura_curso (esquemas_extracao.json)
+        cursos = esquema('alura_curso', self.settings)
+        itens, _ = cursos.selecionar(response.selector.root)
+        for campos in cursos.extrair_lote(itens):
+            yield CursoAlura(**campos)
 
-            cursos.append(curso)
-        
-        print("Total de Cursos: ", len(cursos))
\ No newline at end of file
+        self.logger.info(f"Total de Cursos: {len(itens)}")
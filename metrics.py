@@ -0,0 +1,273 @@
+"""Métricas ao vivo dos spiders: endpoint no formato texto do Prometheus e arquivo periódico.
+
+Os contadores de domínio (bloqueios, fallbacks de extração, sucesso/falha)
+ficam nos stats do Scrapy (``ContadoresMixin.contar`` nos spiders) e são todos
+exportados. Por cima deles esta camada mede:
+
+- duração e CPU de cada callback (histograma por callback);
+- latência de download e bytes baixados;
+- itens por segundo no último intervalo.
+
+Configuração: METRICS_ENABLED, METRICS_PORT (None desliga o endpoint),
+METRICS_HOST, METRICS_FILE e METRICS_INTERVAL (segundos).
+"""
+import os
+import json
+import time
+import logging
+from bisect import bisect_left
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+from twisted.web import resource, server
+
+logger = logging.getLogger(__name__)
+
+# Limites dos histogramas, em segundos
+BUCKETS_CALLBACK = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+BUCKETS_DOWNLOAD = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histograma:
+    """Histograma cumulativo no estilo Prometheus (contagem por limite superior)"""
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.contagens[bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def cumulativo(self):
+        acumulado = 0
+        for limite, contagem in zip(self.limites + ('+Inf',), self.contagens):
+            acumulado += contagem
+            yield limite, acumulado
+
+    def resumo(self):
+        return {'total': self.total, 'soma': self.soma,
+                'media': self.soma / self.total if self.total else 0.0}
+
+
+class ContadoresMixin:
+    """Contadores de domínio do spider nos stats do crawler, em ``<prefixo>/<chave>``.
+
+    O prefixo é PREFIXO_CONTADORES ou, sem ele, o ``name`` do spider.
+    """
+
+    PREFIXO_CONTADORES = None
+
+    def chave_contador(self, chave):
+        return f'{self.PREFIXO_CONTADORES or self.name}/{chave}'
+
+    def contar(self, chave, n=1):
+        """Incrementa um contador nos stats do crawler (exportados por este módulo)"""
+        self.crawler.stats.inc_value(self.chave_contador(chave), n)
+
+    def contagem(self, chave):
+        return self.crawler.stats.get_value(self.chave_contador(chave), 0)
+
+
+class Metricas:
+    """Registro compartilhado pela extensão e pelo spider middleware de um crawler"""
+
+    def __init__(self):
+        self.duracao_callback = {}
+        self.cpu_callback = {}
+        self.latencia_download = Histograma(BUCKETS_DOWNLOAD)
+        self.bytes_baixados = 0
+        self.itens_por_segundo = 0.0
+
+    @classmethod
+    def do_crawler(cls, crawler):
+        if getattr(crawler, 'metricas', None) is None:
+            crawler.metricas = cls()
+        return crawler.metricas
+
+    def registrar_callback(self, callback, duracao, cpu):
+        if callback not in self.duracao_callback:
+            self.duracao_callback[callback] = Histograma(BUCKETS_CALLBACK)
+            self.cpu_callback[callback] = 0.0
+        self.duracao_callback[callback].observar(duracao)
+        self.cpu_callback[callback] += cpu
+
+
+def _rotulos(**rotulos):
+    return ','.join(f'{chave}="{str(valor).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                    for chave, valor in rotulos.items())
+
+
+def formatar_prometheus(spider, stats, metricas):
+    """Texto no formato de exposição do Prometheus"""
+    linhas = ['# TYPE scrapy_stat gauge']
+    for chave, valor in sorted(stats.items()):
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            linhas.append(f'scrapy_stat{{{_rotulos(spider=spider, chave=chave)}}} {valor}')
+
+    linhas.append('# TYPE scrapy_callback_duracao_segundos histogram')
+    for callback, histograma in sorted(metricas.duracao_callback.items()):
+        for limite, acumulado in histograma.cumulativo():
+            rotulos = _rotulos(spider=spider, callback=callback, le=limite)
+            linhas.append(f'scrapy_callback_duracao_segundos_bucket{{{rotulos}}} {acumulado}')
+        rotulos = _rotulos(spider=spider, callback=callback)
+        linhas.append(f'scrapy_callback_duracao_segundos_sum{{{rotulos}}} {histograma.soma}')
+        linhas.append(f'scrapy_callback_duracao_segundos_count{{{rotulos}}} {histograma.total}')
+
+    linhas.append('# TYPE scrapy_callback_cpu_segundos_total counter')
+    for callback, cpu in sorted(metricas.cpu_callback.items()):
+        linhas.append(f'scrapy_callback_cpu_segundos_total{{{_rotulos(spider=spider, callback=callback)}}} {cpu}')
+
+    linhas.append('# TYPE scrapy_download_latencia_segundos histogram')
+    for limite, acumulado in metricas.latencia_download.cumulativo():
+        linhas.append(f'scrapy_download_latencia_segundos_bucket{{{_rotulos(spider=spider, le=limite)}}} {acumulado}')
+    linhas.append(f'scrapy_download_latencia_segundos_sum{{{_rotulos(spider=spider)}}} {metricas.latencia_download.soma}')
+    linhas.append(f'scrapy_download_latencia_segundos_count{{{_rotulos(spider=spider)}}} {metricas.latencia_download.total}')
+
+    linhas.append('# TYPE scrapy_bytes_baixados_total counter')
+    linhas.append(f'scrapy_bytes_baixados_total{{{_rotulos(spider=spider)}}} {metricas.bytes_baixados}')
+    linhas.append('# TYPE scrapy_itens_por_segundo gauge')
+    linhas.append(f'scrapy_itens_por_segundo{{{_rotulos(spider=spider)}}} {metricas.itens_por_segundo}')
+    return '\n'.join(linhas) + '\n'
+
+
+class _RecursoMetricas(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, extensao):
+        super().__init__()
+        self.extensao = extensao
+
+    def render_GET(self, request):
+        request.setHeader(b'Content-Type', b'text/plain; version=0.0.4; charset=utf-8')
+        return self.extensao.prometheus().encode('utf-8')
+
+
+class MetricsExtension:
+    """Extensão que coleta as métricas de download/itens e as publica"""
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.metricas = Metricas.do_crawler(crawler)
+        self.porta = settings.getint('METRICS_PORT') if settings.get('METRICS_PORT') else None
+        self.host = settings.get('METRICS_HOST', '127.0.0.1')
+        self.arquivo = settings.get('METRICS_FILE')
+        self.intervalo = settings.getfloat('METRICS_INTERVAL', 30)
+        self.spider = None
+        self.porta_aberta = None
+        self.tarefa = None
+        self._itens_anteriores = 0
+        self._instante_anterior = time.monotonic()
+
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(self.response_received, signal=signals.response_received)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('METRICS_ENABLED', True):
+            raise NotConfigured
+        return cls(crawler)
+
+    def spider_opened(self, spider):
+        self.spider = spider
+        if self.porta is not None:
+            from twisted.internet import reactor
+            try:
+                self.porta_aberta = reactor.listenTCP(self.porta, server.Site(_RecursoMetricas(self)),
+                                                      interface=self.host)
+                logger.info(f"Métricas em http://{self.host}:{self.porta_aberta.getHost().port}/metrics")
+            except Exception as e:
+                # Sem endpoint (porta ocupada, por exemplo) o crawl continua normalmente
+                logger.error(f"Não foi possível abrir o endpoint de métricas na porta {self.porta}: {e}")
+        self.tarefa = task.LoopingCall(self.atualizar)
+        self.tarefa.start(self.intervalo, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.tarefa is not None and self.tarefa.running:
+            self.tarefa.stop()
+        # Sem recalcular a taxa: o trecho desde a última medição pode ser curto demais
+        if self.arquivo:
+            self.gravar_arquivo()
+        if self.porta_aberta is not None:
+            return self.porta_aberta.stopListening()
+
+    def response_received(self, response, request, spider):
+        self.metricas.bytes_baixados += len(response.body)
+        latencia = request.meta.get('download_latency')
+        if latencia is not None:
+            self.metricas.latencia_download.observar(latencia)
+
+    def atualizar(self):
+        """Recalcula os itens/s do último intervalo e grava o arquivo de métricas"""
+        agora = time.monotonic()
+        itens = self.crawler.stats.get_value('item_scraped_count', 0)
+        decorrido = agora - self._instante_anterior
+        if decorrido > 0:
+            self.metricas.itens_por_segundo = (itens - self._itens_anteriores) / decorrido
+        self._itens_anteriores, self._instante_anterior = itens, agora
+        if self.arquivo:
+            self.gravar_arquivo()
+
+    def gravar_arquivo(self):
+        dados = {
+            'spider': self.spider.name if self.spider else None,
+            'atualizado_em': time.time(),
+            'itens_por_segundo': self.metricas.itens_por_segundo,
+            'bytes_baixados': self.metricas.bytes_baixados,
+            'latencia_download': self.metricas.latencia_download.resumo(),
+            'callbacks': {
+                callback: dict(histograma.resumo(), cpu=self.metricas.cpu_callback[callback])
+                for callback, histograma in self.metricas.duracao_callback.items()
+            },
+            'stats': self.crawler.stats.get_stats(),
+        }
+        temporario = self.arquivo + '.tmp'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(dados, f, ensure_ascii=False, indent=2, default=str)
+        os.replace(temporario, self.arquivo)
+
+    def prometheus(self):
+        nome = self.spider.name if self.spider else ''
+        return formatar_prometheus(nome, self.crawler.stats.get_stats(), self.metricas)
+
+
+class MetricsSpiderMiddleware:
+    """Mede a duração e o CPU de cada callback, inclusive o consumo do gerador.
+
+    Deve ficar perto do spider (ordem alta) para medir só o callback.
+    """
+
+    def __init__(self, crawler):
+        self.metricas = Metricas.do_crawler(crawler)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('METRICS_ENABLED', True):
+            raise NotConfigured
+        return cls(crawler)
+
+    def process_spider_output(self, response, result, spider):
+        callback = response.request.callback
+        nome = getattr(callback, '__name__', None) or 'parse'
+        duracao = cpu = 0.0
+        iterador = iter(result)
+        try:
+            while True:
+                inicio, inicio_cpu = time.perf_counter(), time.process_time()
+                try:
+                    valor = next(iterador)
+                except StopIteration:
+                    break
+                finally:
+                    duracao += time.perf_counter() - inicio
+                    cpu += time.process_time() - inicio_cpu
+                yield valor
+        finally:
+            # Também quando o callback levanta exceção: é quando mais interessa o tempo dele
+            self.metricas.registrar_callback(nome, duracao, cpu)
@@ -0,0 +1,89 @@
+"""Cache persistente do item extraído de cada página, pelo hash do conteúdo.
+
+A maioria das páginas da tabela FIPE da Webmotors é idêntica de um dia para
+o outro. O PageCache guarda, por URL, o hash do corpo da página e o último
+item extraído dela; quando a página baixada tem o mesmo hash, o spider
+reemite o item guardado sem rodar a extração.
+
+O hash ignora ``<script>``, ``<style>`` e comentários HTML (nonces, ids de
+sessão e tags de anúncio mudam a cada acesso sem mudar o conteúdo) e inclui
+uma ``versao`` dada pelo spider: mudando a extração ou os esquemas, os itens
+antigos deixam de casar e as páginas são extraídas de novo.
+"""
+import re
+import time
+import sqlite3
+import hashlib
+
+import json_codec
+
+# Trechos que mudam a cada acesso sem mudar o conteúdo da página
+VOLATEIS = re.compile(rb'<script\b.*?</script\s*>|<style\b.*?</style\s*>|<!--.*?-->', re.S | re.I)
+
+
+class PageCache:
+    """Hash do corpo -> último item extraído, por URL (sqlite).
+
+    ``stats`` (os stats do crawler) recebe ``cache_paginas/reaproveitadas``
+    e ``cache_paginas/extraidas``; cada URL também guarda quantas vezes o
+    item foi reaproveitado.
+    """
+
+    def __init__(self, path='paginas_webmotors.sqlite', versao='', normalizar=True, stats=None, lote_commit=500):
+        self.path = path
+        self.versao = versao.encode('utf-8')
+        self.normalizar = normalizar
+        self.stats = stats
+        self.lote_commit = lote_commit
+        self._pendentes = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS paginas (
+                url TEXT PRIMARY KEY,
+                hash TEXT NOT NULL,
+                item BLOB NOT NULL,
+                extraido_em REAL NOT NULL,
+                reaproveitamentos INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+
+    @classmethod
+    def from_settings(cls, settings, versao='', stats=None):
+        """PAGE_CACHE_PATH (None desliga, retorna None) e PAGE_CACHE_NORMALIZAR"""
+        path = settings.get('PAGE_CACHE_PATH')
+        if not path:
+            return None
+        return cls(path, versao, settings.getbool('PAGE_CACHE_NORMALIZAR', True), stats)
+
+    def impressao(self, response):
+        """Hash do corpo da resposta (sem os trechos voláteis, se normalizar)"""
+        corpo = VOLATEIS.sub(b'', response.body) if self.normalizar else response.body
+        return hashlib.blake2b(self.versao + b'\0' + corpo, digest_size=16).hexdigest()
+
+    def buscar(self, url, impressao):
+        """Item (dict) guardado para a URL se a página não mudou, senão None"""
+        row = self.conn.execute("SELECT hash, item FROM paginas WHERE url = ?", (url,)).fetchone()
+        if row is None or row[0] != impressao:
+            return None
+        self.conn.execute("UPDATE paginas SET reaproveitamentos = reaproveitamentos + 1 WHERE url = ?", (url,))
+        self._contar('reaproveitadas')
+        return json_codec.loads(row[1])
+
+    def gravar(self, url, impressao, item):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO paginas (url, hash, item, extraido_em) VALUES (?, ?, ?, ?)",
+            (url, impressao, json_codec.dumps(item), time.time())
+        )
+        self._contar('extraidas')
+
+    def _contar(self, chave):
+        if self.stats is not None:
+            self.stats.inc_value(f'cache_paginas/{chave}')
+        self._pendentes += 1
+        if self._pendentes >= self.lote_commit:
+            self.conn.commit()
+            self._pendentes = 0
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
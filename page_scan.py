@@ -0,0 +1,66 @@
+"""Buscas rápidas no corpo das respostas, sem copiar a página inteira.
+
+Em vez de ``response.text.lower()`` (que decodifica e copia a página) as buscas
+usam padrões pré-compilados e case-insensitive direto sobre ``response.body``
+quando a página é UTF-8, param na primeira ocorrência necessária e aceitam um
+limite em bytes para olhar só o começo do documento.
+"""
+import re
+from functools import lru_cache
+
+ENCODINGS_UTF8 = ('utf-8', 'utf8')
+
+# Preço no formato "R$ 45.678,00"; no texto decodificado o \s já cobre o &nbsp; (U+00A0),
+# nos bytes UTF-8 ele aparece como \xc2\xa0
+_PRECO_TEXTO = re.compile(r'R\$\s*([\d\.,]+)')
+_PRECO_BYTES = re.compile(rb'R\$(?:\s|\xc2\xa0)*([\d\.,]+)')
+
+
+def _padrao_texto_bytes(texto):
+    """Converte o texto em regex de bytes UTF-8 que ignora maiúsculas inclusive nos acentos"""
+    partes = []
+    for char in texto:
+        variantes = {char.lower(), char.upper()}
+        if len(variantes) == 1 or char.isascii():
+            partes.append(re.escape(char.encode('utf-8')))
+        else:
+            partes.append(b'(?:' + b'|'.join(re.escape(v.encode('utf-8')) for v in sorted(variantes)) + b')')
+    return re.compile(b''.join(partes), re.IGNORECASE)
+
+
+@lru_cache(maxsize=64)
+def padrao(texto, em_bytes):
+    """Padrão compilado (e reaproveitado) para buscar ``texto`` ignorando maiúsculas"""
+    if em_bytes:
+        return _padrao_texto_bytes(texto)
+    return re.compile(re.escape(texto), re.IGNORECASE)
+
+
+def _conteudo(response):
+    """Retorna (conteúdo, é_bytes): o body cru se for UTF-8, senão o texto já decodificado"""
+    encoding = (getattr(response, 'encoding', None) or 'utf-8').lower().replace('_', '-')
+    if encoding in ENCODINGS_UTF8:
+        return response.body, True
+    return response.text, False
+
+
+def contem(response, texto, limite=None):
+    """Indica se ``texto`` aparece na página (ignorando maiúsculas), olhando até ``limite`` bytes"""
+    conteudo, em_bytes = _conteudo(response)
+    fim = len(conteudo) if limite is None else limite
+    return padrao(texto, em_bytes).search(conteudo, 0, fim) is not None
+
+
+def encontrar_precos(response, quantidade=2, limite=None):
+    """Retorna os primeiros ``quantidade`` valores de preço encontrados (só os números)"""
+    conteudo, em_bytes = _conteudo(response)
+    fim = len(conteudo) if limite is None else limite
+    regex = _PRECO_BYTES if em_bytes else _PRECO_TEXTO
+
+    precos = []
+    for match in regex.finditer(conteudo, 0, fim):
+        valor = match.group(1)
+        precos.append(valor.decode('ascii') if em_bytes else valor)
+        if len(precos) >= quantidade:
+            break
+    return precos
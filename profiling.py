@@ -0,0 +1,154 @@
+"""Modo de profiling: CPU e alocações de memória atribuídas a cada callback.
+
+Ligado com ``-s PROFILE_DIR=perfil`` (ou ``benchmark.py --perfil perfil``).
+Enquanto um callback roda (inclusive ao consumir o gerador), o
+ProfilingSpiderMiddleware:
+
+- liga um cProfile.Profile próprio do callback;
+- amostra a pilha a cada PROFILE_INTERVALO segundos de CPU (SIGPROF), para
+  gerar pilhas no formato "collapsed" do flamegraph.pl/speedscope;
+- a cada PROFILE_AMOSTRA_MEMORIA chamadas, rastreia as alocações da chamada
+  com tracemalloc (as linhas que mais alocaram e o pico).
+
+Funções chamadas pelo callback (extract_car_info, seletores, regex, logging)
+aparecem dentro dele. No fim da execução, em ``PROFILE_DIR/<spider>-<data>/``:
+
+    <callback>.pstats     estatísticas do cProfile (snakeviz, pstats)
+    pilhas.collapsed      pilhas amostradas, uma por linha, com o callback na raiz
+    relatorio.txt         top PROFILE_TOP funções por CPU e linhas por alocação de cada callback
+"""
+import os
+import io
+import time
+import signal
+import pstats
+import cProfile
+import logging
+import tracemalloc
+from collections import Counter, defaultdict
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+logger = logging.getLogger(__name__)
+
+
+def _rotulo(codigo):
+    nome = os.path.basename(codigo.co_filename)
+    return f"{codigo.co_name} ({nome}:{codigo.co_firstlineno})".replace(';', ',')
+
+
+class ProfilingSpiderMiddleware:
+    """Spider middleware que mede CPU e alocações de cada callback; deve ficar perto do spider"""
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.diretorio = settings.get('PROFILE_DIR')
+        self.intervalo = settings.getfloat('PROFILE_INTERVALO', 0.005)
+        self.amostra_memoria = settings.getint('PROFILE_AMOSTRA_MEMORIA', 20)
+        self.top = settings.getint('PROFILE_TOP', 25)
+
+        self.perfis = {}
+        self.chamadas = Counter()
+        self.pilhas = Counter()
+        self.alocacoes = defaultdict(Counter)
+        self.picos = Counter()
+        self.atual = None
+        self.amostrando = hasattr(signal, 'SIGPROF')
+        # Onde a pilha amostrada para de subir: abaixo daqui é o Scrapy
+        self.raiz = ProfilingSpiderMiddleware.process_spider_output.__code__
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.get('PROFILE_DIR'):
+            raise NotConfigured
+        return cls(crawler)
+
+    def spider_opened(self, spider):
+        if self.amostrando:
+            signal.signal(signal.SIGPROF, self.amostrar)
+            signal.setitimer(signal.ITIMER_PROF, self.intervalo, self.intervalo)
+        else:
+            logger.warning("Sem SIGPROF nesta plataforma: pilhas amostradas desligadas, só cProfile e tracemalloc")
+        if tracemalloc.is_tracing():
+            logger.warning("tracemalloc já estava ligado: alocações por callback desligadas")
+            self.amostra_memoria = 0
+
+    def amostrar(self, signum, frame):
+        """Handler do SIGPROF: registra a pilha atual se um callback estiver rodando"""
+        if self.atual is None:
+            return
+        pilha = []
+        while frame is not None and frame.f_code is not self.raiz:
+            pilha.append(_rotulo(frame.f_code))
+            frame = frame.f_back
+        pilha.append(self.atual)
+        self.pilhas[';'.join(reversed(pilha))] += 1
+
+    def process_spider_output(self, response, result, spider):
+        callback = response.request.callback
+        nome = getattr(callback, '__name__', None) or 'parse'
+        perfil = self.perfis.get(nome)
+        if perfil is None:
+            perfil = self.perfis[nome] = cProfile.Profile()
+        self.chamadas[nome] += 1
+        memoria = self.amostra_memoria and (self.chamadas[nome] - 1) % self.amostra_memoria == 0
+
+        iterador = iter(result)
+        while True:
+            if memoria:
+                tracemalloc.start()
+            self.atual = nome
+            perfil.enable()
+            try:
+                valor = next(iterador)
+            except StopIteration:
+                break
+            finally:
+                perfil.disable()
+                self.atual = None
+                if memoria:
+                    self.registrar_alocacoes(nome)
+            yield valor
+
+    def registrar_alocacoes(self, nome):
+        """Soma as alocações ainda vivas do trecho do callback e guarda o pico"""
+        pico = tracemalloc.get_traced_memory()[1]
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        self.picos[nome] = max(self.picos[nome], pico)
+        for estatistica in snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]).statistics('lineno'):
+            self.alocacoes[nome][str(estatistica.traceback[0])] += estatistica.size
+
+    def spider_closed(self, spider):
+        if self.amostrando:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+        destino = os.path.join(self.diretorio, f"{spider.name}-{time.strftime('%Y%m%d-%H%M%S')}")
+        os.makedirs(destino, exist_ok=True)
+        for nome, perfil in self.perfis.items():
+            perfil.dump_stats(os.path.join(destino, f'{nome}.pstats'))
+        with open(os.path.join(destino, 'pilhas.collapsed'), 'w', encoding='utf-8') as f:
+            for pilha, amostras in self.pilhas.most_common():
+                f.write(f'{pilha} {amostras}\n')
+        with open(os.path.join(destino, 'relatorio.txt'), 'w', encoding='utf-8') as f:
+            f.write(self.relatorio())
+        logger.info(f"Profiling salvo em {destino} ({len(self.perfis)} callbacks, {sum(self.pilhas.values())} amostras)")
+
+    def relatorio(self):
+        saida = io.StringIO()
+        for nome, perfil in sorted(self.perfis.items()):
+            estatisticas = pstats.Stats(perfil, stream=saida)
+            saida.write(f"=== {nome}: {self.chamadas[nome]} chamadas, {estatisticas.total_tt * 1000:.1f} ms de CPU\n\n")
+            estatisticas.sort_stats('tottime').print_stats(self.top)
+            if self.alocacoes[nome]:
+                amostras = (self.chamadas[nome] + self.amostra_memoria - 1) // self.amostra_memoria
+                saida.write(f"Alocações vivas ao fim de cada trecho ({amostras} chamadas amostradas, "
+                            f"pico {self.picos[nome] / 1024:.1f} KiB):\n")
+                for linha, tamanho in self.alocacoes[nome].most_common(self.top):
+                    saida.write(f"  {tamanho / amostras / 1024:>10.1f} KiB/chamada  {linha}\n")
+            saida.write('\n')
+        return saida.getvalue()
@@ -0,0 +1,70 @@
+import os
+import gzip
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import json_codec
+
+
+class ResultSink:
+    """Grava resultados em JSONL à medida que são produzidos.
+
+    Cada item vira uma linha no arquivo, então a memória não cresce com a
+    execução e um crash perde no máximo os itens desde o último fsync.
+    Suporta compressão opcional ('gzip' ou 'zstd').
+    """
+
+    EXTENSOES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+    def __init__(self, path, compressao=None, fsync_itens=100, fsync_segundos=5.0):
+        if compressao not in self.EXTENSOES:
+            raise ValueError(f"Compressão não suportada: {compressao}")
+        if compressao == 'zstd' and zstandard is None:
+            raise ValueError("Compressão zstd requer o pacote 'zstandard'")
+
+        self.path = path + self.EXTENSOES[compressao]
+        self.compressao = compressao
+        self.fsync_itens = fsync_itens
+        self.fsync_segundos = fsync_segundos
+        self.total = 0
+        self._pendentes = 0
+        self._ultimo_fsync = time.monotonic()
+
+        self._raw = open(self.path, 'wb')
+        if compressao == 'gzip':
+            self._comprimido = gzip.GzipFile(fileobj=self._raw, mode='wb')
+        elif compressao == 'zstd':
+            self._comprimido = zstandard.ZstdCompressor().stream_writer(self._raw, closefd=False)
+        else:
+            self._comprimido = None
+        self._out = self._comprimido or self._raw
+
+    def write(self, item):
+        self._out.write(json_codec.dumps(item) + b'\n')
+        self.total += 1
+        self._pendentes += 1
+
+        if (self._pendentes >= self.fsync_itens
+                or time.monotonic() - self._ultimo_fsync >= self.fsync_segundos):
+            self.sync()
+
+    def sync(self):
+        """Descarrega os buffers e força a gravação em disco"""
+        if self.compressao == 'gzip':
+            self._comprimido.flush()
+        elif self.compressao == 'zstd':
+            self._comprimido.flush(zstandard.FLUSH_BLOCK)
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._pendentes = 0
+        self._ultimo_fsync = time.monotonic()
+
+    def close(self):
+        self.sync()
+        if self._comprimido is not None:
+            self._comprimido.close()
+        self._raw.close()
@@ -0,0 +1,294 @@
+"""Executa os spiders do projeto num único processo, todos no mesmo reactor.
+
+Os spiders são registrados em SPIDERS pelo nome curto e só são importados
+quando usados (``get-cars.py`` não é importável pelo nome, por isso a carga é
+pelo caminho do arquivo). Vários spiders do mesmo comando rodam em paralelo
+e o processo termina quando todos acabam.
+
+No modo daemon o processo fica no ar e recebe novos crawls por HTTP, sem
+pagar de novo a inicialização do Python, do Scrapy e do Twisted nem a carga
+dos spiders e dos esquemas de extração:
+
+    POST /   {"spiders": ["fipe", "alura"], "settings": {...}, "argumentos": {...}}
+    GET  /   trabalhos recentes, com estado e contagens de cada spider
+
+Settings e argumentos valem para todos os spiders (``CHAVE=VALOR``) ou só
+para um (``spider:CHAVE=VALOR``), na linha de comando e no JSON. As settings
+passam por cima do ``custom_settings`` do spider.
+
+Uso:
+    python runner.py list
+    python runner.py run fipe alura -s LOG_LEVEL=INFO -s fipe:FIPE_API_TAXA=5 -a fipe:incremental=1
+    python runner.py daemon --porta 6802
+    curl -d '{"spiders": ["alura"], "settings": {"alura:FEEDS": {"cursos.json": {"format": "json"}}}}' localhost:6802
+
+Os spiders gravam arquivos (feeds, caches sqlite) no diretório atual, então o
+daemon recusa um trabalho com um spider que ainda está rodando. O profiling
+(PROFILE_DIR, ver profiling.py) usa o SIGPROF e o tracemalloc do processo, então
+um spider com PROFILE_DIR só roda sozinho: nem com outros no mesmo trabalho nem
+com outro trabalho em andamento.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import importlib.util
+from functools import lru_cache
+from itertools import count
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+
+# Spiders disponíveis: nome curto -> (arquivo, classe)
+SPIDERS = {
+    'fipe': ('fipe_crawler.py', 'FipeCrawler'),
+    'webmotors_fipe': ('webmotors_crawler.py', 'WebMotorsCrawler'),
+    'webmotors': ('get-cars.py', 'WebmotorsSpider'),
+    'alura': ('main.py', 'AluraBot'),
+}
+
+# Trabalhos terminados mantidos na listagem do daemon
+HISTORICO = 100
+
+logger = logging.getLogger(__name__)
+
+
+def carregar_modulo(arquivo):
+    """Importa um módulo pelo caminho do arquivo (get-cars.py não é importável pelo nome)"""
+    if DIRETORIO not in sys.path:
+        sys.path.insert(0, DIRETORIO)
+    nome = os.path.splitext(arquivo)[0].replace('-', '_')
+    spec = importlib.util.spec_from_file_location(nome, os.path.join(DIRETORIO, arquivo))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+@lru_cache(maxsize=None)
+def classe_spider(nome):
+    """Classe do spider registrado, importada na primeira vez que for pedida"""
+    if nome not in SPIDERS:
+        raise KeyError(f"Spider desconhecido: {nome} (disponíveis: {', '.join(SPIDERS)})")
+    arquivo, classe = SPIDERS[nome]
+    return getattr(carregar_modulo(arquivo), classe)
+
+
+def spider_configurado(nome, settings=None):
+    """Subclasse do spider com ``settings`` por cima do custom_settings"""
+    spider_cls = classe_spider(nome)
+    custom_settings = dict(spider_cls.custom_settings or {})
+    custom_settings.update(settings or {})
+    return type(spider_cls.__name__, (spider_cls,), {'custom_settings': custom_settings})
+
+
+def pares(valores, parser, opcao):
+    resultado = {}
+    for valor in valores or []:
+        if '=' not in valor:
+            parser.error(f"{opcao} espera NOME=VALOR: {valor}")
+        chave, valor = valor.split('=', 1)
+        resultado[chave] = valor
+    return resultado
+
+
+def por_spider(valores, nomes):
+    """{CHAVE: v, 'spider:CHAVE': v} -> {spider: {CHAVE: v}}, com as chaves sem prefixo em todos"""
+    resultado = {nome: {} for nome in nomes}
+    especificos = []
+    for chave, valor in (valores or {}).items():
+        nome, separador, chave_spider = chave.partition(':')
+        if not separador:
+            for destino in resultado.values():
+                destino[chave] = valor
+        elif nome not in SPIDERS:
+            raise KeyError(f"Spider desconhecido em {chave!r}")
+        elif nome in resultado:
+            especificos.append((nome, chave_spider, valor))
+    # As específicas de um spider vencem as gerais, em qualquer ordem
+    for nome, chave, valor in especificos:
+        resultado[nome][chave] = valor
+    return resultado
+
+
+class Trabalho:
+    """Um pedido de crawl: um ou mais spiders rodando juntos"""
+
+    def __init__(self, id_, nomes):
+        self.id = id_
+        self.nomes = nomes
+        self.estado = 'rodando'
+        self.inicio = time.time()
+        self.fim = None
+        self.perfilado = False
+        self.crawlers = {}
+        self.resultados = {}
+
+    def resumo(self, nome, crawler):
+        # Sem stats quando o crawl falha antes de começar (no from_crawler do spider, por exemplo)
+        stats = crawler.stats.get_stats() if crawler.stats is not None else {}
+        return {
+            'motivo': stats.get('finish_reason'),
+            'requisicoes': stats.get('downloader/request_count', 0),
+            'itens': stats.get('item_scraped_count', 0),
+            'erros': stats.get('log_count/ERROR', 0),
+        }
+
+    def descrever(self):
+        spiders = dict(self.resultados)
+        for nome, crawler in self.crawlers.items():
+            spiders.setdefault(nome, self.resumo(nome, crawler))
+        return {'id': self.id, 'estado': self.estado, 'inicio': self.inicio, 'fim': self.fim, 'spiders': spiders}
+
+
+class Runner:
+    """CrawlerProcess com os spiders do registro; o mesmo reactor atende todos os trabalhos"""
+
+    def __init__(self, settings=None):
+        from scrapy.crawler import CrawlerProcess
+        # Settings gerais: configuram o processo (log, reactor) e valem para todos os trabalhos
+        self.settings = dict(settings or {})
+        self.processo = CrawlerProcess(self.settings)
+        self.ids = count(1)
+        self.trabalhos = {}
+
+    def rodando(self):
+        """Nomes dos spiders de trabalhos ainda em andamento"""
+        return {nome for trabalho in self.trabalhos.values() if trabalho.estado == 'rodando'
+                for nome in trabalho.nomes}
+
+    def agendar(self, nomes, settings=None, argumentos=None):
+        """Inicia os spiders ``nomes`` em paralelo e retorna o Trabalho"""
+        from twisted.internet import defer
+
+        nomes = list(dict.fromkeys(nomes))
+        if not nomes:
+            raise ValueError("Nenhum spider pedido")
+        for nome in nomes:
+            classe_spider(nome)
+        settings = por_spider(dict(self.settings, **(settings or {})), nomes)
+        argumentos = por_spider(argumentos, nomes)
+        perfilado = any(settings[nome].get('PROFILE_DIR') for nome in nomes)
+        self.checar_profiling(nomes, perfilado)
+
+        trabalho = Trabalho(next(self.ids), nomes)
+        trabalho.perfilado = perfilado
+        crawls = []
+        for nome in nomes:
+            crawler = self.processo.create_crawler(spider_configurado(nome, settings[nome]))
+            trabalho.crawlers[nome] = crawler
+            crawls.append(self.processo.crawl(crawler, **argumentos[nome]).addBoth(self._crawl_terminado, trabalho, nome))
+        self.trabalhos[trabalho.id] = trabalho
+        logger.info(f"Trabalho {trabalho.id} iniciado: {', '.join(nomes)}")
+        defer.DeferredList(crawls).addCallback(self._concluir, trabalho)
+        return trabalho
+
+    def checar_profiling(self, nomes, perfilado):
+        """ValueError se o profiling fosse dividir o processo com outro spider"""
+        if perfilado and len(nomes) > 1:
+            raise ValueError(f"PROFILE_DIR mede o processo inteiro: rode um spider por vez, não {', '.join(nomes)}")
+        rodando = [t for t in self.trabalhos.values() if t.estado == 'rodando']
+        if perfilado and rodando:
+            raise ValueError("PROFILE_DIR mede o processo inteiro: há outro trabalho rodando")
+        if any(t.perfilado for t in rodando):
+            raise ValueError("Um trabalho com PROFILE_DIR está rodando: aguarde ele terminar")
+
+    def _crawl_terminado(self, resultado, trabalho, nome):
+        # Só o resumo fica guardado: o crawler (stats, spider, engine) pode ser liberado
+        crawler = trabalho.crawlers.pop(nome)
+        trabalho.resultados[nome] = trabalho.resumo(nome, crawler)
+        if hasattr(resultado, 'getTraceback'):
+            logger.error(f"Spider {nome} do trabalho {trabalho.id} falhou: {resultado.getErrorMessage()}")
+            trabalho.resultados[nome]['motivo'] = 'falha'
+        return None
+
+    def _concluir(self, _, trabalho):
+        trabalho.estado = 'concluido'
+        trabalho.fim = time.time()
+        logger.info(f"Trabalho {trabalho.id} concluído em {trabalho.fim - trabalho.inicio:.1f}s: "
+                    f"{json.dumps(trabalho.resultados, ensure_ascii=False)}")
+        concluidos = [id_ for id_, t in self.trabalhos.items() if t.estado == 'concluido']
+        for id_ in concluidos[:-HISTORICO]:
+            del self.trabalhos[id_]
+
+    def iniciar(self, daemon=False):
+        """Roda o reactor; fora do modo daemon, para quando os trabalhos agendados terminam"""
+        self.processo.start(stop_after_crawl=not daemon)
+
+
+def recurso_daemon(runner):
+    """Recurso HTTP do daemon: GET lista os trabalhos, POST agenda um novo"""
+    from twisted.web import resource
+
+    class _RecursoDaemon(resource.Resource):
+        isLeaf = True
+
+        def responder(self, request, status, corpo):
+            request.setResponseCode(status)
+            request.setHeader(b'Content-Type', b'application/json; charset=utf-8')
+            return json.dumps(corpo, ensure_ascii=False).encode('utf-8')
+
+        def render_GET(self, request):
+            return self.responder(request, 200, [t.descrever() for t in runner.trabalhos.values()])
+
+        def render_POST(self, request):
+            try:
+                pedido = json.loads(request.content.read() or b'{}')
+                nomes = pedido.get('spiders') or []
+                ocupados = runner.rodando().intersection(nomes)
+                if ocupados:
+                    return self.responder(request, 409, {'erro': f"Spiders ainda rodando: {', '.join(sorted(ocupados))}"})
+                trabalho = runner.agendar(nomes, pedido.get('settings'), pedido.get('argumentos'))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                return self.responder(request, 400, {'erro': str(e.args[0]) if e.args else repr(e)})
+            return self.responder(request, 202, trabalho.descrever())
+
+    return _RecursoDaemon()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    comandos.add_parser('list')
+    for comando in ('run', 'daemon'):
+        sub = comandos.add_parser(comando)
+        if comando == 'run':
+            sub.add_argument('spiders', nargs='+', help=f"spiders: {', '.join(SPIDERS)}")
+            sub.add_argument('-a', dest='argumentos', action='append', help="argumento [spider:]NOME=VALOR")
+        else:
+            sub.add_argument('--porta', type=int, default=6802)
+            sub.add_argument('--host', default='127.0.0.1')
+        sub.add_argument('-s', dest='settings', action='append', help="setting do Scrapy [spider:]NOME=VALOR")
+
+    args = parser.parse_args()
+    if args.comando == 'list':
+        for nome, (arquivo, classe) in SPIDERS.items():
+            print(f"{nome:<16}{classe:<20}{arquivo}")
+        return
+
+    settings = pares(args.settings, parser, '-s')
+    runner = Runner({chave: valor for chave, valor in settings.items() if ':' not in chave})
+
+    if args.comando == 'run':
+        try:
+            runner.agendar(args.spiders, {chave: valor for chave, valor in settings.items() if ':' in chave},
+                           pares(args.argumentos, parser, '-a'))
+        except (KeyError, ValueError) as e:
+            parser.error(e.args[0])
+        runner.iniciar()
+        falhas = [nome for trabalho in runner.trabalhos.values()
+                  for nome, resultado in trabalho.resultados.items() if resultado['motivo'] == 'falha']
+        if falhas:
+            sys.exit(1)
+        return
+
+    from twisted.internet import reactor
+    from twisted.web import server
+    porta = reactor.listenTCP(args.porta, server.Site(recurso_daemon(runner)), interface=args.host)
+    logger.info(f"Daemon de crawls em http://{args.host}:{porta.getHost().port}/ "
+                f"(spiders: {', '.join(SPIDERS)})")
+    runner.iniciar(daemon=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+"""Pool de sessões (cookiejars) aquecidas, escolhidas pela saúde.
+
+O pool abre SESSION_POOL_TAMANHO sessões em paralelo logo que o spider abre:
+cada uma visita SESSION_POOL_URL_AQUECIMENTO (a página inicial) com o
+próprio cookiejar. As requisições com ``meta['sessao_pool']`` não escolhem
+cookiejar: cada uma vai para a sessão ociosa mais saudável, que fica ocupada
+até a resposta chegar, como um usuário que abre uma página de cada vez.
+
+Sem sessão ociosa, a requisição fica na fila do próprio pool (por
+prioridade), fora do scheduler e do downloader: ela não ocupa vaga de
+CONCURRENT_REQUESTS e não segura o fechamento do spider. Quem faz isso é o
+SessionPoolSpiderMiddleware, que retém as requisições que saem do spider; a
+requisição só entra no engine quando uma sessão é liberada para ela. Novas
+tentativas do RetryMiddleware continuam na mesma sessão (o downloader
+middleware fica depois dele, ver get-cars.py). Uma requisição que não chega a
+ser baixada (descartada pelo dupefilter do scheduler ou por um IgnoreRequest
+de outro middleware) devolve a sessão ao pool sem mudar a saúde dela.
+
+A saúde de cada sessão é uma média móvel (SESSION_POOL_SUAVIZACAO) das
+respostas: 1 para uma resposta rápida, menos para uma resposta mais lenta
+que SESSION_POOL_LATENCIA_ALVO e 0 para um bloqueio (status de
+SESSION_POOL_BLOCK_CODES ou página reconhecida por ``spider.eh_bloqueio``).
+Depois de SESSION_POOL_BLOQUEIOS bloqueios seguidos, ou com a saúde abaixo
+de SESSION_POOL_SAUDE_MIN, a sessão é aposentada e outra, com um cookiejar
+novo, é aquecida no lugar dela depois de SESSION_POOL_ESPERA segundos.
+Passados SESSION_POOL_MAX_AQUECIMENTOS aquecimentos sem nenhuma sessão viva,
+o site está bloqueando tudo: as requisições retidas são descartadas e o
+spider pode fechar.
+"""
+import heapq
+import logging
+from itertools import count
+
+import scrapy
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest, NotConfigured
+from twisted.internet import reactor
+
+logger = logging.getLogger(__name__)
+
+# Estados de uma sessão do pool
+AQUECENDO = 'aquecendo'
+OCIOSA = 'ociosa'
+OCUPADA = 'ocupada'
+
+
+class Sessao:
+    """Uma sessão do pool: o cookiejar e a saúde observada"""
+
+    def __init__(self, id_, cookiejar):
+        self.id = id_
+        self.cookiejar = cookiejar
+        self.estado = AQUECENDO
+        self.saude = 1.0
+        self.bloqueios_seguidos = 0
+        self.respostas = 0
+
+    def observar(self, valor, suavizacao):
+        self.saude = (1 - suavizacao) * self.saude + suavizacao * valor
+        self.respostas += 1
+
+
+def pool_configurado(settings):
+    return settings.getbool('SESSION_POOL_ENABLED', True) and bool(settings.get('SESSION_POOL_URL_AQUECIMENTO'))
+
+
+class PoolSessoes:
+    """Sessões e fila de requisições retidas, compartilhadas pelos dois middlewares de um crawler"""
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.tamanho = max(1, settings.getint('SESSION_POOL_TAMANHO', 3))
+        self.url_aquecimento = settings.get('SESSION_POOL_URL_AQUECIMENTO')
+        self.latencia_alvo = settings.getfloat('SESSION_POOL_LATENCIA_ALVO', 2.0)
+        self.suavizacao = settings.getfloat('SESSION_POOL_SUAVIZACAO', 0.3)
+        self.saude_min = settings.getfloat('SESSION_POOL_SAUDE_MIN', 0.4)
+        self.bloqueios_max = settings.getint('SESSION_POOL_BLOQUEIOS', 2)
+        self.espera = settings.getfloat('SESSION_POOL_ESPERA', 10)
+        self.max_aquecimentos = settings.getint('SESSION_POOL_MAX_AQUECIMENTOS', 5 * self.tamanho)
+        self.codigos_bloqueio = set(int(c) for c in settings.getlist('SESSION_POOL_BLOCK_CODES', [403, 429]))
+        self.sessoes = {}
+        # Ids das sessões e dos cookiejars: uma sessão nova sempre começa com cookies vazios
+        self.ids = count(1)
+        self.aquecimentos = 0
+        # Sessões aposentadas esperando o timer para serem substituídas
+        self.substituicoes = 0
+        # Requisições esperando uma sessão ociosa: (-prioridade, ordem de chegada, request)
+        self.fila = []
+        self.ordem = count()
+        self.timers = []
+        self.aberto = False
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(self.descartada, signal=signals.request_dropped)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def do_crawler(cls, crawler):
+        if getattr(crawler, 'pool_sessoes', None) is None:
+            crawler.pool_sessoes = cls(crawler)
+        return crawler.pool_sessoes
+
+    def spider_opened(self, spider):
+        self.aberto = True
+        logger.info(f"Aquecendo {self.tamanho} sessões em {self.url_aquecimento}")
+        for _ in range(self.tamanho):
+            self.aquecer()
+
+    def aquecer(self):
+        """Cria uma sessão com cookiejar novo e agenda a visita de aquecimento"""
+        if not self.aberto:
+            return
+        id_ = next(self.ids)
+        sessao = self.sessoes[id_] = Sessao(id_, id_)
+        self.aquecimentos += 1
+        self.stats.inc_value('session_pool/aquecimentos')
+        self.crawler.engine.crawl(scrapy.Request(
+            self.url_aquecimento,
+            callback=self.aquecida,
+            dont_filter=True,
+            priority=1000,
+            meta={'cookiejar': sessao.cookiejar, 'sessao_aquecimento': id_},
+        ))
+
+    def aquecida(self, response):
+        # Nada a extrair: os cookies já ficaram no cookiejar da sessão
+        return None
+
+    def pendentes(self):
+        """Requisições retidas e sessões aquecendo ou por substituir: o spider ainda não acabou"""
+        aquecendo = any(sessao.estado == AQUECENDO for sessao in self.sessoes.values())
+        return bool(self.fila) or aquecendo or self.substituicoes > 0
+
+    def reter(self, request):
+        """Entrega a requisição a uma sessão ociosa (retorna True) ou a guarda na fila do pool"""
+        sessao = self.mais_saudavel()
+        if sessao is not None:
+            self.ocupar(sessao, request)
+            return True
+        self.stats.inc_value('session_pool/esperas')
+        heapq.heappush(self.fila, (-request.priority, next(self.ordem), request))
+        return False
+
+    def mais_saudavel(self):
+        ociosas = [sessao for sessao in self.sessoes.values() if sessao.estado == OCIOSA]
+        return max(ociosas, key=lambda sessao: sessao.saude) if ociosas else None
+
+    def ocupar(self, sessao, request):
+        sessao.estado = OCUPADA
+        request.meta['sessao'] = sessao.id
+        request.meta['cookiejar'] = sessao.cookiejar
+
+    def liberar(self, sessao):
+        """Sessão ociosa de novo: manda para o engine a requisição retida de maior prioridade"""
+        sessao.estado = OCIOSA
+        if self.fila and self.aberto:
+            _, _, request = heapq.heappop(self.fila)
+            self.ocupar(sessao, request)
+            self.crawler.engine.crawl(request)
+
+    def bloqueada(self, response, spider):
+        if response.status in self.codigos_bloqueio:
+            return True
+        return hasattr(spider, 'eh_bloqueio') and spider.eh_bloqueio(response)
+
+    def resposta(self, request, response, spider):
+        aquecimento = request.meta.get('sessao_aquecimento')
+        if aquecimento is not None:
+            self.fim_aquecimento(aquecimento, not self.bloqueada(response, spider))
+            return
+        sessao = self.sessoes.get(request.meta.pop('sessao', None))
+        if sessao is None:
+            return
+        latencia = request.meta.get('download_latency')
+        if self.bloqueada(response, spider):
+            sessao.bloqueios_seguidos += 1
+            sessao.observar(0.0, self.suavizacao)
+            self.stats.inc_value('session_pool/bloqueios')
+        else:
+            sessao.bloqueios_seguidos = 0
+            lenta = latencia is not None and latencia > self.latencia_alvo
+            sessao.observar(self.latencia_alvo / latencia if lenta else 1.0, self.suavizacao)
+        self.devolver(sessao)
+
+    def excecao(self, request):
+        aquecimento = request.meta.get('sessao_aquecimento')
+        if aquecimento is not None:
+            self.fim_aquecimento(aquecimento, False)
+            return
+        sessao = self.sessoes.get(request.meta.pop('sessao', None))
+        if sessao is not None:
+            # Timeout ou conexão recusada: conta como resposta ruim, mas não como bloqueio
+            sessao.observar(0.0, self.suavizacao)
+            self.devolver(sessao)
+
+    def descartada(self, request, spider=None):
+        """Requisição que não vai ser baixada: a sessão dela volta a ficar ociosa"""
+        aquecimento = request.meta.get('sessao_aquecimento')
+        if aquecimento is not None:
+            self.fim_aquecimento(aquecimento, False)
+            return
+        sessao = self.sessoes.get(request.meta.pop('sessao', None))
+        if sessao is not None and sessao.estado == OCUPADA:
+            self.stats.inc_value('session_pool/descartes')
+            # Na próxima volta do reactor: a retida que ela pegar também pode ser descartada
+            # ainda dentro do engine.crawl, e liberar daqui empilharia uma chamada por descarte
+            reactor.callLater(0, self.liberar, sessao)
+
+    def fim_aquecimento(self, id_, ok):
+        sessao = self.sessoes.get(id_)
+        if sessao is None or sessao.estado != AQUECENDO:
+            return
+        if ok:
+            logger.info(f"Sessão {id_} aquecida")
+            self.liberar(sessao)
+        else:
+            logger.warning(f"Aquecimento da sessão {id_} falhou")
+            self.stats.inc_value('session_pool/aquecimentos_falhos')
+            self.aposentar(sessao)
+
+    def devolver(self, sessao):
+        """Depois da resposta: aposenta a sessão se estiver ruim, senão ela fica ociosa"""
+        if sessao.bloqueios_seguidos >= self.bloqueios_max or sessao.saude < self.saude_min:
+            logger.warning(f"Sessão {sessao.id} aposentada (saúde {sessao.saude:.2f}, "
+                           f"{sessao.bloqueios_seguidos} bloqueios seguidos, {sessao.respostas} respostas)")
+            self.aposentar(sessao)
+        else:
+            self.liberar(sessao)
+
+    def aposentar(self, sessao):
+        """Tira a sessão do pool e aquece outra no lugar depois de SESSION_POOL_ESPERA"""
+        del self.sessoes[sessao.id]
+        self.stats.inc_value('session_pool/aposentadas')
+        if self.aquecimentos >= self.max_aquecimentos:
+            if not self.sessoes:
+                self.descartar_fila(f"nenhuma sessão viva depois de {self.aquecimentos} aquecimentos")
+            return
+        self.substituicoes += 1
+        self.timers = [timer for timer in self.timers if timer.active()]
+        self.timers.append(reactor.callLater(self.espera, self.substituir))
+
+    def substituir(self):
+        self.substituicoes -= 1
+        self.aquecer()
+
+    def descartar_fila(self, motivo):
+        if self.fila:
+            logger.error(f"Pool de sessões: descartando {len(self.fila)} requisições retidas ({motivo})")
+            self.stats.inc_value('session_pool/descartadas', len(self.fila))
+        self.fila = []
+
+    def spider_idle(self, spider):
+        # Sem isso o spider fecharia com requisições retidas esperando uma sessão ser aquecida
+        if self.pendentes():
+            raise DontCloseSpider
+
+    def spider_closed(self, spider):
+        self.aberto = False
+        for timer in self.timers:
+            if timer.active():
+                timer.cancel()
+        self.fila = []
+
+
+class SessionPoolMiddleware:
+    """Downloader middleware: observa as respostas de cada sessão e a libera para a próxima requisição"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not pool_configurado(crawler.settings):
+            raise NotConfigured
+        return cls(PoolSessoes.do_crawler(crawler))
+
+    def process_request(self, request, spider):
+        if not request.meta.get('sessao_pool') or 'sessao' in request.meta:
+            return None
+        # Requisição do pool que não passou pelo spider middleware (agendada direto no engine)
+        if self.pool.reter(request):
+            return None
+        # Ficou na fila do pool, que a manda de novo para o engine quando uma sessão for liberada
+        self.pool.stats.inc_value('session_pool/reenfileiradas')
+        raise IgnoreRequest("Requisição retida pelo pool de sessões")
+
+    def process_response(self, request, response, spider):
+        self.pool.resposta(request, response, spider)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        if isinstance(exception, IgnoreRequest):
+            # Nem chegou ao site: não diz nada sobre a saúde da sessão
+            self.pool.descartada(request)
+        else:
+            self.pool.excecao(request)
+        return None
+
+
+class SessionPoolSpiderMiddleware:
+    """Spider middleware: retém no pool as requisições que ainda não têm sessão ociosa"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not pool_configurado(crawler.settings):
+            raise NotConfigured
+        return cls(PoolSessoes.do_crawler(crawler))
+
+    def filtrar(self, resultado):
+        for objeto in resultado:
+            if (isinstance(objeto, scrapy.Request) and objeto.meta.get('sessao_pool')
+                    and 'sessao' not in objeto.meta and not self.pool.reter(objeto)):
+                continue
+            yield objeto
+
+    def process_start_requests(self, start_requests, spider):
+        return self.filtrar(start_requests)
+
+    def process_spider_output(self, response, result, spider):
+        return self.filtrar(result)
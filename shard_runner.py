@@ -0,0 +1,201 @@
+"""Executa um spider dividido em vários processos que compartilham uma fronteira.
+
+Cada worker roda em ``<dir>/shard-N/`` (os arquivos que o spider grava no
+diretório atual ficam separados por shard) e exporta os itens em
+``itens.jsonl``. As requisições passam pela fronteira (ver frontier.py): o
+worker 0 gera as requisições iniciais e todos alugam trabalho da mesma fila.
+Se um worker morrer, as requisições alugadas por ele voltam para a fila quando
+o aluguel vence e são refeitas pelos outros.
+
+Uso:
+    python shard_runner.py run fipe --shards 4
+    python shard_runner.py run webmotors_fipe --shards 2 -s FRONTIER_LEASE_SECONDS=120
+    python shard_runner.py run fipe --shards 2 -s 'DOWNLOADER_MIDDLEWARES={"fipe_cache.FipeCacheMiddleware": null}'
+    python shard_runner.py worker fipe --shard-index 1 --redis redis://fila:6379/0   # outra máquina
+    python shard_runner.py merge --dir shards
+
+Em várias máquinas use ``--redis`` (ou um diretório compartilhado com
+``--fronteira``) e rode um ``worker`` por processo com índices diferentes.
+
+Limitações: o cache da FIPE e o índice de anúncios da Webmotors são por shard,
+então o modo ``-a modo=delta`` do spider ``webmotors`` não detecta removidos
+corretamente em execuções com shards.
+"""
+import os
+import sys
+import glob
+import json
+import shutil
+import logging
+import argparse
+import multiprocessing
+
+from runner import SPIDERS, classe_spider, pares
+
+logger = logging.getLogger(__name__)
+
+# Arquivos de resultado que o merge junta (mesmo nome em todos os shards)
+PADROES_RESULTADO = ('*.jsonl', '*.jsonl.gz', '*.jsonl.zst')
+
+# Settings que o worker completa com os middlewares da fronteira: precisam ser dicionários
+SETTINGS_DICT = ('SPIDER_MIDDLEWARES', 'DOWNLOADER_MIDDLEWARES')
+
+
+def settings_linha_comando(settings, parser):
+    """Valores ``-s`` em JSON (objetos e listas) viram dict/list; o resto fica como texto"""
+    resultado = {}
+    for chave, valor in settings.items():
+        if valor.lstrip().startswith(('{', '[')):
+            try:
+                valor = json.loads(valor)
+            except ValueError as e:
+                parser.error(f"-s {chave}: JSON inválido ({e})")
+        if chave in SETTINGS_DICT and not isinstance(valor, dict):
+            parser.error(f"-s {chave} espera um objeto JSON, ex.: {chave}='{{\"modulo.Classe\": 500}}'")
+        resultado[chave] = valor
+    return resultado
+
+
+def settings_shard(shard, fronteira, redis_url, extras):
+    """Configurações que transformam um spider comum em worker da fronteira"""
+    settings = {
+        'SCHEDULER': 'frontier.FrontierScheduler',
+        'FRONTIER_SHARD': shard,
+        'FRONTIER_PATH': fronteira,
+        'FRONTIER_URL': redis_url,
+        # Um arquivo JSONL por shard, juntado no final pelo merge
+        'FEEDS': {'itens.jsonl': {'format': 'jsonlines', 'encoding': 'utf-8'}},
+        'FEED_URI': None,
+        'FEED_FORMAT': None,
+    }
+    settings.update(extras)
+    return settings
+
+
+def executar_worker(nome, shard, fronteira, redis_url, argumentos, extras):
+    """Roda um worker no processo atual (o diretório atual já é o do shard)"""
+    spider_cls = classe_spider(nome)
+
+    from scrapy.crawler import CrawlerProcess
+
+    custom_settings = dict(spider_cls.custom_settings or {})
+    custom_settings.update(settings_shard(shard, fronteira, redis_url, extras))
+    # O middleware de confirmação tem que ser o mais próximo do engine: só confirma
+    # depois que todas as requisições filhas foram gravadas na fronteira
+    spider_middlewares = dict(custom_settings.get('SPIDER_MIDDLEWARES', {}))
+    spider_middlewares['frontier.FrontierSpiderMiddleware'] = 1
+    custom_settings['SPIDER_MIDDLEWARES'] = spider_middlewares
+    downloader_middlewares = dict(custom_settings.get('DOWNLOADER_MIDDLEWARES', {}))
+    downloader_middlewares['frontier.FrontierDownloaderMiddleware'] = 10
+    custom_settings['DOWNLOADER_MIDDLEWARES'] = downloader_middlewares
+
+    spider_shard = type(spider_cls.__name__, (spider_cls,), {'custom_settings': custom_settings})
+    processo = CrawlerProcess()
+    processo.crawl(spider_shard, **argumentos)
+    processo.start()
+
+
+def processo_worker(nome, shard, diretorio, fronteira, redis_url, argumentos, extras):
+    os.makedirs(diretorio, exist_ok=True)
+    os.chdir(diretorio)
+    executar_worker(nome, shard, fronteira, redis_url, argumentos, extras)
+
+
+def diretorio_shard(base, shard):
+    return os.path.join(base, f'shard-{shard}')
+
+
+def rodar(nome, shards, base, fronteira, redis_url, argumentos, extras):
+    """Sobe ``shards`` workers locais, espera todos terminarem e junta os resultados"""
+    os.makedirs(base, exist_ok=True)
+    contexto = multiprocessing.get_context('spawn')
+    processos = []
+    for shard in range(shards):
+        processo = contexto.Process(
+            target=processo_worker,
+            args=(nome, shard, diretorio_shard(base, shard), fronteira, redis_url, argumentos, extras),
+            name=f'shard-{shard}',
+        )
+        processo.start()
+        processos.append(processo)
+
+    falhas = 0
+    for processo in processos:
+        processo.join()
+        if processo.exitcode != 0:
+            # O trabalho alugado por ele volta para a fila e é feito pelos outros
+            logger.error(f"Worker {processo.name} terminou com código {processo.exitcode}")
+            falhas += 1
+
+    juntar(base)
+    return falhas
+
+
+def juntar(base, destino=None):
+    """Concatena os arquivos de resultado de mesmo nome de todos os shards em ``destino``"""
+    destino = destino or os.path.join(base, 'resultado')
+    os.makedirs(destino, exist_ok=True)
+    arquivos = {}
+    for diretorio in sorted(glob.glob(os.path.join(base, 'shard-*'))):
+        for padrao in PADROES_RESULTADO:
+            for caminho in sorted(glob.glob(os.path.join(diretorio, padrao))):
+                arquivos.setdefault(os.path.basename(caminho), []).append(caminho)
+
+    for nome, caminhos in arquivos.items():
+        # JSONL concatena direto; membros gzip e frames zstd concatenados também são válidos
+        with open(os.path.join(destino, nome), 'wb') as saida:
+            for caminho in caminhos:
+                with open(caminho, 'rb') as entrada:
+                    shutil.copyfileobj(entrada, saida)
+        logger.info(f"{nome}: {len(caminhos)} shards -> {destino}")
+    return arquivos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    for comando in ('run', 'worker'):
+        sub = comandos.add_parser(comando)
+        sub.add_argument('spider', help=f"spider: {', '.join(SPIDERS)}")
+        sub.add_argument('--dir', default='shards', help="diretório base dos shards")
+        sub.add_argument('--fronteira', help="arquivo sqlite da fronteira (padrão: <dir>/fronteira.sqlite)")
+        sub.add_argument('--redis', help="URL de um servidor compatível com Redis para a fronteira")
+        sub.add_argument('-a', dest='argumentos', action='append', help="argumento do spider NOME=VALOR")
+        sub.add_argument('-s', dest='settings', action='append', help="setting do Scrapy NOME=VALOR")
+        if comando == 'run':
+            sub.add_argument('--shards', type=int, default=os.cpu_count() or 1)
+        else:
+            sub.add_argument('--shard-index', type=int, required=True)
+
+    sub = comandos.add_parser('merge')
+    sub.add_argument('--dir', default='shards')
+    sub.add_argument('--destino')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    if args.comando == 'merge':
+        juntar(args.dir, args.destino)
+        return
+
+    if args.spider not in SPIDERS:
+        parser.error(f"spider desconhecido: {args.spider}")
+    argumentos = pares(args.argumentos, parser, '-a')
+    extras = settings_linha_comando(pares(args.settings, parser, '-s'), parser)
+    base = os.path.abspath(args.dir)
+    fronteira = os.path.abspath(args.fronteira or os.path.join(base, 'fronteira.sqlite'))
+
+    if args.comando == 'worker':
+        os.makedirs(base, exist_ok=True)
+        processo_worker(args.spider, args.shard_index, diretorio_shard(base, args.shard_index),
+                        fronteira, args.redis, argumentos, extras)
+        return
+
+    falhas = rodar(args.spider, args.shards, base, fronteira, args.redis, argumentos, extras)
+    if falhas:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
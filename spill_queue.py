@@ -0,0 +1,118 @@
+"""Fila do scheduler que transborda para o disco.
+
+O scheduler do Scrapy mantém em memória todas as requisições pendentes. Numa
+varredura larga (a árvore FIPE inteira, uma retomada com muitos nós
+pendentes) isso cresce com o catálogo. A SpillQueue é uma fila LIFO que
+guarda em memória só as SPILL_QUEUE_MEMORIA requisições mais recentes de cada
+prioridade; as mais antigas vão serializadas para um arquivo (LifoDiskQueue
+do queuelib) e voltam quando a parte em memória esvazia, na mesma ordem de
+pilha.
+
+Requisições que não serializam (callback que não é método do spider, meta
+com objetos) ficam em memória, separadas, e voltam na mesma posição da pilha.
+
+Uso: ``SCHEDULER_MEMORY_QUEUE = 'spill_queue.SpillQueue'``. O arquivo fica em
+SPILL_QUEUE_DIR (padrão: diretório temporário do sistema) e é apagado quando
+a parte em disco esvazia ou a fila é fechada.
+"""
+import os
+import uuid
+import pickle
+import logging
+import tempfile
+from collections import deque
+
+from queuelib import LifoDiskQueue
+from scrapy.utils.request import request_from_dict
+
+logger = logging.getLogger(__name__)
+
+
+class SpillQueue:
+    """Pilha de requisições com as mais recentes em memória e as antigas em disco"""
+
+    def __init__(self, crawler, limite=2000, diretorio=None):
+        self.crawler = crawler
+        self.limite = max(limite, 2)
+        self.diretorio = diretorio or tempfile.gettempdir()
+        self.memoria = deque()
+        # Aberto no primeiro transbordo e apagado quando esvazia
+        self.disco = None
+        # Não serializáveis tiradas do transbordo: (tamanho do disco quando saíram, requisição)
+        self.presas = []
+
+    @classmethod
+    def from_crawler(cls, crawler, key=None, *args, **kwargs):
+        settings = crawler.settings
+        return cls(crawler, settings.getint('SPILL_QUEUE_MEMORIA', 2000), settings.get('SPILL_QUEUE_DIR'))
+
+    def push(self, request):
+        self.memoria.append(request)
+        if len(self.memoria) > self.limite:
+            self.transbordar()
+
+    def transbordar(self):
+        """Leva a metade mais antiga da memória para o disco.
+
+        As requisições vão da mais antiga para a mais nova, então o topo da
+        pilha em disco continua logo abaixo da base da pilha em memória.
+        """
+        if self.disco is None:
+            os.makedirs(self.diretorio, exist_ok=True)
+            self.path = os.path.join(self.diretorio, f'spill-{uuid.uuid4().hex}.fila')
+            self.disco = LifoDiskQueue(self.path)
+        spider = self.crawler.spider
+        gravadas = 0
+        while len(self.memoria) > self.limite // 2:
+            request = self.memoria.popleft()
+            try:
+                dados = pickle.dumps(request.to_dict(spider=spider), protocol=pickle.HIGHEST_PROTOCOL)
+            except (ValueError, TypeError, AttributeError, pickle.PicklingError) as e:
+                # Callback ou meta que não serializa: sai do caminho uma vez só, marcada com a
+                # altura do disco, e volta quando o disco descer até ela
+                logger.debug(f"Requisição não serializável mantida em memória: {request} ({e})")
+                self.presas.append((len(self.disco), request))
+                self.crawler.stats.inc_value('spill_queue/nao_serializaveis')
+                continue
+            self.disco.push(dados)
+            gravadas += 1
+        self.crawler.stats.inc_value('spill_queue/gravadas', gravadas)
+
+    def pop(self):
+        if self.memoria:
+            return self.memoria.pop()
+        no_disco = len(self.disco) if self.disco is not None else 0
+        if self.presas and self.presas[-1][0] >= no_disco:
+            return self.presas.pop()[1]
+        if no_disco:
+            self.crawler.stats.inc_value('spill_queue/lidas')
+            request = request_from_dict(pickle.loads(self.disco.pop()), spider=self.crawler.spider)
+            if no_disco == 1:
+                self.fechar_disco()
+            return request
+        return None
+
+    def peek(self):
+        if self.memoria:
+            return self.memoria[-1]
+        if self.presas or (self.disco is not None and len(self.disco)):
+            # Traz o topo (do disco ou das presas) para a memória, sem mudar a ordem
+            self.memoria.append(self.pop())
+            return self.memoria[-1]
+        return None
+
+    def fechar_disco(self):
+        """Fecha e apaga o arquivo; o próximo transbordo abre outro"""
+        self.disco.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.disco = None
+
+    def close(self):
+        # Como as filas em memória do Scrapy, o que sobrar ao fechar é descartado
+        if self.disco is not None:
+            self.fechar_disco()
+        return []
+
+    def __len__(self):
+        return len(self.memoria) + len(self.presas) + (len(self.disco) if self.disco is not None else 0)
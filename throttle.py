@@ -0,0 +1,115 @@
+import random
+import logging
+from collections import deque
+
+from scrapy.exceptions import NotConfigured
+from twisted.internet import reactor
+from twisted.internet.task import deferLater
+
+logger = logging.getLogger(__name__)
+
+
+def chave_slot(downloader, request, spider):
+    """Chave do slot do downloader para a requisição (compatível com Scrapy antigo e novo)"""
+    if hasattr(downloader, 'get_slot_key'):
+        return downloader.get_slot_key(request)
+    return downloader._get_slot_key(request, spider)
+
+
+class HostThrottle:
+    """Estado do throttle de um host (slot do downloader)"""
+
+    def __init__(self, concorrencia, atraso):
+        self.concorrencia = concorrencia
+        self.atraso = atraso
+        self.latencia = None
+        self.respostas_ok = 0
+        # Janela com as últimas respostas: True quando foi bloqueio
+        self.janela = deque(maxlen=50)
+
+    def taxa_bloqueio(self):
+        if not self.janela:
+            return 0.0
+        return sum(self.janela) / len(self.janela)
+
+
+class AdaptiveThrottle:
+    """Downloader middleware que ajusta concorrência e atraso de cada host.
+
+    Usa aumento aditivo / redução multiplicativa: cada resposta saudável
+    aproxima o atraso da latência observada e, depois de uma sequência sem
+    bloqueios, libera mais uma requisição simultânea; um 403/429 corta a
+    concorrência pela metade e dobra o atraso na hora.
+
+    Também implementa ``meta['atraso_aleatorio'] = (min, max)``: a requisição
+    espera um tempo aleatório antes de ser baixada, sem travar o reactor.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.concorrencia_inicial = settings.getint('ADAPTIVE_THROTTLE_START_CONCURRENCY', 1)
+        self.concorrencia_max = settings.getint('ADAPTIVE_THROTTLE_MAX_CONCURRENCY', 4)
+        self.atraso_inicial = settings.getfloat('DOWNLOAD_DELAY', 1.0)
+        self.atraso_min = settings.getfloat('ADAPTIVE_THROTTLE_MIN_DELAY', 0.25)
+        self.atraso_max = settings.getfloat('ADAPTIVE_THROTTLE_MAX_DELAY', 60.0)
+        self.codigos_bloqueio = set(int(c) for c in settings.getlist('ADAPTIVE_THROTTLE_BLOCK_CODES', [403, 429]))
+        self.respostas_para_subir = settings.getint('ADAPTIVE_THROTTLE_INCREASE_AFTER', 10)
+        self.hosts = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('ADAPTIVE_THROTTLE_ENABLED', True):
+            raise NotConfigured
+        return cls(crawler)
+
+    def process_request(self, request, spider):
+        atraso = request.meta.get('atraso_aleatorio')
+        if atraso:
+            # Espera sem bloquear o reactor (substitui o time.sleep)
+            return deferLater(reactor, random.uniform(*atraso), lambda: None)
+        return None
+
+    def process_response(self, request, response, spider):
+        latencia = request.meta.get('download_latency')
+        if latencia is None:
+            # Resposta que não passou pelo downloader (cache, por exemplo)
+            return response
+
+        downloader = self.crawler.engine.downloader
+        chave = chave_slot(downloader, request, spider)
+        slot = downloader.slots.get(chave)
+        if slot is None:
+            return response
+
+        host = self.hosts.get(chave)
+        if host is None:
+            host = self.hosts[chave] = HostThrottle(self.concorrencia_inicial, self.atraso_inicial)
+
+        bloqueado = response.status in self.codigos_bloqueio
+        host.janela.append(bloqueado)
+
+        if bloqueado:
+            host.respostas_ok = 0
+            host.concorrencia = max(1, host.concorrencia // 2)
+            host.atraso = min(self.atraso_max, max(host.atraso * 2, self.atraso_inicial))
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                host.atraso = min(self.atraso_max, max(host.atraso, float(retry_after)))
+            logger.warning(f"Bloqueio em {chave} ({response.status}): concorrência {host.concorrencia}, atraso {host.atraso:.2f}s")
+        else:
+            host.latencia = latencia if host.latencia is None else 0.8 * host.latencia + 0.2 * latencia
+            # Aproxima o atraso da latência dividida entre as requisições simultâneas
+            alvo = host.latencia / host.concorrencia
+            host.atraso = min(self.atraso_max, max(self.atraso_min, (host.atraso + alvo) / 2))
+            host.respostas_ok += 1
+            if (host.respostas_ok >= self.respostas_para_subir
+                    and host.taxa_bloqueio() < 0.02
+                    and host.concorrencia < self.concorrencia_max):
+                host.concorrencia += 1
+                host.respostas_ok = 0
+                logger.info(f"Host {chave} saudável: concorrência {host.concorrencia}")
+
+        slot.concurrency = host.concorrencia
+        slot.delay = host.atraso
+        return response
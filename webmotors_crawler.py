@@ -1,44 +1,30 @@
+import os
+import time
 import scrapy
-import re
-import json
 import logging
 from urllib.parse import urljoin
 
-carros_para_buscar = json.loads("""
-    [
-  {"brand": "chevrolet", "model": "onix", "year": 2024, "type": "10-turbo-flex-premier-automatico", "state": "sp"},
-  {"brand": "chevrolet", "model": "onix", "year": 2022, "type": "10-turbo-flex-ltz-manual", "state": "mg"},
-  {"brand": "chevrolet", "model": "onix", "year": 2020, "type": "10-flex-ls-manual", "state": "rj"},
-  {"brand": "chevrolet", "model": "cruze", "year": 2021, "type": "16-turbo-flex-premier-automatico", "state": "sp"},
-  {"brand": "chevrolet", "model": "cruze", "year": 2019, "type": "16-flex-ltz-automatico", "state": "mg"},
-  {"brand": "chevrolet", "model": "tracker", "year": 2023, "type": "12-turbo-flex-premier-automatico", "state": "rj"},
-  {"brand": "volkswagen", "model": "gol", "year": 2021, "type": "10-flex-mpi-trendline-manual", "state": "sp"},
-  {"brand": "volkswagen", "model": "polo", "year": 2023, "type": "10-tsi-flex-highline-automatico", "state": "mg"},
-  {"brand": "volkswagen", "model": "virtus", "year": 2022, "type": "10-tsi-flex-comfortline-automatico", "state": "rj"},
-  {"brand": "volkswagen", "model": "t-cross", "year": 2024, "type": "10-tsi-flex-highline-automatico", "state": "sp"},
-  {"brand": "fiat", "model": "argo", "year": 2022, "type": "13-flex-drive-manual", "state": "mg"},
-  {"brand": "fiat", "model": "cronos", "year": 2021, "type": "18-flex-precision-automatico", "state": "rj"},
-  {"brand": "fiat", "model": "pulse", "year": 2023, "type": "10-turbo-flex-impetus-cvt", "state": "sp"},
-  {"brand": "fiat", "model": "strada", "year": 2024, "type": "14-flex-volcano-cvt", "state": "mg"},
-  {"brand": "toyota", "model": "corolla", "year": 2020, "type": "20-flex-altis-premium-automatico", "state": "rj"},
-  {"brand": "toyota", "model": "corolla", "year": 2018, "type": "18-flex-xei-automatico", "state": "sp"},
-  {"brand": "toyota", "model": "yaris", "year": 2022, "type": "15-flex-xls-automatico", "state": "mg"},
-  {"brand": "hyundai", "model": "hb20", "year": 2023, "type": "10-turbo-flex-platinum-automatico", "state": "rj"},
-  {"brand": "hyundai", "model": "creta", "year": 2024, "type": "20-flex-ultimate-automatico", "state": "sp"},
-  {"brand": "honda", "model": "civic", "year": 2019, "type": "20-flex-touring-automatico", "state": "mg"},
-  {"brand": "honda", "model": "fit", "year": 2021, "type": "15-flex-exl-automatico", "state": "rj"},
-  {"brand": "honda", "model": "hr-v", "year": 2023, "type": "20-flex-advance-automatico", "state": "sp"},
-  {"brand": "ford", "model": "ka", "year": 2020, "type": "10-flex-se-automatico", "state": "mg"},
-  {"brand": "ford", "model": "ecosport", "year": 2019, "type": "15-flex-freestyle-automatico", "state": "rj"},
-  {"brand": "ford", "model": "ranger", "year": 2024, "type": "32-diesel-limited-automatico", "state": "sp"},
-  {"brand": "renault", "model": "kwid", "year": 2022, "type": "10-flex-intense-manual", "state": "mg"},
-  {"brand": "renault", "model": "duster", "year": 2023, "type": "16-flex-iconic-automatico", "state": "rj"}
-]
-""")
+import json_codec
+from items import PrecoWebmotors
+from result_sink import ResultSink
+from page_scan import contem, encontrar_precos
+from debug_snapshots import SnapshotStore
+from config_source import configuracoes
+from extraction_schema import esquema, esquemas
+from page_cache import PageCache
+from metrics import ContadoresMixin
 
+# Configurações consultadas por padrão (uma por linha; ver config_source.py)
+CONFIGURACOES_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'carros_para_buscar.jsonl')
 
-class WebMotorsCrawler(scrapy.Spider):
+
+class WebMotorsCrawler(ContadoresMixin, scrapy.Spider):
     name = "webmotors_crawler"
+    # Contadores em webmotors/... (ver metrics.py)
+    PREFIXO_CONTADORES = 'webmotors'
+    
+    # Incrementar quando a lógica de parse_fipe_page mudar: invalida o cache de páginas
+    VERSAO_EXTRACAO = 1
     
     # URLs de base
     base_url = "https://www.webmotors.com.br/tabela-fipe/carros/"
@@ -46,32 +32,107 @@ class WebMotorsCrawler(scrapy.Spider):
     # Configurações para o crawler
     custom_settings = {
         'USER_AGENT': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'DOWNLOAD_DELAY': 1.5,  # Aumentado para evitar bloqueios
-        'CONCURRENT_REQUESTS': 1,  # Reduzido para evitar bloqueios
+        'DOWNLOAD_DELAY': 1.5,  # Atraso inicial, ajustado pelo AdaptiveThrottle
+        'CONCURRENT_REQUESTS': 8,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': 1,  # Começa com uma por host, o throttle aumenta se o site estiver saudável
+        'DOWNLOADER_MIDDLEWARES': {
+            'throttle.AdaptiveThrottle': 560,
+            # Circuit breaker por host e novas tentativas limitadas por orçamento (ver circuit_breaker.py)
+            'circuit_breaker.CircuitBreakerMiddleware': 570,
+            'scrapy.downloadermiddlewares.retry.RetryMiddleware': None,
+            'circuit_breaker.RetryBudgetMiddleware': 550,
+        },
+        'CIRCUIT_BREAKER_LIMITE': 3,  # Bloqueios seguidos que abrem o circuito do host
+        'CIRCUIT_BREAKER_BACKOFF': 30,  # Pausa da primeira abertura, dobrada a cada sonda bloqueada
+        'CIRCUIT_BREAKER_BACKOFF_MAX': 600,
+        'RETRY_BUDGET_RATIO': 0.1,  # Novas tentativas limitadas a 10% das requisições
+        'ADAPTIVE_THROTTLE_MAX_CONCURRENCY': 4,
+        'ADAPTIVE_THROTTLE_MIN_DELAY': 1.0,
         'RETRY_TIMES': 3,  # Número de tentativas em caso de falha
         'FEED_EXPORT_ENCODING': 'utf-8',
-        'LOG_LEVEL': 'INFO'
+        'FEED_EXPORTERS': json_codec.FEED_EXPORTERS,
+        'LOG_LEVEL': 'INFO',
+        # Compressão dos arquivos de backup: None, 'gzip' ou 'zstd'
+        'RESULTADOS_COMPRESSAO': None,
+        # Exportação colunar (Parquet/Arrow) com preços, km e anos tipados; None desliga (ver columnar_export.py)
+        'ITEM_PIPELINES': {'columnar_export.ColumnarExportPipeline': 800},
+        'COLUMNAR_EXPORT_DIR': None,
+        'COLUMNAR_EXPORT_FORMAT': 'parquet',
+        # Métricas ao vivo: endpoint Prometheus (None desliga) e arquivo periódico (ver metrics.py)
+        'EXTENSIONS': {'metrics.MetricsExtension': 500},
+        'SPIDER_MIDDLEWARES': {
+            'metrics.MetricsSpiderMiddleware': 990,
+            'profiling.ProfilingSpiderMiddleware': 995,
+        },
+        'METRICS_PORT': None,
+        'METRICS_FILE': 'metricas_webmotors.json',
+        'METRICS_INTERVAL': 30,
+        # Modo de profiling (CPU e alocações por callback): -s PROFILE_DIR=perfil (ver profiling.py)
+        'PROFILE_DIR': None,
+        # A cada quantas configurações agendadas o progresso é logado
+        'WEBMOTORS_PROGRESSO': 1000,
+        # Snapshots de debug: fração das páginas amostradas e espaço máximo em disco
+        'DEBUG_SNAPSHOT_DIR': 'debug_snapshots',
+        'DEBUG_SNAPSHOT_SAMPLE_RATE': 0.05,
+        'DEBUG_SNAPSHOT_QUOTA': 100 * 1024 * 1024,
+        # Item extraído de cada página pelo hash do conteúdo: páginas iguais às da última
+        # execução não são extraídas de novo; None desliga (ver page_cache.py)
+        'PAGE_CACHE_PATH': 'paginas_webmotors.sqlite',
+        'PAGE_CACHE_NORMALIZAR': True,  # Ignora scripts, estilos e comentários no hash
     }
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, configuracoes=CONFIGURACOES_PADRAO, *args, **kwargs):
         super(WebMotorsCrawler, self).__init__(*args, **kwargs)
-        self.processed_items = 0
-        self.sucesso = 0
-        self.falha = 0
-        # Lista para armazenar todos os resultados
-        self.resultados = []
+        # Arquivo JSONL/CSV (opcionalmente comprimido) ou qualquer iterável de configurações
+        # Ex: scrapy runspider webmotors_crawler.py -a configuracoes=todas.csv.gz
+        self.configuracoes = configuracoes
+        self.agendadas = 0
+    
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(WebMotorsCrawler, cls).from_crawler(crawler, *args, **kwargs)
+        # Backup gravado item a item (veículos e erros em arquivos separados)
+        compressao = crawler.settings.get('RESULTADOS_COMPRESSAO')
+        spider.resultados = ResultSink('todos_resultados_webmotors.jsonl', compressao)
+        spider.erros = ResultSink('erros_webmotors.jsonl', compressao)
+        # Cópias das páginas para debug, gravadas em segundo plano
+        spider.snapshots = SnapshotStore.from_settings(crawler.settings)
+        # Mudanças nos esquemas de extração também invalidam os itens guardados
+        versao = f"{cls.VERSAO_EXTRACAO}:{esquemas(crawler.settings.get('EXTRACTION_SCHEMAS_PATH')).assinatura}"
+        spider.paginas = PageCache.from_settings(crawler.settings, versao, crawler.stats)
+        return spider
+    
+    def url_configuracao(self, config):
+        """URL da página da tabela FIPE de uma configuração"""
+        url_path = f"{config['brand']}/{config['model']}/{config['year']}/{config['type']}/{config['state'].lower()}"
+        return urljoin(self.base_url, url_path)
     
     def start_requests(self):
-        """Gera as requisições iniciais para cada configuração de carro"""
-        self.logger.info(f"Iniciando crawler com {len(carros_para_buscar)} configurações de carros")
+        """Gera as requisições iniciais, lendo as configurações de carro uma a uma.
         
-        # Itera sobre todas as configurações de carros
-        for idx, config in enumerate(carros_para_buscar):
+        As configurações vêm de ``configuracoes(self.configuracoes)`` (arquivo ou
+        iterável, ver config_source.py), que já descarta e loga as inválidas: uma
+        configuração ruim não interrompe as seguintes. Uma exceção aqui dentro
+        encerraria todas as requisições iniciais do crawl.
+        
+        O engine esvazia o scheduler antes de puxar o próximo item deste gerador
+        e só puxa com vaga no downloader, então a fila nunca acumula mais que
+        algumas requisições, mesmo com milhões de configurações na origem.
+        """
+        intervalo = self.settings.getint('WEBMOTORS_PROGRESSO', 1000)
+        inicio = time.monotonic()
+        self.logger.info(f"Iniciando crawler com as configurações de {self.configuracoes}")
+        
+        for config in configuracoes(self.configuracoes):
             # Constrói a URL correta para a página da tabela FIPE
-            url_path = f"{config['brand']}/{config['model']}/{config['year']}/{config['type']}/{config['state'].lower()}"
-            full_url = urljoin(self.base_url, url_path)
+            full_url = self.url_configuracao(config)
             
-            self.logger.info(f"Agendando requisição {idx+1}/{len(carros_para_buscar)}: {full_url}")
+            self.agendadas += 1
+            self.logger.debug(f"Agendando requisição {self.agendadas}: {full_url}")
+            if self.agendadas % intervalo == 0:
+                taxa = self.agendadas / (time.monotonic() - inicio)
+                self.logger.info(f"Progresso: {self.agendadas} configurações agendadas ({taxa:.1f}/s), "
+                                 f"{self.contagem('extracao/sucesso')} com sucesso, {self.contagem('extracao/falha')} com falha")
             
             # Faz a requisição para a URL com a configuração como meta
             yield scrapy.Request(
@@ -79,100 +140,98 @@ class WebMotorsCrawler(scrapy.Spider):
                 callback=self.parse_fipe_page,
                 meta={'configuracao': config},
                 errback=self.handle_error,
-                priority=len(carros_para_buscar) - idx  # Prioridade decrescente para garantir ordem
             )
+        
+        self.logger.info(f"Todas as {self.agendadas} configurações foram agendadas")
     
     def parse_fipe_page(self, response):
         """Extrai informações da página da tabela FIPE"""
         configuracao = response.meta['configuracao']
-        self.processed_items += 1
+        self.contar('paginas/processadas')
         
         try:
-            self.logger.info(f"Processando página: {configuracao['brand']} {configuracao['model']} {configuracao['year']} - {configuracao['state']} ({self.processed_items}/{len(carros_para_buscar)})")
+            self.logger.info(f"Processando página: {configuracao['brand']} {configuracao['model']} {configuracao['year']} - {configuracao['state']} ({self.contagem('paginas/processadas')}/{self.agendadas})")
+            
+            # Página igual à da última extração: reemite o item guardado sem extrair de novo.
+            # A chave é a URL da configuração, não a final (redirecionamentos, proxies)
+            impressao = None
+            if self.paginas is not None and response.status == 200:
+                url_pagina = self.url_configuracao(configuracao)
+                impressao = self.paginas.impressao(response)
+                guardado = self.paginas.buscar(url_pagina, impressao)
+                if guardado is not None:
+                    veiculo = PrecoWebmotors(**guardado)
+                    self.contar('extracao/sucesso')
+                    self.logger.debug(f"Página inalterada, item reaproveitado: {response.url}")
+                    self.resultados.write(veiculo)
+                    yield veiculo
+                    return
             
             # Verificar se a página existe
-            if response.status == 404 or "página não encontrada" in response.text.lower():
+            if response.status == 404 or contem(response, "página não encontrada"):
                 self.logger.warning(f"Página não encontrada: {response.url}")
-                self.falha += 1
+                self.snapshots.capturar(response, motivo='página não encontrada', forcar=True)
+                self.contar('extracao/falha')
+                self.contar('extracao/falha/pagina_nao_encontrada')
                 erro = {
                     'error': "Página não encontrada",
                     'url': response.url,
                     'configuracao': configuracao
                 }
-                self.resultados.append(erro)
+                self.erros.write(erro)
                 yield erro
                 return
             
-            # Para debug - salva o HTML da página
-            if self.processed_items <= 1:  # Salva apenas a primeira página para análise
-                with open('debug_response.html', 'w', encoding='utf-8') as f:
-                    f.write(response.text)
-                self.logger.info(f"HTML da página salvo em debug_response.html")
-            
-            # Extrair marca e modelo das informações do veículo
-            # Método 1: Diretamente do título da página
-            title = response.css('title::text').get() or ""
+            # Para debug - salva uma amostra das páginas (em segundo plano)
+            self.snapshots.capturar(response)
             
-            # Método 2: Dos elementos de breadcrumb ou título visível
-            marca_element = response.css('.BreadCrumb__item a[href*="honda"]::text, .BreadCrumb__item span::text, h1::text').getall()
+            # Todos os campos da página de uma vez, pelo esquema compilado (esquemas_extracao.json):
+            # título, breadcrumb/h1, informações do resultado e preços
+            campos = esquema('webmotors_fipe_pagina', self.settings).extrair(response.selector.root)
             marca = configuracao['brand'].upper()  # Valor padrão
             modelo = configuracao['model'].upper()  # Valor padrão
             
             # Tenta extrair marca e modelo do breadcrumb ou título
-            for element in marca_element:
-                element = element.strip().upper()
+            for element in campos['marca_modelo']:
                 if configuracao['brand'].upper() in element:
                     marca = configuracao['brand'].upper()
                 if configuracao['model'].upper() in element:
                     modelo = configuracao['model'].upper()
             
             # Extração da versão (pode estar em vários elementos)
-            versao_elements = response.css('.Result__info::text, .HeaderVehicle__titleVehicle::text, .HeaderVehicle__subtitle::text').getall()
             versao = None
             
             # Tenta extrair das informações de resultado
-            resultado_info = response.css('.Result__info::text').get()
+            resultado_info = campos['resultado_info']
             if resultado_info:
-                resultado_info = resultado_info.strip()
                 # Extrai a versão da string com formato "VERSÃO - ANO - ESTADO"
-                parts = resultado_info.split(' - ')
-                if len(parts) > 0:
-                    versao = parts[0].strip()
+                versao = resultado_info.split(' - ')[0].strip()
             
             # Se não encontrou a versão, tenta outros métodos
             if not versao:
-                for element in versao_elements:
-                    element = element.strip()
+                for element in campos['versao_elementos']:
                     if len(element) > 5 and any(palavra in element.lower() for palavra in ['flex', 'gasolina', 'diesel', 'manual', 'automático', 'cvt']):
                         versao = element
+                        self.contar('extracao/fallback/versao_elementos')
                         break
             
             # Se ainda não encontrou a versão, usa o tipo da configuração como fallback
             if not versao:
                 versao = configuracao['type'].replace('-', ' ').upper()
+                self.contar('extracao/fallback/versao_configuracao')
             
-            # Extração dos preços usando seletores específicos
-            # Primeiro tenta encontrar os preços pelos seletores de classe
-            preco_elements = response.css('.Result__value::text, .Pricing__value::text, .CardPricing__price::text').getall()
-            preco_fipe = None
-            preco_webmotors = None
-            
-            # Se encontrou elementos de preço, extrai os valores
-            if preco_elements:
-                preco_elements = [p.strip() for p in preco_elements if p.strip()]
-                if len(preco_elements) >= 1:
-                    preco_fipe = preco_elements[0]
-                if len(preco_elements) >= 2:
-                    preco_webmotors = preco_elements[1]
+            # Extração dos preços pelos seletores de classe do esquema (já sem os vazios)
+            preco_elements = campos['precos']
+            preco_fipe = preco_elements[0] if len(preco_elements) >= 1 else None
+            preco_webmotors = preco_elements[1] if len(preco_elements) >= 2 else None
             
             # Se não encontrou pelos seletores, tenta extrair via regex
             if not preco_fipe or not preco_webmotors:
-                # Busca por padrões de preço no texto da página
-                content = response.text
-                price_pattern = r'R\$\s*([\d\.,]+)'
-                price_matches = re.findall(price_pattern, content)
+                # Busca por padrões de preço na página, parando nos dois primeiros
+                price_matches = encontrar_precos(response, 2)
                 
                 if price_matches:
+                    self.contar('extracao/fallback/preco_regex')
                     # Formata os preços encontrados
                     if len(price_matches) >= 1 and not preco_fipe:
                         preco_fipe = f"R$ {price_matches[0]}"
@@ -182,44 +241,50 @@ class WebMotorsCrawler(scrapy.Spider):
             # Verifica se encontrou pelo menos um preço
             if not preco_fipe and not preco_webmotors:
                 self.logger.warning(f"Não foi possível encontrar preços para: {configuracao['brand']} {configuracao['model']} {configuracao['year']}")
-                self.falha += 1
+                self.snapshots.capturar(response, motivo='preços não encontrados', forcar=True)
+                self.contar('extracao/falha')
+                self.contar('extracao/falha/precos_nao_encontrados')
                 erro = {
                     'error': "Preços não encontrados",
                     'url': response.url,
                     'configuracao': configuracao
                 }
-                self.resultados.append(erro)
+                self.erros.write(erro)
                 yield erro
                 return
             else:
-                self.sucesso += 1
+                self.contar('extracao/sucesso')
             
             # Constrói o objeto com os dados extraídos
-            veiculo = {
-                'marca': marca,
-                'modelo': modelo,
-                'versao': versao,
-                'ano': configuracao['year'],
-                'estado': configuracao['state'].upper(),
-                'preco_fipe': preco_fipe,
-                'preco_webmotors': preco_webmotors,
-                'url': response.url,
-                'dados_configuracao': configuracao
-            }
+            veiculo = PrecoWebmotors(
+                marca=marca,
+                modelo=modelo,
+                versao=versao,
+                ano=configuracao['year'],
+                estado=configuracao['state'].upper(),
+                tipo=configuracao['type'],
+                preco_fipe=preco_fipe,
+                preco_webmotors=preco_webmotors,
+                url=response.url,
+            )
             
-            self.logger.info(f"Extraído com sucesso ({self.sucesso}/{len(carros_para_buscar)}): {marca} {modelo} {configuracao['year']} - Preço FIPE: {preco_fipe}")
-            self.resultados.append(veiculo)
+            self.logger.info(f"Extraído com sucesso ({self.contagem('extracao/sucesso')}/{self.contagem('paginas/processadas')}): {marca} {modelo} {configuracao['year']} - Preço FIPE: {preco_fipe}")
+            if impressao is not None:
+                self.paginas.gravar(url_pagina, impressao, veiculo)
+            self.resultados.write(veiculo)
             yield veiculo
             
         except Exception as e:
             self.logger.error(f"Erro ao processar {response.url}: {str(e)}")
-            self.falha += 1
+            self.snapshots.capturar(response, motivo=str(e), forcar=True)
+            self.contar('extracao/falha')
+            self.contar('extracao/falha/excecao')
             erro = {
                 'error': str(e),
                 'url': response.url,
                 'configuracao': configuracao
             }
-            self.resultados.append(erro)
+            self.erros.write(erro)
             yield erro
     
     def handle_error(self, failure):
@@ -227,7 +292,8 @@ class WebMotorsCrawler(scrapy.Spider):
         # Extrai informações do erro
         request = failure.request
         configuracao = request.meta.get('configuracao', {})
-        self.falha += 1
+        self.contar('extracao/falha')
+        self.contar('extracao/falha/requisicao')
         
         self.logger.error(f"Falha na requisição: {request.url} - {failure.value}")
         
@@ -236,16 +302,20 @@ class WebMotorsCrawler(scrapy.Spider):
             'url': request.url,
             'configuracao': configuracao
         }
-        self.resultados.append(erro)
+        self.erros.write(erro)
         return erro
     
     def closed(self, reason):
         """Método executado quando o spider termina"""
         self.logger.info(f"Crawler finalizado. Razão: {reason}")
-        self.logger.info(f"Total de itens processados: {self.processed_items}")
-        self.logger.info(f"Sucesso: {self.sucesso}, Falha: {self.falha}")
+        self.logger.info(f"Total de itens processados: {self.contagem('paginas/processadas')}")
+        self.logger.info(f"Sucesso: {self.contagem('extracao/sucesso')}, Falha: {self.contagem('extracao/falha')}")
         
-        # Salva todos os resultados em um arquivo separado (backup)
-        with open('todos_resultados_webmotors.json', 'w', encoding='utf-8') as f:
-            json.dump(self.resultados, f, ensure_ascii=False, indent=2)
-        self.logger.info(f"Todos os resultados ({len(self.resultados)}) foram salvos em 'todos_resultados_webmotors.json'")
\ No newline at end of file
+        # Os resultados já foram gravados durante a execução, só finaliza os arquivos
+        self.resultados.close()
+        self.erros.close()
+        self.snapshots.close()
+        if self.paginas is not None:
+            self.paginas.close()
+            self.logger.info(f"Páginas inalteradas (itens reaproveitados): {self.crawler.stats.get_value('cache_paginas/reaproveitadas', 0)}")
+        self.logger.info(f"Resultados ({self.resultados.total}) salvos em '{self.resultados.path}', erros ({self.erros.total}) em '{self.erros.path}'")
\ No newline at end of file